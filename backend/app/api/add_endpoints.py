@@ -1,14 +1,138 @@
-from fastapi import APIRouter, HTTPException
-from ..models import AddRequest, StatusOk
-from ..logic.add import add_line
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+from ..models import AddRequest, StatusOk, AddBatchRequest, AddBatchResponse
+from ..logic.add import add_line, add_lines
+from ..logic.writebehind import write_behind
+from ..limiter import db_limiter
+from .. import config
 
 router = APIRouter()
 
 @router.post("/add", response_model=StatusOk)
-def add(req: AddRequest) -> StatusOk:
+async def add(req: AddRequest) -> StatusOk:
     try:
-        add_line(req.data_line)
+        if write_behind.running:
+            # ack appena la riga è nel log: il commit arriva col prossimo flush
+            await write_behind.submit(req.data_line)
+        else:
+            await db_limiter.run(add_line, req.data_line)
         return {"status": "ok"}
     except ValueError as e:
         # validation error/DB → 422
         raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/add/queue")
+def add_queue() -> Dict[str, Any]:
+    # profondità della coda write-behind e offset del log (scritto, fsync, applicato)
+    return write_behind.stats()
+
+# -------- batch --------------------------------------------------------------
+
+async def _iter_body_lines(request: Request) -> AsyncIterator[bytes]:
+    # legge il body in streaming, riga per riga, senza caricarlo tutto; la
+    # riga incompleta in fondo a un chunk resta a pezzi finché non arriva il \n
+    tail: List[bytes] = []
+    async for chunk in request.stream():
+        start = 0
+        end = chunk.find(b"\n")
+        while end >= 0:
+            tail.append(chunk[start:end])
+            yield b"".join(tail).rstrip(b"\r")
+            tail = []
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if start < len(chunk):
+            tail.append(chunk[start:])
+    if tail:
+        yield b"".join(tail).rstrip(b"\r")
+
+def _decode_line(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"line is not valid UTF-8 (byte {e.start})")
+
+def _ndjson_data_line(raw: str) -> str:
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        raise ValueError("invalid NDJSON line")
+    if isinstance(value, dict):
+        value = value.get("data_line")
+    if not isinstance(value, str):
+        raise ValueError("NDJSON line must be a string or an object with 'data_line'")
+    return value
+
+async def _iter_data_lines(request: Request) -> AsyncIterator[Union[str, ValueError]]:
+    """data_line del batch; l'errore al posto delle righe illeggibili
+    (UTF-8 o NDJSON non validi), che diventano errori di riga."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type in ("", "application/json"):
+        try:
+            payload = await request.json()
+            if isinstance(payload, list):
+                payload = {"data_lines": payload}
+            data_lines = AddBatchRequest.model_validate(payload).data_lines
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid JSON batch: {e}")
+        for data_line in data_lines:
+            yield data_line
+
+    elif content_type in ("application/x-ndjson", "application/ndjson"):
+        async for raw in _iter_body_lines(request):
+            if raw.strip():
+                try:
+                    yield _ndjson_data_line(_decode_line(raw))
+                except ValueError as e:
+                    yield e
+
+    elif content_type in ("text/csv", "text/plain"):
+        # una data_line (già separata da virgole) per riga
+        async for raw in _iter_body_lines(request):
+            if raw.strip():
+                try:
+                    yield _decode_line(raw)
+                except ValueError as e:
+                    yield e
+
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+async def _apply(chunk: List[Union[str, ValueError]], first_line: int) -> List[Dict[str, Any]]:
+    valid = [(n, line) for n, line in enumerate(chunk, start=first_line) if isinstance(line, str)]
+    results = {n: {"line": n, "status": "error", "error": str(line)}
+               for n, line in enumerate(chunk, start=first_line) if not isinstance(line, str)}
+    if valid:
+        # add_lines numera in modo consecutivo: si rimappa sui numeri originali
+        applied = await db_limiter.run(add_lines, [line for _, line in valid], 0)
+        for (n, _), item in zip(valid, applied):
+            results[n] = dict(item, line=n)
+    return [results[n] for n in sorted(results)]
+
+@router.post("/add_batch", response_model=AddBatchResponse)
+async def add_batch(
+    request: Request,
+    chunk_size: Optional[int] = Query(
+        None, ge=0, description="Lines per transaction (0 = whole batch in one transaction)"
+    ),
+) -> AddBatchResponse:
+    if chunk_size is None:
+        chunk_size = config.ADD_BATCH_CHUNK_SIZE
+
+    results: List[Dict[str, Any]] = []
+    chunk: List[Union[str, ValueError]] = []
+    async for data_line in _iter_data_lines(request):
+        chunk.append(data_line)
+        if chunk_size and len(chunk) >= chunk_size:
+            results.extend(await _apply(chunk, len(results) + 1))
+            chunk = []
+    if chunk:
+        results.extend(await _apply(chunk, len(results) + 1))
+
+    applied = sum(1 for r in results if r["status"] == "ok")
+    failed = len(results) - applied
+    status = "ok" if not failed else ("partial" if applied else "error")
+    return {"status": status, "applied": applied, "failed": failed, "results": results}
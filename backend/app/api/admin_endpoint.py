@@ -1,37 +1,199 @@
-from fastapi import APIRouter, HTTPException, Body
-from ..db import get_admin_connection
+import hmac
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Body, Query
+from .. import db
+from ..db import get_admin_connection, run_script
+from .. import config
+from ..logic import advisor, catalog
+from ..logic.add import clear_id_cache
+from ..logic.jobs import script_jobs
+from ..logic.workload import statement_stats
+from ..logic.cache import result_cache, table_versions
+from ..logic.schema import schema_cache, script_has_ddl
+from ..logic.textsearch import RebuildInProgress, text_indexes
+from ..limiter import db_limiter
 
-router = APIRouter()
+def require_admin_token(authorization: Optional[str] = Header(None)) -> None:
+    # senza token configurato nessuno passa: l'API admin esegue SQL come root
+    scheme, _, token = (authorization or "").partition(" ")
+    if (not config.ADMIN_API_TOKEN or scheme.lower() != "bearer"
+            or not hmac.compare_digest(token.strip().encode("utf-8"), config.ADMIN_API_TOKEN.encode("utf-8"))):
+        raise HTTPException(status_code=401, detail="Admin token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+router = APIRouter(dependencies=[Depends(require_admin_token)])
 
 @router.post("/admin/execute_script")
 def execute_script(sql_script: str = Body(..., embed=True)):
     conn = None
     try:
         conn = get_admin_connection()
-        cur = conn.cursor()
         # Esegue l'intero script. NOTA: è potente ma rischioso!
         # L'utente può scrivere "DROP DATABASE..."!
-        cur.execute(sql_script, multi_statement=True)
+        run_script(conn, sql_script)
         return {"status": "ok", "message": "Script eseguito."}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
         if conn: conn.close()
+        # lo script può aver scritto su qualsiasi tabella (anche se è fallito a metà)
+        table_versions.bump_all()
+        clear_id_cache()
+        if script_has_ddl(sql_script):
+            schema_cache.invalidate()
+
+
+# -------- script in background -----------------------------------------------
+
+@router.post("/admin/jobs", status_code=202)
+def submit_script_job(
+    sql_script: str = Body(..., embed=True),
+    timeout: float = Body(config.ADMIN_JOB_TIMEOUT, ge=0, embed=True, description="Seconds before the job is killed (0 = none)"),
+):
+    try:
+        job = script_jobs.submit(sql_script, timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return job.to_dict(statements=False)
+
+
+@router.get("/admin/jobs")
+def list_script_jobs():
+    return {"jobs": [job.to_dict(statements=False) for job in script_jobs.list()]}
+
+
+@router.get("/admin/jobs/{job_id}")
+def get_script_job(job_id: str):
+    job = script_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job.to_dict()
+
+
+@router.post("/admin/jobs/{job_id}/cancel")
+def cancel_script_job(job_id: str):
+    job = script_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job.to_dict(statements=False)
 
 
 @router.get("/admin/list_databases")
 def list_databases():
-    conn = None
     try:
-        conn = get_admin_connection()
-        cur = conn.cursor()
-        cur.execute("SHOW DATABASES")
-        dbs = [row[0] for row in cur.fetchall()]
-        # Filtra i database di sistema
-        excluded_dbs = ["information_schema", "mysql", "performance_schema", "sys"]
-        user_dbs = [db for db in dbs if db not in excluded_dbs]
-        return {"databases": user_dbs}
+        return {"databases": db.list_databases()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# -------- cache di /sql_search ------------------------------------------------
+
+@router.post("/admin/sql_cache/clear")
+def clear_sql_cache():
+    result_cache.clear()
+    return {"status": "ok"}
+
+# -------- indice di /search_text ---------------------------------------------
+
+@router.post("/admin/search_text/rebuild")
+async def rebuild_text_index(database_name: str = Body(config.DB_NAME, embed=True)):
+    try:
+        index = await db_limiter.run(text_indexes.rebuild, database_name)
+    except RebuildInProgress:
+        raise HTTPException(status_code=409, detail="Text index rebuild already in progress")
+    except db.Error as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return index.stats()
+
+# -------- film_catalog -------------------------------------------------------
+
+@router.post("/admin/film_catalog/rebuild")
+def rebuild_film_catalog(database_name: str = Body(config.DB_NAME, embed=True)):
+    try:
+        rows = catalog.rebuild(database_name)
+    except db.Error as e:
+        raise HTTPException(status_code=400, detail=str(e))
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        table_versions.bump(database_name, ("film_catalog",))
+        clear_id_cache()
+        schema_cache.invalidate(database_name)
+    return {"status": "ok", "database_name": database_name, "rows": rows}
+
+
+@router.get("/admin/film_catalog/check")
+def check_film_catalog(database_name: str = Query(config.DB_NAME)):
+    try:
+        return catalog.check(database_name)
+    except db.Error as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# -------- statistiche per fingerprint ----------------------------------------
+
+@router.get("/admin/workload/top")
+def workload_top(
+    n: int = Query(20, ge=1, le=1000),
+    order_by: Literal["total_ms", "calls", "mean_ms", "p99_ms", "max_ms", "rows", "errors"] = Query("total_ms"),
+    database_name: Optional[str] = Query(None),
+):
+    return dict(statement_stats.summary(), statements=statement_stats.top(n, order_by, database_name))
+
+
+@router.post("/admin/workload/reset")
+def workload_reset():
+    statement_stats.reset()
+    return {"status": "ok"}
+
+
+@router.post("/admin/workload/snapshot")
+def workload_snapshot():
+    try:
+        path = statement_stats.snapshot(config.WORKLOAD_SNAPSHOT_DIR)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "ok", "path": path}
+
+# -------- advisor degli indici -----------------------------------------------
+
+def _require_mariadb() -> None:
+    # l'advisor legge i piani di EXPLAIN FORMAT=JSON
+    if db.engine.name != "mariadb":
+        raise HTTPException(status_code=501, detail=f"Index advice is not available with DB_ENGINE={db.engine.name}")
+
+
+@router.get("/admin/index_advice")
+def index_advice(database_name: str = Query(config.DB_NAME)):
+    _require_mariadb()
+    try:
+        suggestions = advisor.advise(database_name)
+    except db.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "database_name": database_name,
+        "queries_seen": len(advisor.query_log.queries(database_name)),
+        "suggestions": suggestions,
+    }
+
+
+@router.post("/admin/index_advice/apply")
+def apply_index_advice(
+    database_name: str = Body(config.DB_NAME),
+    ddl: Optional[List[str]] = Body(None, description="DDL of the suggestions to apply (default: all)"),
+    runs: int = Body(config.ADVISOR_BENCH_RUNS, ge=1),
+):
+    _require_mariadb()
+    try:
+        # si applicano solo indici proposti dall'advisor, mai DDL arbitrario
+        suggestions = advisor.advise(database_name)
+        if ddl is not None:
+            unknown = set(ddl) - {s["ddl"] for s in suggestions}
+            if unknown:
+                raise HTTPException(status_code=404, detail=f"Not a current suggestion: {sorted(unknown)}")
+            suggestions = [s for s in suggestions if s["ddl"] in ddl]
+        return {"database_name": database_name, "applied": advisor.apply(database_name, suggestions, runs)}
+    except db.Error as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/admin/index_advice/reset")
+def reset_index_advice():
+    advisor.query_log.clear()
+    return {"status": "ok"}
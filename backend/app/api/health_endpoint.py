@@ -1,10 +1,28 @@
+from typing import Any, Dict, List
 from fastapi import APIRouter
-from ..models import Health
+from ..models import Health, PoolStats
 from ..logic.health import ping_db
+from ..db import pool_stats, replica_stats
+from ..limiter import db_limiter
 
 router = APIRouter()
 
 @router.get("/db_health", response_model=Health)
-def db_health() -> Health:
-    ok = ping_db()
+async def db_health() -> Health:
+    ok = await db_limiter.run(ping_db)
     return {"status": "ok" if ok else "down"}
+
+@router.get("/db_pool_stats", response_model=List[PoolStats])
+def db_pool_stats() -> List[PoolStats]:
+    return pool_stats()
+
+@router.get("/db_replicas")
+def db_replicas() -> Dict[str, Any]:
+    # stato delle repliche di lettura (ritardo, latenza, errori)
+    stats = replica_stats()
+    return stats if stats is not None else {"policy": None, "replicas": []}
+
+@router.get("/db_load")
+def db_load() -> Dict[str, Any]:
+    # richieste in corso/in coda verso il DB e quante ne sono state rifiutate
+    return db_limiter.stats()
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import metrics
+from ..db import pool_stats, replica_stats
+from ..limiter import db_limiter
+from ..logic.cache import result_cache
+
+router = APIRouter()
+
+# stato corrente di pool, limiter e cache, letto a ogni scrape
+metrics.register_gauge(
+    "sqlbench_pool_connections", "Pooled DB connections by state.",
+    lambda: [({"database": p["database_name"], "server": p["server"], "state": state}, p[state])
+             for p in pool_stats() for state in ("in_use", "idle", "waiters")])
+metrics.register_gauge(
+    "sqlbench_replica_lag_seconds", "Replication lag of each read replica (-1 = not replicating).",
+    lambda: [({"server": r["server"], "healthy": str(r["healthy"]).lower()},
+              r["lag_seconds"] if r["lag_seconds"] is not None else -1)
+             for r in (replica_stats() or {"replicas": []})["replicas"]])
+metrics.register_gauge(
+    "sqlbench_db_requests", "Requests holding or waiting for a DB slot.",
+    lambda: [({"state": "in_flight"}, db_limiter.in_flight),
+             ({"state": "waiting"}, db_limiter.stats()["waiting"])])
+metrics.register_gauge(
+    "sqlbench_sql_cache_entries", "Entries in the /sql_search result cache.",
+    lambda: [({}, result_cache.stats()["entries"])])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,11 +1,27 @@
-from typing import List
-from fastapi import APIRouter
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Header, Query, Response
 from ..models import SchemaRow
-from ..logic.schema import get_schema_rows
+from ..logic.schema import schema_cache
+from ..limiter import db_limiter
+from .. import config
 
 router = APIRouter()
 
 @router.get("/schema_summary", response_model=List[SchemaRow])
-def schema_summary() -> List[SchemaRow]:
-    rows = get_schema_rows()
+async def schema_summary(
+    response: Response,
+    database_name: str = Query(config.DB_NAME),
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    # in cache e recente: nessun passaggio dall'executor del DB
+    cached = schema_cache.cached(database_name)
+    rows, etag = cached if cached is not None else await db_limiter.run(schema_cache.summary, database_name)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return [SchemaRow(table_name=t, table_column=c) for t, c in rows]
+
+@router.get("/schema_cache/stats")
+def schema_cache_stats() -> Dict[str, Any]:
+    return schema_cache.stats()
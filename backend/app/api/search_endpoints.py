@@ -1,12 +1,128 @@
-from fastapi import APIRouter
-from app.models import SqlRequest
-from ..logic.search import sqlsearch
-from typing import Any
+import asyncio
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from app.models import (SqlRequest, SqlResponse, SqlColumnarResponse, SqlBenchmarkRequest, SqlBenchmarkResponse,
+                        TextSearchResponse)
+from ..logic.search import sqlsearch, sqlsearch_columnar, sqlsearch_stream
+from ..logic import formats
+from ..logic.benchmark import sqlbenchmark
+from ..logic.cache import result_cache
+from ..logic.textsearch import text_indexes
+from ..db import Error
+from .. import config
+from ..limiter import Overloaded, db_limiter
+from .. import metrics
+from typing import Any, Dict, List, Literal, Optional, Union
 
 router = APIRouter()
 
-@router.post("/sql_search")
-def sql_search(request: SqlRequest) -> Any: 
-    return sqlsearch(request)
+NDJSON = "application/x-ndjson"
 
 
+class _SlotStreamingResponse(StreamingResponse):
+    """Chiude lo stream del limiter (e ne rilascia lo slot) comunque vada la
+    risposta: finita, interrotta dal client o mai partita per un errore."""
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+# response_format=columnar risponde con SqlColumnarResponse
+@router.post("/sql_search", response_model=Union[SqlResponse, SqlColumnarResponse])
+async def sql_search(request: SqlRequest, accept: Optional[str] = Header(None)) -> Any:
+    accept = accept or ""
+    # Accept: application/x-ndjson → risultati in streaming, riga per riga.
+    # Lo slot si prende prima di rispondere (così l'eventuale 503 arriva come
+    # tale) e si libera a fine stream
+    if NDJSON in accept:
+        await db_limiter.acquire()
+        return _SlotStreamingResponse(db_limiter.iterate(sqlsearch_stream(request)), media_type=NDJSON)
+
+    # formati binari (sempre colonnari), scelti tramite Accept
+    if formats.MSGPACK in accept or formats.ARROW in accept:
+        payload = await db_limiter.run(sqlsearch_columnar, request)
+        headers = {"X-SQL-Validation": payload["sql_validation"]}
+        if payload["next_cursor"]:
+            headers["X-Next-Cursor"] = payload["next_cursor"]
+        try:
+            with metrics.phase("serialize"):
+                if formats.MSGPACK in accept:
+                    body, media_type = formats.to_msgpack(payload), formats.MSGPACK
+                else:
+                    metadata = {"sql_validation": payload["sql_validation"],
+                                "next_cursor": payload["next_cursor"] or ""}
+                    body = formats.to_arrow(payload["columns"] or [], payload["rows"], metadata)
+                    media_type = formats.ARROW
+        except formats.FormatUnavailable as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    if request.response_format == "columnar":
+        payload = await db_limiter.run(sqlsearch_columnar, request)
+        with metrics.phase("serialize"):
+            body = formats.to_json(payload)
+        return Response(content=body, media_type=formats.JSON)
+    response = await db_limiter.run(sqlsearch, request)
+    # serializzazione esplicita (invece di lasciarla a FastAPI) per misurarla
+    with metrics.phase("serialize"):
+        body = response.model_dump_json()
+    return Response(content=body, media_type=formats.JSON)
+
+@router.post("/sql_benchmark", response_model=SqlBenchmarkResponse)
+async def sql_benchmark(request: SqlBenchmarkRequest) -> SqlBenchmarkResponse:
+    try:
+        return await db_limiter.run(sqlbenchmark, request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/search_text", response_model=TextSearchResponse)
+async def search_text(
+    q: str = Query(..., min_length=1, description="Words of a title or director name"),
+    mode: Literal["fuzzy", "prefix"] = Query("fuzzy", description="fuzzy (ranked, typo tolerant) | prefix (autocomplete)"),
+    type: Optional[Literal["film", "regista"]] = Query(None, description="Only films or only directors"),
+    limit: int = Query(10, ge=1),
+    min_similarity: float = Query(config.TEXT_SEARCH_MIN_SIMILARITY, gt=0, le=1),
+    database_name: str = Query(config.DB_NAME),
+) -> Any:
+    if limit > config.TEXT_SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be <= {config.TEXT_SEARCH_MAX_LIMIT}")
+    index = text_indexes.get(database_name)
+    if index is not None and database_name not in _refreshing and text_indexes.stale(database_name):
+        # indice scaduto: si risponde con quello vecchio e lo si ricostruisce dopo
+        _refreshing[database_name] = asyncio.ensure_future(_refresh_text_index(database_name))
+    if index is None:
+        # prima ricerca sul database: l'indice si costruisce leggendo dal DB
+        try:
+            index = await db_limiter.run(text_indexes.load, database_name)
+        except Error as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # il resto è in memoria (niente slot del DB) ma è CPU: fuori dal loop
+    loop = asyncio.get_running_loop()
+    if mode == "prefix":
+        results = await loop.run_in_executor(None, index.prefix, q, type, limit)
+    else:
+        results = await loop.run_in_executor(None, index.fuzzy, q, type, limit, min_similarity)
+    return {"query": q, "mode": mode, "results": results}
+
+# ricostruzioni in background in attesa o in corso, per database
+_refreshing: Dict[str, "asyncio.Future[None]"] = {}
+
+async def _refresh_text_index(database_name: str) -> None:
+    try:
+        # uno slot del DB come le altre letture: a DB saturo si rinuncia
+        await db_limiter.run(text_indexes.refresh, database_name)
+    except Overloaded:
+        pass
+    finally:
+        _refreshing.pop(database_name, None)
+
+@router.get("/search_text/stats")
+def search_text_stats() -> List[Any]:
+    return text_indexes.stats()
+
+@router.get("/sql_cache/stats")
+def sql_cache_stats() -> Any:
+    return result_cache.stats()
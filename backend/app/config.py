@@ -11,4 +11,120 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "moviespwd")
 DB_NAME = os.getenv("DB_NAME", "moviesdb")
 DB_ROOT_PASSWORD = os.getenv("MARIADB_ROOT_PASSWORD", "rootpwd")
 
+# Motore del database: "mariadb" oppure "sqlite" (embedded, un file per
+# database in SQLITE_DIR; lo schema di DB_NAME viene creato all'avvio)
+DB_ENGINE = os.getenv("DB_ENGINE", "mariadb").lower()
+SQLITE_DIR = os.getenv("SQLITE_DIR", os.path.join(os.getcwd(), "sqlite_data"))
+
+# Repliche in sola lettura ("host:porta,host:porta", vuoto = nessuna): ci
+# vanno /sql_search e lo schema, le scritture restano sul primario. Una replica
+# in ritardo di più di DB_REPLICA_MAX_LAG secondi esce dalla rotazione; senza
+# repliche sane si legge dal primario. Il controllo usa un utente che può
+# eseguire SHOW SLAVE STATUS (di default root)
+DB_REPLICAS = [r.strip() for r in os.getenv("DB_REPLICAS", "").split(",") if r.strip()]
+DB_REPLICA_POLICY = os.getenv("DB_REPLICA_POLICY", "round_robin")   # round_robin | least_latency
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2"))
+DB_REPLICA_MONITOR_USER = os.getenv("DB_REPLICA_MONITOR_USER", "root")
+DB_REPLICA_MONITOR_PASSWORD = os.getenv("DB_REPLICA_MONITOR_PASSWORD", DB_ROOT_PASSWORD)
+
 APP_PORT = int(os.getenv("APP_PORT", "8003"))
+
+# Endpoint /admin/* (script SQL come root, job, advisor...): montati solo con
+# ADMIN_API_ENABLED=1 e richiedono l'header "Authorization: Bearer <ADMIN_API_TOKEN>"
+ADMIN_API_ENABLED = os.getenv("ADMIN_API_ENABLED", "0").lower() in ("1", "true", "yes")
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+# Pool di connessioni (uno per database_name)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))              # attesa max per una connessione (s)
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))    # chiusura pool inutilizzati (s)
+DB_POOL_VALIDATE_AFTER = float(os.getenv("DB_POOL_VALIDATE_AFTER", "30")) # ping se ferma da più di (s)
+DB_POOL_SWEEP_INTERVAL = float(os.getenv("DB_POOL_SWEEP_INTERVAL", "60"))
+
+# /add_batch: righe per transazione (0 = tutto il batch in una transazione)
+ADD_BATCH_CHUNK_SIZE = int(os.getenv("ADD_BATCH_CHUNK_SIZE", "500"))
+
+# Cache di processo degli id delle piattaforme usata da add_line
+ADD_ID_CACHE_SIZE = int(os.getenv("ADD_ID_CACHE_SIZE", "100000"))
+
+# Tabella denormalizzata film_catalog aggiornata da add_line e dal seed bulk
+# (crearla/allinearla prima con: python -m app.logic.catalog rebuild)
+FILM_CATALOG = os.getenv("FILM_CATALOG", "0").lower() in ("1", "true", "yes")
+
+# /add in write-behind: la riga validata finisce in un log append-only e la
+# risposta è immediata; un worker la applica in transazioni di gruppo
+ADD_WRITE_BEHIND = os.getenv("ADD_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+ADD_LOG_PATH = os.getenv("ADD_LOG_PATH", os.path.join(os.getcwd(), "add_queue.log"))
+ADD_REJECTED_PATH = os.getenv("ADD_REJECTED_PATH", os.path.join(os.getcwd(), "add_rejected.log"))  # righe rifiutate dal DB dopo l'ack
+ADD_LOG_FSYNC = os.getenv("ADD_LOG_FSYNC", "1").lower() in ("1", "true", "yes")  # fsync prima della risposta
+ADD_FLUSH_SIZE = int(os.getenv("ADD_FLUSH_SIZE", "500"))           # righe per transazione
+ADD_FLUSH_INTERVAL = float(os.getenv("ADD_FLUSH_INTERVAL", "0.05"))  # attesa max prima del commit (s)
+ADD_QUEUE_MAX = int(os.getenv("ADD_QUEUE_MAX", "100000"))          # righe in coda oltre cui 503
+
+# /sql_search: paginazione e streaming
+SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "500"))               # limit di default quando c'è un cursor
+SQL_STREAM_FETCH_SIZE = int(os.getenv("SQL_STREAM_FETCH_SIZE", "500"))  # righe lette per fetchmany
+
+# /search_text: indice a trigrammi in memoria su titoli e registi, costruito
+# alla prima ricerca e ricostruito in background dopo TEXT_INDEX_MAX_AGE
+# secondi (0 = mai) per vedere le scritture che non passano da /add
+TEXT_INDEX_MAX_AGE = float(os.getenv("TEXT_INDEX_MAX_AGE", "600"))
+TEXT_SEARCH_MIN_SIMILARITY = float(os.getenv("TEXT_SEARCH_MIN_SIMILARITY", "0.5"))  # quota di trigrammi della query
+TEXT_SEARCH_MAX_CANDIDATES = int(os.getenv("TEXT_SEARCH_MAX_CANDIDATES", "1000"))  # documenti esaminati per ricerca
+TEXT_SEARCH_MAX_LIMIT = int(os.getenv("TEXT_SEARCH_MAX_LIMIT", "100"))
+
+# Cache dei risultati di /sql_search (0 disattiva). È per processo: le
+# scritture di app.seed, di altri worker uvicorn o di client esterni non la
+# invalidano e si vedono solo allo scadere di SQL_CACHE_TTL (oppure con
+# POST /admin/sql_cache/clear, che però svuota solo il processo che risponde)
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "60"))                # secondi
+SQL_CACHE_MAX_ROWS = int(os.getenv("SQL_CACHE_MAX_ROWS", "10000"))     # risultati più grandi non vengono messi in cache
+
+# Guardia delle query di /sql_search
+SQL_PARSE_CACHE_SIZE = int(os.getenv("SQL_PARSE_CACHE_SIZE", "1024"))     # analisi delle query in LRU
+SQL_DEFAULT_LIMIT = int(os.getenv("SQL_DEFAULT_LIMIT", "10000"))         # LIMIT aggiunto se manca (0 = no)
+SQL_MAX_STATEMENT_TIME = float(os.getenv("SQL_MAX_STATEMENT_TIME", "30"))  # max_statement_time in s (0 = no)
+
+# Concorrenza verso il DB: executor dedicato, richieste in corso e coda d'attesa
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+DB_MAX_IN_FLIGHT = int(os.getenv("DB_MAX_IN_FLIGHT", str(DB_EXECUTOR_WORKERS)))
+DB_MAX_QUEUE = int(os.getenv("DB_MAX_QUEUE", "100"))
+DB_QUEUE_TIMEOUT = float(os.getenv("DB_QUEUE_TIMEOUT", "5"))   # attesa max in coda (s), poi 503
+DB_RETRY_AFTER = float(os.getenv("DB_RETRY_AFTER", "1"))       # valore di Retry-After (s)
+
+# Cache di /schema_summary: entro SCHEMA_PROBE_INTERVAL si risponde dalla cache,
+# poi una probe leggera su information_schema.tables decide se ricaricare;
+# oltre SCHEMA_CACHE_MAX_AGE si ricarica comunque (0 disattiva la cache)
+SCHEMA_PROBE_INTERVAL = float(os.getenv("SCHEMA_PROBE_INTERVAL", "5"))
+SCHEMA_CACHE_MAX_AGE = float(os.getenv("SCHEMA_CACHE_MAX_AGE", "300"))
+
+# Metriche: richieste più lente di SLOW_REQUEST_SECONDS finiscono nello slow log
+# (0 = disattivato), con la query troncata a SLOW_LOG_MAX_QUERY caratteri
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1"))
+SLOW_LOG_MAX_QUERY = int(os.getenv("SLOW_LOG_MAX_QUERY", "2000"))
+
+# Statistiche per fingerprint delle query di /sql_search (0 = disattivate):
+# fingerprint ricordati e cartella degli snapshot di /admin/workload/snapshot
+WORKLOAD_MAX_FINGERPRINTS = int(os.getenv("WORKLOAD_MAX_FINGERPRINTS", "5000"))
+WORKLOAD_SNAPSHOT_DIR = os.getenv("WORKLOAD_SNAPSHOT_DIR", os.path.join(os.getcwd(), "workload_snapshots"))
+
+# Script di amministrazione in background (/admin/jobs): job eseguiti in
+# parallelo, job conclusi ricordati, durata massima di un job in s (0 = nessuna)
+ADMIN_JOB_WORKERS = int(os.getenv("ADMIN_JOB_WORKERS", "2"))
+ADMIN_JOB_HISTORY = int(os.getenv("ADMIN_JOB_HISTORY", "100"))
+ADMIN_JOB_TIMEOUT = float(os.getenv("ADMIN_JOB_TIMEOUT", "3600"))
+
+# Advisor degli indici: query ricordate, righe esaminate sotto cui non si
+# propone nulla, esecuzioni per la misura prima/dopo
+ADVISOR_MAX_QUERIES = int(os.getenv("ADVISOR_MAX_QUERIES", "500"))
+ADVISOR_MIN_ROWS = int(os.getenv("ADVISOR_MIN_ROWS", "1000"))
+ADVISOR_BENCH_RUNS = int(os.getenv("ADVISOR_BENCH_RUNS", "5"))
+
+# /sql_benchmark: limiti per richiesta
+SQL_BENCHMARK_MAX_ITERATIONS = int(os.getenv("SQL_BENCHMARK_MAX_ITERATIONS", "1000"))
+# esecuzioni di riscaldamento per connessione (non misurate, ma girano sul db)
+SQL_BENCHMARK_MAX_WARMUP = int(os.getenv("SQL_BENCHMARK_MAX_WARMUP", "10"))
+SQL_BENCHMARK_MAX_CONCURRENCY = int(os.getenv("SQL_BENCHMARK_MAX_CONCURRENCY", str(DB_POOL_SIZE)))
+SQL_BENCHMARK_MAX_DATABASES = int(os.getenv("SQL_BENCHMARK_MAX_DATABASES", "10"))
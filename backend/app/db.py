@@ -1,13 +1,753 @@
-import mariadb
-from . import config
-from typing import Any
-
-def get_connection(database_name: str) -> mariadb.Connection: # Accetta un argomento
-    return mariadb.connect(
-        host=config.DB_HOST,
-        port=config.DB_PORT,
-        user=config.DB_USER,       # Usa l'utente 'movies' (con permessi limitati)
-        password=config.DB_PASSWORD,
-        database=database_name,    # USA IL DATABASE PASSATO
-        autocommit=False, 
-    )
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import mariadb
+    from mariadb.constants import CLIENT
+except ImportError:  # basta il motore sqlite
+    mariadb = None
+from . import config, metrics
+
+# -------- motori -------------------------------------------------------------
+# Tutto ciò che dipende dal motore (connessione, dialetto degli upsert, schema,
+# timeout delle query) sta qui: add, search e schema usano solo le funzioni
+# di questo modulo e funzionano uguali su MariaDB e su SQLite.
+
+def _count_rows(cur: Any) -> int:
+    # righe di una SELECT degli script: si contano a blocchi senza tenerle
+    # tutte in memoria (rowcount non è affidabile prima dell'ultimo fetch)
+    count = 0
+    for rows in iter(lambda: cur.fetchmany(config.SQL_STREAM_FETCH_SIZE), []):
+        count += len(rows)
+    return count
+
+
+class MariaDBEngine:
+    name = "mariadb"
+    returning = False   # gli upsert restituiscono l'id in lastrowid
+
+    # ON DUPLICATE KEY UPDATE con id = LAST_INSERT_ID(id) fa sì che lastrowid
+    # restituisca l'id della riga sia quando viene inserita sia quando esiste già
+    UPSERTS = {
+        "regista": "INSERT INTO regista (nome, eta) VALUES (?, ?) "
+                   "ON DUPLICATE KEY UPDATE eta = VALUES(eta), idR = LAST_INSERT_ID(idR)",
+        "piattaforma": "INSERT INTO piattaforma (nome) VALUES (?) "
+                       "ON DUPLICATE KEY UPDATE idP = LAST_INSERT_ID(idP)",
+        "movies": "INSERT INTO movies (titolo, idR, anno, genere) VALUES (?, ?, ?, ?) "
+                  "ON DUPLICATE KEY UPDATE idR = VALUES(idR), anno = VALUES(anno), "
+                  "genere = VALUES(genere), idF = LAST_INSERT_ID(idF)",
+        "dove_vederlo": "INSERT INTO dove_vederlo (idF, idP1, idP2) VALUES (?, ?, ?) "
+                        "ON DUPLICATE KEY UPDATE idP1 = VALUES(idP1), idP2 = VALUES(idP2)",
+    }
+
+    SCHEMA_ROWS = """
+    SELECT table_name, column_name
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+    ORDER BY table_name, ordinal_position;
+    """
+    # molto più economica di information_schema.columns: cambia quando si
+    # creano/eliminano tabelle o quando un ALTER ricostruisce una tabella
+    SCHEMA_PROBE = """
+    SELECT COUNT(*), MAX(create_time), GROUP_CONCAT(table_name ORDER BY table_name)
+    FROM information_schema.tables
+    WHERE table_schema = DATABASE();
+    """
+
+    def __init__(self) -> None:
+        if mariadb is None:
+            raise RuntimeError("DB_ENGINE=mariadb requires the 'mariadb' package")
+        self.Error = mariadb.Error
+
+    def connect(self, database_name: str, host: Optional[str] = None, port: Optional[int] = None) -> Any:
+        return mariadb.connect(
+            host=host or config.DB_HOST,
+            port=port or config.DB_PORT,
+            user=config.DB_USER,       # Usa l'utente 'movies' (con permessi limitati)
+            password=config.DB_PASSWORD,
+            database=database_name,    # USA IL DATABASE PASSATO
+            autocommit=False,
+        )
+
+    def admin_connect(self) -> Any:
+        # root, fuori dal pool: per gli script di amministrazione (DDL, più
+        # statement, altri database). autocommit perché gli script non fanno commit
+        return mariadb.connect(
+            host=config.DB_HOST,
+            port=config.DB_PORT,
+            user="root",
+            password=config.DB_ROOT_PASSWORD,
+            autocommit=True,
+            client_flag=CLIENT.MULTI_STATEMENTS,
+        )
+
+    def monitor_connect(self, host: str, port: int) -> Any:
+        # per il controllo delle repliche: serve il privilegio di SHOW SLAVE STATUS
+        return mariadb.connect(
+            host=host,
+            port=port,
+            user=config.DB_REPLICA_MONITOR_USER,
+            password=config.DB_REPLICA_MONITOR_PASSWORD,
+            autocommit=True,
+            connect_timeout=max(1, int(config.DB_REPLICA_CHECK_INTERVAL)),
+        )
+
+    def replica_lag(self, conn: Any) -> Optional[float]:
+        """Secondi di ritardo della replica; None se la replica è ferma o il
+        server non è una replica."""
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SHOW SLAVE STATUS")
+        row = cur.fetchone()
+        if not row or row.get("Seconds_Behind_Master") is None:
+            return None
+        return float(row["Seconds_Behind_Master"])
+
+    def with_timeout(self, sql: str) -> str:
+        if config.SQL_MAX_STATEMENT_TIME > 0:
+            # nessuna query può occupare il server oltre SQL_MAX_STATEMENT_TIME
+            sql = f"SET STATEMENT max_statement_time={config.SQL_MAX_STATEMENT_TIME:g} FOR {sql}"
+        return sql
+
+    def run_script(self, conn: Any, script: str) -> None:
+        cur = conn.cursor()
+        cur.execute(script)
+        # con MULTI_STATEMENTS ogni statement produce un result set da consumare
+        while cur.nextset():
+            pass
+
+    def run_statement(self, conn: Any, sql: str) -> Tuple[Optional[int], List[str]]:
+        """Esegue uno statement di uno script: (righe toccate o lette, warning)."""
+        cur = conn.cursor()
+        cur.execute(sql)
+        rows = _count_rows(cur) if cur.description else cur.rowcount
+        while cur.nextset():
+            pass
+        warnings: List[str] = []
+        if getattr(cur, "warnings", 0):
+            cur.execute("SHOW WARNINGS")
+            warnings = [f"{level} {code}: {message}" for level, code, message in cur.fetchall()]
+        return (rows if rows >= 0 else None), warnings
+
+    def session_id(self, conn: Any) -> Optional[int]:
+        cur = conn.cursor()
+        cur.execute("SELECT CONNECTION_ID()")
+        return int(cur.fetchone()[0])
+
+    def cancel(self, conn: Any, session_id: Optional[int]) -> None:
+        # interrompe lo statement in corso, la connessione resta aperta
+        admin = self.admin_connect()
+        try:
+            admin.cursor().execute(f"KILL QUERY {int(session_id)}")
+        finally:
+            admin.close()
+
+    def list_databases(self) -> List[str]:
+        conn = self.admin_connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SHOW DATABASES")
+            dbs = [row[0] for row in cur.fetchall()]
+        finally:
+            conn.close()
+        # Filtra i database di sistema
+        excluded_dbs = ["information_schema", "mysql", "performance_schema", "sys"]
+        return [db for db in dbs if db not in excluded_dbs]
+
+
+class _SqliteCursor:
+    """Cursore sqlite3 che apre la transazione al primo statement e arma il
+    timeout; il resto (fetch*, description, lastrowid...) è quello di sqlite3."""
+
+    def __init__(self, conn: "SqliteConnection"):
+        self._conn = conn
+        self._cur = conn.raw.cursor()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> "_SqliteCursor":
+        self._conn._before_statement()
+        self._cur.execute(sql, params)
+        return self
+
+    def executemany(self, sql: str, seq: Sequence[Sequence[Any]]) -> "_SqliteCursor":
+        self._conn._before_statement()
+        self._cur.executemany(sql, seq)
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+
+class SqliteConnection:
+    """Connessione sqlite3 con l'interfaccia usata dal pool e dalla logica
+    (cursor, commit, rollback, ping, close) e le stesse transazioni di
+    MariaDB: BEGIN implicito al primo statement, savepoint annidati."""
+
+    def __init__(self, path: str, autocommit: bool = False, create: bool = False):
+        uri = "file:" + path + ("" if create else "?mode=rw")
+        # isolation_level=None: le transazioni le apre _before_statement
+        self.raw = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+        self.autocommit = autocommit
+        self._deadline = 0.0
+        self.raw.execute("PRAGMA foreign_keys = ON")
+        self.raw.execute("PRAGMA busy_timeout = %d" % int(config.DB_POOL_TIMEOUT * 1000))
+        self.raw.execute("PRAGMA journal_mode = WAL")
+        # equivalente di max_statement_time: sqlite3 interrompe lo statement
+        # ("interrupted") se l'handler restituisce un valore diverso da zero
+        self.raw.set_progress_handler(self._expired, 10_000)
+
+    def _expired(self) -> int:
+        return 1 if self._deadline and time.monotonic() > self._deadline else 0
+
+    def _before_statement(self) -> None:
+        if config.SQL_MAX_STATEMENT_TIME > 0:
+            self._deadline = time.monotonic() + config.SQL_MAX_STATEMENT_TIME
+        if not self.autocommit and not self.raw.in_transaction:
+            self.raw.execute("BEGIN")
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _SqliteCursor:
+        # buffered=False ecc.: sqlite3 legge comunque le righe a richiesta
+        return _SqliteCursor(self)
+
+    def commit(self) -> None:
+        self.raw.commit()
+
+    def rollback(self) -> None:
+        self.raw.rollback()
+
+    def ping(self) -> None:
+        self.raw.execute("SELECT 1").fetchall()
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+class SqliteEngine:
+    """Motore embedded: un file per database in SQLITE_DIR. Il database
+    DB_NAME viene creato con lo schema di sqlite_init.sql (equivalente di
+    init.sql); gli altri database devono esistere già."""
+
+    name = "sqlite"
+    returning = True   # gli upsert restituiscono l'id con RETURNING
+
+    UPSERTS = {
+        "regista": "INSERT INTO regista (nome, eta) VALUES (?, ?) "
+                   "ON CONFLICT(nome) DO UPDATE SET eta = excluded.eta RETURNING idR",
+        "piattaforma": "INSERT INTO piattaforma (nome) VALUES (?) "
+                       "ON CONFLICT(nome) DO UPDATE SET nome = nome RETURNING idP",
+        "movies": "INSERT INTO movies (titolo, idR, anno, genere) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT(titolo) DO UPDATE SET idR = excluded.idR, anno = excluded.anno, "
+                  "genere = excluded.genere RETURNING idF",
+        "dove_vederlo": "INSERT INTO dove_vederlo (idF, idP1, idP2) VALUES (?, ?, ?) "
+                        "ON CONFLICT(idF) DO UPDATE SET idP1 = excluded.idP1, idP2 = excluded.idP2 "
+                        "RETURNING idF",
+    }
+
+    SCHEMA_ROWS = """
+    SELECT m.name, c.name
+    FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS c
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+    ORDER BY m.name, c.cid;
+    """
+    # schema_version cambia a ogni modifica dello schema
+    SCHEMA_PROBE = """
+    SELECT COUNT(*), (SELECT schema_version FROM pragma_schema_version), GROUP_CONCAT(name)
+    FROM (SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name);
+    """
+
+    INIT_SCRIPT = os.path.join(os.path.dirname(__file__), "sqlite_init.sql")
+
+    def __init__(self) -> None:
+        self.Error = sqlite3.Error
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _path(self, database_name: str) -> str:
+        if not re.fullmatch(r"[\w$]+", database_name):
+            raise sqlite3.OperationalError(f"invalid database name '{database_name}'")
+        return os.path.join(config.SQLITE_DIR, f"{database_name}.sqlite3")
+
+    def connect(self, database_name: str, autocommit: bool = False) -> SqliteConnection:
+        path = self._path(database_name)
+        if database_name != config.DB_NAME:
+            if not os.path.exists(path):
+                raise sqlite3.OperationalError(f"unknown database '{database_name}'")
+            return SqliteConnection(path, autocommit)
+        os.makedirs(config.SQLITE_DIR, exist_ok=True)
+        conn = SqliteConnection(path, autocommit, create=True)
+        with self._init_lock:
+            if not self._initialized:
+                with open(self.INIT_SCRIPT, encoding="utf-8") as f:
+                    conn.raw.executescript(f.read())
+                self._initialized = True
+        return conn
+
+    def admin_connect(self) -> SqliteConnection:
+        # gli altri database si raggiungono con ATTACH DATABASE
+        return self.connect(config.DB_NAME, autocommit=True)
+
+    def with_timeout(self, sql: str) -> str:
+        # il timeout lo applica SqliteConnection a ogni statement
+        return sql
+
+    def run_script(self, conn: SqliteConnection, script: str) -> None:
+        conn.raw.executescript(script)
+
+    def run_statement(self, conn: SqliteConnection, sql: str) -> Tuple[Optional[int], List[str]]:
+        # cursore sqlite3 diretto: agli script non si applica SQL_MAX_STATEMENT_TIME
+        cur = conn.raw.execute(sql)
+        rows = _count_rows(cur) if cur.description else cur.rowcount
+        return (rows if rows >= 0 else None), []
+
+    def session_id(self, conn: SqliteConnection) -> Optional[int]:
+        return None
+
+    def cancel(self, conn: SqliteConnection, session_id: Optional[int]) -> None:
+        conn.raw.interrupt()   # sicuro da un altro thread
+
+    def list_databases(self) -> List[str]:
+        if not os.path.isdir(config.SQLITE_DIR):
+            return []
+        names = (f[:-len(".sqlite3")] for f in os.listdir(config.SQLITE_DIR) if f.endswith(".sqlite3"))
+        return sorted(n for n in names if re.fullmatch(r"[\w$]+", n))
+
+
+_ENGINES = {"mariadb": MariaDBEngine, "sqlite": SqliteEngine}
+
+if config.DB_ENGINE not in _ENGINES:
+    raise RuntimeError(f"Unknown DB_ENGINE '{config.DB_ENGINE}' (expected one of {sorted(_ENGINES)})")
+engine = _ENGINES[config.DB_ENGINE]()
+
+# tipi ed eccezioni del motore in uso: la logica non importa il driver
+Error = engine.Error
+Connection = Any
+Cursor = Any
+
+
+class PoolError(Error):
+    pass
+
+
+class InterfaceError(Error):
+    pass
+
+
+def _connect(database_name: str, server: Optional["Replica"] = None) -> Connection:
+    if server is None:
+        return engine.connect(database_name)
+    return engine.connect(database_name, host=server.host, port=server.port)
+
+def get_admin_connection() -> Connection:
+    return engine.admin_connect()
+
+# -------- pool ---------------------------------------------------------------
+
+class PooledConnection:
+    """Connessione presa in prestito dal pool: close() la restituisce al pool."""
+
+    def __init__(self, pool: "ConnectionPool", raw: Connection):
+        self._pool = pool
+        self._raw: Optional[Connection] = raw
+
+    @property
+    def raw(self) -> Connection:
+        if self._raw is None:
+            raise InterfaceError("connection already returned to the pool")
+        return self._raw
+
+    @property
+    def from_replica(self) -> bool:
+        return self._pool.server is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def close(self) -> None:
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, database_name: str, max_size: int, server: Optional["Replica"] = None):
+        self.database_name = database_name
+        self.server = server    # None = primario
+        self.max_size = max_size
+        self._cond = threading.Condition()
+        # connessioni libere: (connessione, istante in cui è tornata nel pool)
+        self._idle: List[Tuple[Connection, float]] = []
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+        self.last_used = time.monotonic()
+        # statistiche
+        self._acquired = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._acquire_total = 0.0
+        self._acquire_max = 0.0
+
+    @property
+    def size(self) -> int:
+        return self._in_use + len(self._idle)
+
+    def acquire(self, timeout: float) -> Connection:
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError(f"pool for '{self.database_name}' is closed")
+                if self._idle:
+                    raw, idle_since = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self.size < self.max_size:
+                    raw, idle_since = None, 0.0
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError(
+                        f"no connection available for '{self.database_name}' "
+                        f"after {timeout:.1f}s (pool size {self.max_size})"
+                    )
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+        # connect/ping fuori dal lock: sono round trip verso il server
+        try:
+            if raw is not None and time.monotonic() - idle_since > config.DB_POOL_VALIDATE_AFTER:
+                try:
+                    raw.ping()
+                except Error:
+                    self._discard(raw)
+                    raw = None
+            if raw is None:
+                with metrics.phase("connect"):
+                    raw = _connect(self.database_name, self.server)
+                with self._cond:
+                    self._created += 1
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._acquired += 1
+            self._acquire_total += elapsed
+            self._acquire_max = max(self._acquire_max, elapsed)
+            self.last_used = time.monotonic()
+        return raw
+
+    def release(self, raw: Connection) -> None:
+        # chiude l'eventuale transazione aperta (anche solo da una SELECT),
+        # così chi la riprende non vede uno snapshot vecchio
+        try:
+            raw.rollback()
+            healthy = True
+        except Error:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            self.last_used = time.monotonic()
+            if healthy and not self._closed:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            self._cond.notify()
+        if raw is not None:
+            self._discard(raw)
+
+    def _discard(self, raw: Connection) -> None:
+        with self._cond:
+            self._discarded += 1
+        try:
+            raw.close()
+        except Error:
+            pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for raw, _ in idle:
+            try:
+                raw.close()
+            except Error:
+                pass
+
+    def is_idle(self, now: float) -> bool:
+        with self._cond:
+            return (
+                self._in_use == 0
+                and self._waiters == 0
+                and now - self.last_used > config.DB_POOL_IDLE_TIMEOUT
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "database_name": self.database_name,
+                "server": self.server.name if self.server else "primary",
+                "max_size": self.max_size,
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquired": self._acquired,
+                "created": self._created,
+                "discarded": self._discarded,
+                "timeouts": self._timeouts,
+                "acquire_avg_ms": (self._acquire_total / self._acquired * 1000) if self._acquired else 0.0,
+                "acquire_max_ms": self._acquire_max * 1000,
+            }
+
+
+_pools: Dict[Tuple[Optional[str], str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_last_sweep = time.monotonic()
+
+
+def _evict_idle_pools() -> None:
+    # i pool dei database usati di rado vengono chiusi dopo DB_POOL_IDLE_TIMEOUT
+    global _last_sweep
+    now = time.monotonic()
+    with _pools_lock:
+        if now - _last_sweep < config.DB_POOL_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+        stale = [key for key, pool in _pools.items() if pool.is_idle(now)]
+        evicted = [_pools.pop(key) for key in stale]
+    for pool in evicted:
+        pool.close()
+
+
+def _get_pool(database_name: str, server: Optional["Replica"] = None) -> ConnectionPool:
+    _evict_idle_pools()
+    key = (server.name if server else None, database_name)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(database_name, config.DB_POOL_SIZE, server)
+            _pools[key] = pool
+        return pool
+
+# -------- repliche -----------------------------------------------------------
+# Un thread controlla periodicamente ritardo e latenza di ogni replica; le
+# letture scelgono tra le repliche sane, le altre tornano in rotazione da sole
+# quando recuperano.
+
+class Replica:
+    def __init__(self, name: str):
+        self.name = name
+        host, _, port = name.rpartition(":")
+        self.host = host if port.isdigit() else name
+        self.port = int(port) if port.isdigit() else config.DB_PORT
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.latency: Optional[float] = None   # media mobile esponenziale del ping (s)
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._monitor: Optional[Connection] = None
+
+    def check(self) -> None:
+        try:
+            if self._monitor is None:
+                self._monitor = engine.monitor_connect(self.host, self.port)
+            start = time.perf_counter()
+            self._monitor.ping()
+            elapsed = time.perf_counter() - start
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            self.lag = engine.replica_lag(self._monitor)
+            if self.lag is None:
+                self.healthy, self.error = False, "replication not running"
+            elif self.lag > config.DB_REPLICA_MAX_LAG:
+                self.healthy, self.error = False, f"lag {self.lag:g}s > {config.DB_REPLICA_MAX_LAG:g}s"
+            else:
+                self.healthy, self.error = True, None
+        except Error as e:
+            self.mark_down(str(e))
+            monitor, self._monitor = self._monitor, None
+            if monitor is not None:
+                try:
+                    monitor.close()
+                except Error:
+                    pass
+        self.checked_at = time.time()
+
+    def mark_down(self, error: str) -> None:
+        # fino al prossimo controllo andato a buon fine
+        self.healthy, self.error = False, error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+            "error": self.error,
+            "checked_at": self.checked_at,
+        }
+
+
+class ReplicaSet:
+    def __init__(self, names: List[str], policy: str):
+        if policy not in ("round_robin", "least_latency"):
+            raise RuntimeError(f"Unknown DB_REPLICA_POLICY '{policy}'")
+        self.replicas = [Replica(n) for n in names]
+        self.policy = policy
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.fallbacks = 0
+
+    def _ensure_monitor(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            # primo controllo sincrono: senza, le prime letture andrebbero tutte al primario
+            for replica in self.replicas:
+                replica.check()
+            self._thread = threading.Thread(target=self._monitor, name="replica-monitor", daemon=True)
+            self._thread.start()
+
+    def _monitor(self) -> None:
+        while True:
+            time.sleep(config.DB_REPLICA_CHECK_INTERVAL)
+            for replica in self.replicas:
+                replica.check()
+
+    def choose(self) -> Optional[Replica]:
+        """Replica per la prossima lettura; None = nessuna sana, si usa il primario."""
+        self._ensure_monitor()
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            self.note_fallback()
+            return None
+        if self.policy == "least_latency":
+            return min(healthy, key=lambda r: r.latency if r.latency is not None else float("inf"))
+        return healthy[next(self._rr) % len(healthy)]
+
+    def note_fallback(self) -> None:
+        # chiamato dai thread delle richieste: += non è atomico
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_lag": config.DB_REPLICA_MAX_LAG,
+            "fallbacks": self.fallbacks,
+            "replicas": [r.stats() for r in self.replicas],
+        }
+
+
+# le repliche esistono solo per MariaDB: con sqlite si legge dal file locale
+replicas: Optional[ReplicaSet] = (
+    ReplicaSet(config.DB_REPLICAS, config.DB_REPLICA_POLICY)
+    if config.DB_REPLICAS and engine.name == "mariadb" else None
+)
+
+# -------- API ----------------------------------------------------------------
+
+def get_connection(database_name: str = config.DB_NAME) -> PooledConnection:
+    pool = _get_pool(database_name)
+    # acquire comprende l'eventuale connect (misurato anche a parte)
+    with metrics.phase("acquire"):
+        raw = pool.acquire(config.DB_POOL_TIMEOUT)
+    return PooledConnection(pool, raw)
+
+
+@contextmanager
+def connection(database_name: str = config.DB_NAME) -> Iterator[PooledConnection]:
+    conn = get_connection(database_name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_read_connection(database_name: str = config.DB_NAME) -> PooledConnection:
+    """Connessione per sole letture: da una replica sana se ce ne sono,
+    altrimenti (o se la replica non risponde) dal primario."""
+    server = replicas.choose() if replicas is not None else None
+    if server is None:
+        return get_connection(database_name)
+    pool = _get_pool(database_name, server)
+    try:
+        with metrics.phase("acquire"):
+            raw = pool.acquire(config.DB_POOL_TIMEOUT)
+    except PoolError:
+        raise     # replica sana ma satura: il primario non va caricato al suo posto
+    except Error as e:
+        server.mark_down(str(e))
+        replicas.note_fallback()
+        return get_connection(database_name)
+    return PooledConnection(pool, raw)
+
+
+@contextmanager
+def read_connection(database_name: str = config.DB_NAME) -> Iterator[PooledConnection]:
+    conn = get_read_connection(database_name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def replica_stats() -> Optional[Dict[str, Any]]:
+    return replicas.stats() if replicas is not None else None
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+# -------- dialetto -----------------------------------------------------------
+
+def with_timeout(sql: str) -> str:
+    """La query con il limite di durata SQL_MAX_STATEMENT_TIME del motore."""
+    return engine.with_timeout(sql)
+
+
+def upsert(cur: Cursor, table: str, params: Sequence[Any]) -> int:
+    """Inserisce o aggiorna la riga (per chiave unica) e ne restituisce l'id."""
+    cur.execute(engine.UPSERTS[table], params)
+    if engine.returning:
+        return cur.fetchone()[0]
+    return cur.lastrowid
+
+
+def run_script(conn: Connection, script: str) -> None:
+    engine.run_script(conn, script)
+
+
+def list_databases() -> List[str]:
+    return engine.list_databases()
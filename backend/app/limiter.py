@@ -0,0 +1,158 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from . import config
+
+
+class Overloaded(Exception):
+    """Troppe richieste verso il DB: il chiamante risponde 503 + Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+_DONE = object()
+
+
+def _close(iterator: Iterator[Any]) -> None:
+    close: Optional[Callable[[], None]] = getattr(iterator, "close", None)
+    if close is not None:
+        close()
+
+
+class LimitedStream:
+    """Iteratore async su un iteratore sincrono consumato nell'executor del
+    limiter, che tiene uno slot (già preso con acquire) fino ad aclose().
+    aclose() è idempotente e va chiamato in ogni caso, anche se lo stream
+    non è mai stato letto: è l'unico punto in cui lo slot viene rilasciato."""
+
+    def __init__(self, limiter: "DbLimiter", iterator: Iterator[Any]):
+        self._limiter = limiter
+        self._iterator = iterator
+        self._pending: Optional["concurrent.futures.Future[Any]"] = None
+        self._closed = False
+
+    def __aiter__(self) -> "LimitedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        self._pending = self._limiter._submit_sync(next, self._iterator, _DONE)
+        item = await asyncio.wrap_future(self._pending)
+        if item is _DONE:
+            await self.aclose()
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            # client disconnesso durante un next: il thread sta ancora
+            # eseguendo il generatore, che si può chiudere solo dopo
+            if self._pending is not None and not self._pending.done():
+                await asyncio.wait([asyncio.wrap_future(self._pending)])
+            # chiusura nell'executor: il finally del generatore fa I/O sul DB
+            await asyncio.wrap_future(self._limiter._submit_sync(_close, self._iterator))
+        finally:
+            self._limiter.release()
+
+
+class DbLimiter:
+    """Esegue il lavoro sul DB in un executor dedicato, con al massimo
+    max_in_flight operazioni in corso e una coda d'attesa limitata: oltre la
+    coda, o dopo queue_timeout secondi di attesa, si rifiuta subito invece di
+    accumulare latenza."""
+
+    def __init__(self, workers: int, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    # -------- slot ----------------------------------------------------------
+    # Tutto avviene nel thread dell'event loop: niente lock.
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("too many requests waiting for the database", config.DB_RETRY_AFTER)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            # release() passa lo slot direttamente al primo in coda
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("timed out waiting for a database slot", config.DB_RETRY_AFTER)
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    def release(self) -> None:
+        self.completed += 1
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    # -------- esecuzione ----------------------------------------------------
+
+    def _submit_sync(self, func: Callable[..., Any], *args: Any) -> "concurrent.futures.Future[Any]":
+        # il contesto (contextvars) della richiesta segue la funzione nel thread
+        ctx = contextvars.copy_context()
+        return self._executor.submit(functools.partial(ctx.run, func, *args))
+
+    def _submit(self, func: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+        return asyncio.wrap_future(self._submit_sync(func, *args))
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        await self.acquire()
+        try:
+            return await self._submit(func, *args)
+        finally:
+            self.release()
+
+    def iterate(self, iterator: Iterator[Any]) -> LimitedStream:
+        """Consuma un iteratore sincrono (es. uno streaming dal DB) nell'executor.
+        Lo slot deve essere già stato preso con acquire(): viene rilasciato
+        dall'aclose() dello stream, che il chiamante deve garantire."""
+        return LimitedStream(self, iterator)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "waiting": sum(1 for f in self._waiters if not f.done()),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+db_limiter = DbLimiter(
+    workers=config.DB_EXECUTOR_WORKERS,
+    max_in_flight=config.DB_MAX_IN_FLIGHT,
+    max_queue=config.DB_MAX_QUEUE,
+    queue_timeout=config.DB_QUEUE_TIMEOUT,
+)
@@ -1,6 +1,10 @@
-from typing import List, Optional, Tuple
-import mariadb
-from ..db import get_connection
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .. import config, metrics
+from ..db import Cursor, Error, connection, get_connection, upsert
+from .cache import table_versions
+from .catalog import refresh_director, refresh_films
+from .textsearch import text_indexes
 
 # -------- parsing & validation ---------------------------------------------
 
@@ -45,78 +49,202 @@ def _parse_data_line(data_line: str) -> Tuple[str, str, int, int, str, List[str]
 
     return titolo, nome_regista, eta, anno, genere, piattaforme
 
-# -------- DB helper ----------------------------------------------------------
+# -------- id cache -----------------------------------------------------------
+
+class _IdCache:
+    """Cache di processo piattaforma.nome -> idP.
+    Le voci scoperte durante una transazione vengono pubblicate solo al commit;
+    un rollback svuota la cache (potrebbe essere stato causato da un id vecchio),
+    come clear_id_cache dopo le scritture che non passano da add."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.piattaforma: Dict[str, int] = {}
+
+    def merge(self, staged: "_Staged") -> None:
+        with self._lock:
+            if len(self.piattaforma) > self.max_entries:
+                self._clear()
+            self.piattaforma.update(staged.piattaforma)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self.piattaforma.clear()
+
+
+_ids = _IdCache(config.ADD_ID_CACHE_SIZE)
+
+
+def clear_id_cache() -> None:
+    """Da chiamare dopo ogni scrittura che non passa da add (script, rebuild...)."""
+    _ids.clear()
 
-def _get_or_create_regista(cur: mariadb.Cursor, nome: str, eta: int) -> int:
-    cur.execute("SELECT idR FROM regista WHERE nome = ?", (nome,))
-    row = cur.fetchone()
-    if row:
-        cur.execute("UPDATE regista SET eta=? WHERE idR=?", (eta, row[0]))
-        return row[0]
-    cur.execute("INSERT INTO regista (nome, eta) VALUES (?, ?)", (nome, eta))
-    return cur.lastrowid
-
-def _get_or_create_piattaforma(cur: mariadb.Cursor, nome: str) -> int:
-    cur.execute("SELECT idP FROM piattaforma WHERE nome = ?", (nome,))
-    row = cur.fetchone()
-    if row:
-        return row[0]
-    cur.execute("INSERT INTO piattaforma (nome) VALUES (?)", (nome,))
-    return cur.lastrowid
-
-def _upsert_film(cur: mariadb.Cursor, titolo: str, idR: int, anno: int, genere: str) -> int:
-    cur.execute("SELECT idF FROM movies WHERE titolo = ?", (titolo,))
-    row = cur.fetchone()
-    if row:
-        cur.execute(
-            "UPDATE movies SET idR=?, anno=?, genere=? WHERE idF=?",
-            (idR, anno, genere, row[0])
-        )
-        return row[0]
-    cur.execute(
-        "INSERT INTO movies (titolo, idR, anno, genere) VALUES (?, ?, ?, ?)",
-        (titolo, idR, anno, genere)
-    )
-    return cur.lastrowid
-
-def _replace_piattaforme(cur: mariadb.Cursor, idF: int, piattaforme: List[str]) -> None:
-
-    cur.execute("SELECT idF FROM dove_vederlo WHERE idF=?", (idF,))
-    if not cur.fetchone():
-        cur.execute(
-            "INSERT INTO dove_vederlo (idF, idP1, idP2) VALUES (?, NULL, NULL)",
-            (idF,)
-        )
-
-    cur.execute(
-        "UPDATE dove_vederlo SET idP1=NULL, idP2=NULL WHERE idF=?",
-        (idF,)
-    )
-
-    ids: List[Optional[int]] = []
-    for p in piattaforme[:2]:
-        pid = _get_or_create_piattaforma(cur, p)
-        ids.append(pid)
-
-    if len(ids) >= 1:
-        cur.execute("UPDATE dove_vederlo SET idP1=? WHERE idF=?", (ids[0], idF))
-    if len(ids) == 2:
-        cur.execute("UPDATE dove_vederlo SET idP2=? WHERE idF=?", (ids[1], idF))
+
+class _Staged:
+    """Id letti/scritti dalla transazione corrente (o dal savepoint corrente,
+    se ha un parent), non ancora pubblicati nella cache. I registi restano
+    della transazione: la riga è bloccata dal suo upsert fino al commit, dopo
+    nessuno garantisce che l'età sia ancora quella."""
+
+    def __init__(self, parent: Optional["_Staged"] = None) -> None:
+        self.parent = parent
+        self.regista: Dict[str, int] = {}
+        self.eta: Dict[int, int] = {}
+        self.piattaforma: Dict[str, int] = {}
+
+    def idR(self, nome: str) -> Optional[int]:
+        if nome in self.regista:
+            return self.regista[nome]
+        return self.parent.idR(nome) if self.parent else None
+
+    def eta_of(self, idR: int) -> Optional[int]:
+        if idR in self.eta:
+            return self.eta[idR]
+        return self.parent.eta_of(idR) if self.parent else None
+
+    def idP(self, nome: str) -> Optional[int]:
+        if nome in self.piattaforma:
+            return self.piattaforma[nome]
+        return self.parent.idP(nome) if self.parent else _ids.piattaforma.get(nome)
+
+    def update(self, other: "_Staged") -> None:
+        self.regista.update(other.regista)
+        self.eta.update(other.eta)
+        self.piattaforma.update(other.piattaforma)
+
+# -------- DB helper ----------------------------------------------------------
+# Ogni upsert è un solo statement che restituisce l'id della riga sia quando
+# viene inserita sia quando esiste già (il dialetto dipende dal motore, vedi db.py).
+
+def _get_or_create_regista(cur: Cursor, staged: _Staged, nome: str, eta: int) -> int:
+    idR = staged.idR(nome)
+    if idR is not None and staged.eta_of(idR) == eta:
+        return idR
+    idR = upsert(cur, "regista", (nome, eta))
+    if config.FILM_CATALOG:
+        refresh_director(cur, idR, eta)
+    staged.regista[nome] = idR
+    staged.eta[idR] = eta
+    return idR
+
+def _get_or_create_piattaforma(cur: Cursor, staged: _Staged, nome: str) -> int:
+    idP = staged.idP(nome)
+    if idP is not None:
+        return idP
+    idP = upsert(cur, "piattaforma", (nome,))
+    staged.piattaforma[nome] = idP
+    return idP
+
+def _upsert_film(cur: Cursor, titolo: str, idR: int, anno: int, genere: str) -> int:
+    return upsert(cur, "movies", (titolo, idR, anno, genere))
+
+def _replace_piattaforme(cur: Cursor, staged: _Staged, idF: int, piattaforme: List[str]) -> None:
+    ids: List[Optional[int]] = [_get_or_create_piattaforma(cur, staged, p) for p in piattaforme[:2]]
+    ids += [None] * (2 - len(ids))
+    upsert(cur, "dove_vederlo", (idF, ids[0], ids[1]))
 
 # -------- entrypoint ---------------------------------------------------------
 
+WRITTEN_TABLES = ("regista", "movies", "piattaforma", "dove_vederlo") + (
+    ("film_catalog",) if config.FILM_CATALOG else ())
+
+def _store_line(cur: Cursor, staged: _Staged,
+                parsed: Tuple[str, str, int, int, str, List[str]]) -> Tuple[int, str, int, int, str]:
+    """Scrive la riga; restituisce (idF, titolo, anno, idR, regista) per l'indice di /search_text."""
+    titolo, nome_regista, eta, anno, genere, piattaforme = parsed
+    idR = _get_or_create_regista(cur, staged, nome_regista, eta)
+    idF = _upsert_film(cur, titolo, idR, anno, genere)
+    _replace_piattaforme(cur, staged, idF, piattaforme)
+    if config.FILM_CATALOG:
+        refresh_films(cur, [idF])
+    return idF, titolo, anno, idR, nome_regista
+
 def add_line(data_line: str) -> None:
-    titolo, nome_regista, eta, anno, genere, piattaforme = _parse_data_line(data_line)
+    parsed = _parse_data_line(data_line)
+    metrics.note(op="add")
+
+    with connection(config.DB_NAME) as conn:
+        staged = _Staged()
+        try:
+            cur = conn.cursor()
+            with metrics.phase("execute"):
+                film = _store_line(cur, staged, parsed)
+            with metrics.phase("commit"):
+                conn.commit()
+        except Error as e:
+            conn.rollback()
+            _ids.clear()
+            raise ValueError(f"DB error: {e}")
+        _ids.merge(staged)
+    metrics.rows(1)
+    table_versions.bump(config.DB_NAME, WRITTEN_TABLES)
+    text_indexes.note_films(config.DB_NAME, [film])
+
+def add_lines(data_lines: Sequence[str], first_line: int = 1,
+              raise_errors: bool = False) -> List[Dict[str, Any]]:
+    """Applica più data_line in un'unica transazione.
+    Ogni riga è protetta da un savepoint: una riga non valida viene annullata
+    e riportata come errore senza far fallire le altre. Con raise_errors gli
+    errori di connessione/transazione si propagano invece di finire nelle righe."""
+    results: List[Dict[str, Any]] = []
+    pending: List[int] = []
+    films: List[Tuple[int, str, int, int, str]] = []
+    metrics.note(op="add_batch")
 
-    conn = get_connection("moviesdb")
     try:
+        conn = get_connection(config.DB_NAME)
+    except Error as e:
+        if raise_errors:
+            raise
+        return [{"line": n, "status": "error", "error": f"DB error: {e}"}
+                for n in range(first_line, first_line + len(data_lines))]
+
+    with conn:
         cur = conn.cursor()
-        idR = _get_or_create_regista(cur, nome_regista, eta)
-        idF = _upsert_film(cur, titolo, idR, anno, genere)
-        _replace_piattaforme(cur, idF, piattaforme)
-        conn.commit()
-    except mariadb.Error as e:
-        conn.rollback()
-        raise ValueError(f"DB error: {e}")
-    finally:
-        conn.close()
+        staged = _Staged()
+        try:
+            for n, data_line in enumerate(data_lines, start=first_line):
+                try:
+                    parsed = _parse_data_line(data_line)
+                except ValueError as e:
+                    results.append({"line": n, "status": "error", "error": str(e)})
+                    continue
+                cur.execute("SAVEPOINT add_line")
+                line_staged = _Staged(parent=staged)
+                try:
+                    with metrics.phase("execute"):
+                        film = _store_line(cur, line_staged, parsed)
+                    cur.execute("RELEASE SAVEPOINT add_line")
+                except Error as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT add_line")
+                    _ids.clear()
+                    results.append({"line": n, "status": "error", "error": f"DB error: {e}"})
+                    continue
+                staged.update(line_staged)
+                films.append(film)
+                results.append({"line": n, "status": "ok", "error": None})
+                pending.append(len(results) - 1)
+            with metrics.phase("commit"):
+                conn.commit()
+        except Error as e:
+            # errore a livello di transazione (connessione persa, commit
+            # fallito...): nessuna delle righe "ok" è stata salvata
+            conn.rollback()
+            _ids.clear()
+            if raise_errors:
+                raise
+            for i in pending:
+                results[i] = {"line": results[i]["line"], "status": "error", "error": f"DB error: {e}"}
+            for n in range(first_line + len(results), first_line + len(data_lines)):
+                results.append({"line": n, "status": "error", "error": f"DB error: {e}"})
+            return results
+        _ids.merge(staged)
+    metrics.rows(len(pending))
+    if pending:
+        table_versions.bump(config.DB_NAME, WRITTEN_TABLES)
+        text_indexes.note_films(config.DB_NAME, films)
+    return results
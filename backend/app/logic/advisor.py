@@ -0,0 +1,304 @@
+import json
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .. import config
+from ..db import Cursor, Error, connection, get_admin_connection, with_timeout
+from .cache import normalize_sql
+from .guard import SqlSyntaxError, analyze, fingerprint, table_aliases, tokenize
+
+# -------- query eseguite -----------------------------------------------------
+# Le SELECT andate a buon fine su /sql_search, con quante volte e quanto
+# tempo: l'advisor pesa i suggerimenti con questi numeri. Le query che
+# differiscono solo nei letterali sono una voce sola (fingerprint, come in
+# workload); per l'EXPLAIN si usa il primo esempio visto.
+
+class QueryLog:
+    def __init__(self, max_queries: int):
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        # (database, fingerprint) -> [esecuzioni, secondi totali, query d'esempio]
+        self._queries: "OrderedDict[Tuple[str, str], List[Any]]" = OrderedDict()
+
+    def record(self, database_name: str, query: str, seconds: float) -> None:
+        if self.max_queries <= 0:
+            return
+        key = (database_name, fingerprint(query))
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = [0, 0.0, normalize_sql(query)]
+                while len(self._queries) > self.max_queries:
+                    self._queries.popitem(last=False)
+            self._queries.move_to_end(key)
+            entry[0] += 1
+            entry[1] += seconds
+
+    def queries(self, database_name: str) -> List[Tuple[str, int, float]]:
+        with self._lock:
+            return [(example, int(n), total) for (db, _), (n, total, example) in self._queries.items()
+                    if db == database_name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._queries.clear()
+
+
+query_log = QueryLog(config.ADVISOR_MAX_QUERIES)
+
+# -------- EXPLAIN ------------------------------------------------------------
+
+def _explain(cur: Cursor, query: str) -> Dict[str, Any]:
+    cur.execute(f"EXPLAIN FORMAT=JSON {query}")
+    return json.loads(cur.fetchone()[0])
+
+
+def _walk(node: Any, prefix: List[float], out: List[Dict[str, Any]], sort_keys: List[str]) -> None:
+    """Raccoglie i nodi 'table' (con le righe esaminate stimate, tenendo conto
+    del nested loop) e le chiavi dei filesort."""
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, prefix, out, sort_keys)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key == "table" and isinstance(value, dict):
+            rows = float(value.get("rows") or 0)
+            filtered = float(value.get("filtered") or 100) / 100
+            out.append(dict(value, examined=prefix[0] * rows))
+            # le tabelle successive del join vengono lette una volta per riga
+            prefix[0] *= max(1.0, rows * filtered)
+            _walk({k: v for k, v in value.items() if isinstance(v, (dict, list))}, [1.0], out, sort_keys)
+        elif key == "filesort" and isinstance(value, dict):
+            if value.get("sort_key"):
+                sort_keys.append(value["sort_key"])
+            _walk(value, prefix, out, sort_keys)
+        elif key in ("query_block", "nested_loop", "temporary_table", "read_sorted_file",
+                     "subqueries", "union_result", "query_specifications", "materialized",
+                     "having_condition", "block-nl-join", "duplicates_removal"):
+            _walk(value, prefix if key == "nested_loop" else [prefix[0]], out, sort_keys)
+        elif isinstance(value, (dict, list)):
+            _walk(value, [1.0], out, sort_keys)
+
+# -------- colonne candidate --------------------------------------------------
+
+_EQ_OPS = {"=", "<=>", "in"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between", "like"}
+# parole che in una condizione precedono un operatore senza essere colonne
+# ("x NOT IN (...)", "x IS NOT NULL AND y LIKE ...")
+_NOT_COLUMNS = {"not", "and", "or", "xor", "is", "null", "true", "false", "in", "like",
+                "between", "escape", "binary", "collate", "case", "when", "then", "else", "end"}
+
+
+def _column_refs(condition: str, alias: str, single_table: bool) -> Iterator[Tuple[str, str]]:
+    """(colonna, 'eq' | 'range') per le colonne di `alias` confrontate nella condizione."""
+    try:
+        tokens, _ = tokenize(condition)
+    except SqlSyntaxError:
+        return
+    for i, tok in enumerate(tokens):
+        if tok.kind not in ("word", "ident"):
+            continue
+        column = None
+        nxt = i + 1
+        if (i + 2 < len(tokens) and tokens[i + 1].value == "."
+                and tokens[i + 2].kind in ("word", "ident")):
+            if tok.value.lower() == alias:
+                column = tokens[i + 2].value
+            nxt = i + 3
+        elif single_table and (i == 0 or tokens[i - 1].value != "."):
+            if tok.kind == "ident" or tok.value not in _NOT_COLUMNS:
+                column = tok.value
+        if column is None:
+            continue
+        before = tokens[i - 1].value if i > 0 else None
+        after = tokens[nxt].value if nxt < len(tokens) else None
+        if after in _EQ_OPS or before in ("=", "<=>"):
+            yield column, "eq"
+        elif after in _RANGE_OPS or before in _RANGE_OPS:
+            yield column, "range"
+
+
+def _sort_columns(sort_key: str, alias: str) -> List[str]:
+    columns = []
+    for part in sort_key.split(","):
+        words = part.strip().split()
+        if not words:
+            continue
+        ref = words[0].strip("`")
+        table, _, column = ref.rpartition(".")
+        if table.strip("`").lower() != alias:
+            return []   # ordinamento su più tabelle: nessun indice lo copre
+        columns.append(column.strip("`"))
+    return columns
+
+
+def _existing_indexes(cur: Cursor) -> Dict[str, List[List[str]]]:
+    cur.execute(
+        "SELECT table_name, index_name, column_name FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"
+    )
+    indexes: Dict[Tuple[str, str], List[str]] = OrderedDict()
+    for table, index, column in cur.fetchall():
+        indexes.setdefault((table.lower(), index), []).append(column.lower())
+    by_table: Dict[str, List[List[str]]] = {}
+    for (table, _), columns in indexes.items():
+        by_table.setdefault(table, []).append(columns)
+    return by_table
+
+
+def _table_columns(cur: Cursor) -> Dict[str, Set[str]]:
+    cur.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = DATABASE()"
+    )
+    columns: Dict[str, Set[str]] = {}
+    for table, column in cur.fetchall():
+        columns.setdefault(table.lower(), set()).add(column.lower())
+    return columns
+
+
+def _covered(columns: Sequence[str], existing: List[List[str]]) -> bool:
+    wanted = [c.lower() for c in columns]
+    return any(idx[:len(wanted)] == wanted for idx in existing)
+
+# -------- suggerimenti -------------------------------------------------------
+
+def _candidate(node: Dict[str, Any], alias: str, single_table: bool, sort_keys: List[str],
+               known: Set[str]) -> Tuple[List[str], List[str]]:
+    """Colonne dell'indice (uguaglianze, poi ordinamento, poi un range) e motivi.
+    Si propongono solo colonne che la tabella ha davvero (`known`)."""
+    eq: List[str] = []
+    ranges: List[str] = []
+    for key in ("attached_condition", "pushed_index_condition"):
+        for column, kind in _column_refs(node.get(key) or "", alias, single_table):
+            if column.lower() not in known:
+                continue
+            target = eq if kind == "eq" else ranges
+            if column not in eq and column not in target:
+                target.append(column)
+    reasons: List[str] = []
+    if node.get("access_type") in ("ALL", "index"):
+        reasons.append("full scan" if node.get("access_type") == "ALL" else "full index scan")
+    sort: List[str] = []
+    for sort_key in sort_keys:
+        sort_columns = _sort_columns(sort_key, alias)
+        if not all(c.lower() in known for c in sort_columns):
+            continue   # ordinamento su un'espressione, non su colonne
+        sort = [c for c in sort_columns if c not in eq]
+        if sort:
+            reasons.append("filesort")
+            break
+    columns = eq[:3] + sort[:2]
+    if not sort and ranges:
+        # dopo un range l'indice non serve più all'ordinamento: uno solo, in fondo
+        columns.append(ranges[0])
+    return list(dict.fromkeys(columns))[:4], reasons
+
+
+def advise(database_name: str) -> List[Dict[str, Any]]:
+    """EXPLAIN delle query registrate per il database e indici proposti,
+    ordinati per beneficio stimato (righe esaminate in meno x esecuzioni)."""
+    queries = query_log.queries(database_name)
+    suggestions: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        existing = _existing_indexes(cur)
+        table_columns = _table_columns(cur)
+        for query, executions, total_seconds in queries:
+            if analyze(query).verdict != "ok":
+                continue
+            try:
+                plan = _explain(cur, query)
+            except (Error, ValueError, TypeError):
+                continue
+            nodes: List[Dict[str, Any]] = []
+            sort_keys: List[str] = []
+            _walk(plan, [1.0], nodes, sort_keys)
+            aliases = table_aliases(query)
+            for node in nodes:
+                alias = str(node.get("table_name", "")).lower()
+                db, table = aliases.get(alias, (None, alias))
+                if not table or (db and db != database_name.lower()) or table not in existing:
+                    continue   # tabelle derivate, di altri database o di sistema
+                examined = node["examined"]
+                if examined < config.ADVISOR_MIN_ROWS:
+                    continue
+                columns, reasons = _candidate(node, alias, len(nodes) == 1, sort_keys,
+                                              table_columns.get(table, set()))
+                if not columns or not reasons or _covered(columns, existing.get(table, [])):
+                    continue
+                after = examined * float(node.get("filtered") or 100) / 100
+                key = (table, tuple(c.lower() for c in columns))
+                s = suggestions.get(key)
+                if s is None:
+                    s = suggestions[key] = {
+                        "table": table,
+                        "columns": columns,
+                        "ddl": _ddl(table, columns),
+                        "reasons": [],
+                        "queries": [],
+                        "estimated_rows_before": 0.0,
+                        "estimated_rows_after": 0.0,
+                        "estimated_benefit": 0.0,
+                    }
+                s["reasons"] = sorted(set(s["reasons"]) | set(reasons))
+                s["queries"].append({"sql": query, "executions": executions,
+                                     "avg_ms": round(total_seconds / executions * 1000, 3)})
+                s["estimated_rows_before"] += examined * executions
+                s["estimated_rows_after"] += after * executions
+                s["estimated_benefit"] += (examined - after) * executions
+    return sorted(suggestions.values(), key=lambda s: s["estimated_benefit"], reverse=True)
+
+
+def _ddl(table: str, columns: Sequence[str]) -> str:
+    name = "idx_adv_" + "_".join([table] + [c.lower() for c in columns])
+    cols = ", ".join(_quote(c) for c in columns)
+    return f"CREATE INDEX {_quote(name[:64])} ON {_quote(table)} ({cols})"
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+# -------- applicazione e benchmark -------------------------------------------
+
+def _measure(database_name: str, queries: Sequence[str], runs: int) -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        for query in queries:
+            sql = with_timeout(query)
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                cur.execute(sql)
+                cur.fetchall()
+                samples.append(time.perf_counter() - start)
+            timings[query] = round(statistics.median(samples) * 1000, 3)
+    return timings
+
+
+def apply(database_name: str, suggestions: Sequence[Dict[str, Any]], runs: int) -> List[Dict[str, Any]]:
+    """Crea gli indici proposti e misura le query coinvolte prima e dopo
+    (mediana di `runs` esecuzioni, in ms)."""
+    results = []
+    for s in suggestions:
+        queries = [q["sql"] for q in s["queries"]]
+        before = _measure(database_name, queries, runs)
+        conn = get_admin_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"USE `{database_name}`")
+            cur.execute(s["ddl"])
+        finally:
+            conn.close()
+        after = _measure(database_name, queries, runs)
+        results.append({
+            "ddl": s["ddl"],
+            "queries": [{"sql": q, "before_ms": before[q], "after_ms": after[q]} for q in queries],
+        })
+    return results
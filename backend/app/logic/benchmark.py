@@ -0,0 +1,127 @@
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from .. import config
+from ..db import Cursor, Error, connection, engine, with_timeout
+from ..models import SqlBenchmarkRequest, SqlBenchmarkResponse, SqlBenchmarkResult
+from .guard import analyze
+
+# contatori di sessione confrontati prima/dopo le esecuzioni misurate (solo MariaDB)
+_STATUS_SQL = (
+    "SHOW SESSION STATUS WHERE Variable_name LIKE 'Handler\\_%' "
+    "OR Variable_name IN ('Rows_read', 'Rows_sent', 'Rows_tmp_read', 'Sort_rows', 'Sort_scan', "
+    "'Sort_merge_passes', 'Select_scan', 'Select_full_join', 'Created_tmp_tables', 'Created_tmp_disk_tables')"
+)
+
+
+def _status(cur: Cursor) -> Dict[str, float]:
+    if engine.name != "mariadb":
+        return {}
+    cur.execute(_STATUS_SQL)
+    values: Dict[str, float] = {}
+    for name, value in cur.fetchall():
+        try:
+            values[name] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def _delta(after: Dict[str, float], before: Dict[str, float]) -> Dict[str, float]:
+    return {k: v - before.get(k, 0.0) for k, v in after.items()}
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def _worker(database_name: str, sql: str, iterations: int,
+            warmup: int) -> Tuple[List[float], int, Dict[str, float], Tuple[float, float]]:
+    """Esegue la query su una connessione: (latenze in s, righe, delta dei
+    contatori, inizio e fine delle iterazioni misurate)."""
+    latencies: List[float] = []
+    rows = 0
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        for _ in range(warmup):
+            cur.execute(sql)
+            cur.fetchall()
+        # anche SHOW STATUS muove alcuni contatori: il suo costo si misura e si sottrae
+        s0 = _status(cur)
+        s1 = _status(cur)
+        overhead = _delta(s1, s0)
+        measured_from = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            cur.execute(sql)
+            rows = len(cur.fetchall())
+            latencies.append(time.perf_counter() - start)
+        measured_to = time.perf_counter()
+        s2 = _status(cur)
+    counters = {k: v - overhead.get(k, 0.0) for k, v in _delta(s2, s1).items()}
+    return latencies, rows, counters, (measured_from, measured_to)
+
+
+def _bench_database(pool: ThreadPoolExecutor, database_name: str, sql: str,
+                    request: SqlBenchmarkRequest) -> SqlBenchmarkResult:
+    workers = min(request.concurrency, request.iterations)
+    share = [request.iterations // workers + (1 if k < request.iterations % workers else 0) for k in range(workers)]
+    futures = [pool.submit(_worker, database_name, sql, n, request.warmup) for n in share]
+    try:
+        outcomes = [f.result() for f in futures]
+    except Error as e:
+        return SqlBenchmarkResult(database_name=database_name, status="error", error=str(e))
+    # dal primo worker che inizia a misurare all'ultimo che finisce
+    elapsed = max(w[1] for *_, w in outcomes) - min(w[0] for *_, w in outcomes)
+
+    latencies = sorted(v for lat, _, _, _ in outcomes for v in lat)
+    counters: Dict[str, float] = {}
+    for _, _, delta, _ in outcomes:
+        for k, v in delta.items():
+            counters[k] = counters.get(k, 0.0) + v
+    ms = lambda v: round(v * 1000, 3)
+    return SqlBenchmarkResult(
+        database_name=database_name,
+        status="ok",
+        iterations=len(latencies),
+        rows=outcomes[-1][1],
+        min_ms=ms(latencies[0]),
+        median_ms=ms(statistics.median(latencies)),
+        p95_ms=ms(_percentile(latencies, 95)),
+        max_ms=ms(latencies[-1]),
+        mean_ms=ms(statistics.mean(latencies)),
+        throughput_qps=round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        server_status={k: round(v / len(latencies), 3) for k, v in sorted(counters.items()) if v},
+    )
+
+
+def sqlbenchmark(request: SqlBenchmarkRequest) -> SqlBenchmarkResponse:
+    """Esegue la stessa query su più database in parallelo e ne confronta le
+    latenze e i contatori lato server. Non passa dalla cache dei risultati."""
+    query = request.sql_query.strip().rstrip(";").strip()
+    info = analyze(query)
+    if info.verdict != "ok":
+        return SqlBenchmarkResponse(sql_validation=info.verdict, results=[])
+
+    if request.iterations > config.SQL_BENCHMARK_MAX_ITERATIONS:
+        raise ValueError(f"iterations must be <= {config.SQL_BENCHMARK_MAX_ITERATIONS}")
+    if request.warmup > config.SQL_BENCHMARK_MAX_WARMUP:
+        raise ValueError(f"warmup must be <= {config.SQL_BENCHMARK_MAX_WARMUP}")
+    if request.concurrency > config.SQL_BENCHMARK_MAX_CONCURRENCY:
+        raise ValueError(f"concurrency must be <= {config.SQL_BENCHMARK_MAX_CONCURRENCY}")
+    databases = list(dict.fromkeys(request.databases))
+    if len(databases) > config.SQL_BENCHMARK_MAX_DATABASES:
+        raise ValueError(f"at most {config.SQL_BENCHMARK_MAX_DATABASES} databases per benchmark")
+
+    sql = with_timeout(query)
+
+    workers = min(request.concurrency, request.iterations)
+    with ThreadPoolExecutor(max_workers=len(databases) * workers, thread_name_prefix="bench") as pool:
+        # un thread per database coordina i propri worker
+        with ThreadPoolExecutor(max_workers=len(databases)) as coordinators:
+            results = list(coordinators.map(lambda db: _bench_database(pool, db, sql, request), databases))
+    return SqlBenchmarkResponse(sql_validation="valid", results=results)
@@ -0,0 +1,145 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .. import config
+from .guard import analyze
+
+# -------- versioni delle tabelle ---------------------------------------------
+# Ogni scrittura incrementa la versione delle tabelle che tocca; una voce in
+# cache ricorda le versioni lette prima di eseguire la query e vale solo
+# finché sono ancora quelle correnti. Gli script di amministrazione, che
+# possono toccare qualsiasi cosa, incrementano un'epoca globale.
+
+class TableVersions:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._epoch = 0
+
+    def snapshot(self, tables: Iterable[Tuple[str, str]]) -> Tuple[int, Tuple[Tuple[Tuple[str, str], int], ...]]:
+        with self._lock:
+            return self._epoch, tuple((t, self._versions.get(t, 0)) for t in sorted(set(tables)))
+
+    def is_current(self, snapshot: Tuple[int, Tuple[Tuple[Tuple[str, str], int], ...]]) -> bool:
+        epoch, versions = snapshot
+        with self._lock:
+            return epoch == self._epoch and all(self._versions.get(t, 0) == v for t, v in versions)
+
+    def bump(self, database_name: str, tables: Iterable[str]) -> None:
+        with self._lock:
+            for table in tables:
+                key = (database_name.lower(), table.lower())
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def bump_all(self) -> None:
+        with self._lock:
+            self._epoch += 1
+
+
+table_versions = TableVersions()
+
+# -------- tabelle lette da una query -----------------------------------------
+
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+
+def tables_in(query: str, database_name: str) -> List[Tuple[str, str]]:
+    """(database, tabella) citate dopo FROM/JOIN, anche nelle sottoquery e
+    nelle liste separate da virgola."""
+    return [(db or database_name.lower(), table) for db, table in analyze(query).tables]
+
+# funzioni il cui risultato cambia a ogni esecuzione: query da non mettere in cache
+_VOLATILE = re.compile(
+    r"\b(?:now|sysdate|curdate|curtime|current_date|current_time|current_timestamp|utc_\w+"
+    r"|unix_timestamp|rand|uuid\w*|sleep|connection_id|last_insert_id|found_rows|row_count"
+    r"|nextval|lastval)\b|@",
+    flags=re.IGNORECASE,
+)
+
+def is_cacheable(query: str) -> bool:
+    return not _VOLATILE.search(_STRINGS.sub("''", query))
+
+def normalize_sql(query: str) -> str:
+    # spazi compattati fuori dalle stringhe, senza ';' finale
+    parts: List[str] = []
+    last = 0
+    for m in _STRINGS.finditer(query):
+        parts.append(" ".join(query[last:m.start()].split()))
+        parts.append(m.group(0))
+        last = m.end()
+    parts.append(" ".join(query[last:].split()))
+    return " ".join(p for p in parts if p).rstrip(";").strip()
+
+# -------- cache dei risultati ------------------------------------------------
+
+class QueryResultCache:
+    """LRU con TTL; le voci dipendono dalle versioni delle tabelle lette."""
+
+    def __init__(self, max_entries: int, ttl: float, max_rows: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, snapshot, value = entry
+            if expires_at < now or not table_versions.is_current(snapshot):
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, snapshot: Any, rows: int, ttl: Optional[float] = None) -> None:
+        """`ttl` accorcia la durata della voce (mai oltre self.ttl)."""
+        if rows > self.max_rows:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, snapshot, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+result_cache = QueryResultCache(config.SQL_CACHE_MAX_ENTRIES, config.SQL_CACHE_TTL, config.SQL_CACHE_MAX_ROWS)
@@ -0,0 +1,158 @@
+"""Tabella film_catalog: una riga per film con regista e piattaforme già
+risolti, per leggere senza il join a cinque tabelle.
+
+Con FILM_CATALOG=1 add_line e il caricamento bulk la aggiornano nella stessa
+transazione delle tabelle normalizzate. Per allinearla (prima attivazione,
+script di amministrazione che scrivono sulle tabelle normalizzate):
+
+    python -m app.logic.catalog rebuild [--database moviesdb]
+    python -m app.logic.catalog check [--database moviesdb]
+"""
+import argparse
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .. import config
+from ..db import Cursor, Error, connection, engine
+
+def _ddl() -> List[str]:
+    # come in init.sql / sqlite_init.sql: su SQLite i testi confrontati senza
+    # distinzione di maiuscole (COLLATE NOCASE), come le collation di MariaDB
+    nocase = " COLLATE NOCASE" if engine.name == "sqlite" else ""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS film_catalog (
+          idF INT PRIMARY KEY,
+          titolo VARCHAR(255) NOT NULL{nocase},
+          anno INT NOT NULL,
+          genere VARCHAR(100) NOT NULL{nocase},
+          idR INT NOT NULL,
+          regista VARCHAR(255) NOT NULL{nocase},
+          eta INT NOT NULL,
+          piattaforma1 VARCHAR(100) NULL,
+          piattaforma2 VARCHAR(100) NULL,
+          CONSTRAINT fk_fc_film FOREIGN KEY (idF) REFERENCES movies(idF) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fc_anno ON film_catalog(anno)",
+        "CREATE INDEX IF NOT EXISTS idx_fc_genere ON film_catalog(genere)",
+        "CREATE INDEX IF NOT EXISTS idx_fc_idR ON film_catalog(idR)",
+    ]
+
+COLUMNS = "idF, titolo, anno, genere, idR, regista, eta, piattaforma1, piattaforma2"
+
+# la riga del catalogo calcolata dalle tabelle normalizzate
+_SOURCE = """
+    SELECT m.idF AS idF, m.titolo AS titolo, m.anno AS anno, m.genere AS genere, r.idR AS idR,
+           r.nome AS regista, r.eta AS eta, p1.nome AS piattaforma1, p2.nome AS piattaforma2
+    FROM movies m
+    JOIN regista r ON r.idR = m.idR
+    LEFT JOIN dove_vederlo dv ON dv.idF = m.idF
+    LEFT JOIN piattaforma p1 ON p1.idP = dv.idP1
+    LEFT JOIN piattaforma p2 ON p2.idP = dv.idP2
+"""
+
+_CHUNK = 500
+
+
+def _placeholders(n: int) -> str:
+    return ", ".join(["?"] * n)
+
+
+def _chunks(ids: Iterable[int]) -> Iterable[List[int]]:
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), _CHUNK):
+        yield ids[i:i + _CHUNK]
+
+# -------- manutenzione incrementale ------------------------------------------
+# Chiamate dentro la transazione di chi scrive: il catalogo vede esattamente
+# ciò che vedono le tabelle normalizzate.
+
+def refresh_films(cur: Cursor, film_ids: Iterable[int]) -> None:
+    """Ricalcola le righe dei film indicati (dopo l'upsert di film e piattaforme)."""
+    for part in _chunks(film_ids):
+        cur.execute(
+            f"REPLACE INTO film_catalog ({COLUMNS}) {_SOURCE} WHERE m.idF IN ({_placeholders(len(part))})",
+            tuple(part),
+        )
+
+
+def refresh_director(cur: Cursor, idR: int, eta: int) -> None:
+    # l'upsert del regista può cambiarne l'età: vale per tutti i suoi film
+    cur.execute("UPDATE film_catalog SET eta = ? WHERE idR = ? AND eta <> ?", (eta, idR, eta))
+
+
+def refresh_directors(cur: Cursor, director_ids: Iterable[int]) -> None:
+    """Come refresh_director, per un blocco di registi (caricamento bulk)."""
+    current = "(SELECT r.eta FROM regista r WHERE r.idR = film_catalog.idR)"
+    for part in _chunks(director_ids):
+        cur.execute(
+            f"UPDATE film_catalog SET eta = {current} "
+            f"WHERE idR IN ({_placeholders(len(part))}) AND eta <> {current}",
+            tuple(part),
+        )
+
+# -------- ricostruzione e controllo ------------------------------------------
+
+def rebuild(database_name: str = config.DB_NAME) -> int:
+    """Crea la tabella se manca e la riempie da zero in una transazione."""
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        try:
+            for statement in _ddl():
+                cur.execute(statement)
+            cur.execute("DELETE FROM film_catalog")
+            cur.execute(f"INSERT INTO film_catalog ({COLUMNS}) {_SOURCE}")
+            cur.execute("SELECT COUNT(*) FROM film_catalog")
+            (count,) = cur.fetchone()
+            conn.commit()
+        except Error:
+            conn.rollback()
+            raise
+    return count
+
+
+def check(database_name: str = config.DB_NAME, sample: int = 20) -> Dict[str, Any]:
+    """Differenze tra il catalogo e le tabelle normalizzate: film mancanti,
+    righe in più e righe con valori diversi (con qualche idF di esempio)."""
+    differs = " OR ".join(
+        [f"fc.{c} <> s.{c}" for c in ("titolo", "anno", "genere", "idR", "regista", "eta")]
+        + [f"COALESCE(fc.{c}, '') <> COALESCE(s.{c}, '')" for c in ("piattaforma1", "piattaforma2")]
+    )
+    queries = {
+        "missing": "SELECT m.idF FROM movies m LEFT JOIN film_catalog fc ON fc.idF = m.idF "
+                   "WHERE fc.idF IS NULL ORDER BY m.idF",
+        "extra": "SELECT fc.idF FROM film_catalog fc LEFT JOIN movies m ON m.idF = fc.idF "
+                 "WHERE m.idF IS NULL ORDER BY fc.idF",
+        "different": f"SELECT s.idF FROM ({_SOURCE}) AS s "
+                     f"JOIN film_catalog fc ON fc.idF = s.idF WHERE {differs} ORDER BY s.idF",
+    }
+    report: Dict[str, Any] = {"database_name": database_name}
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        for name, sql in queries.items():
+            cur.execute(sql)
+            ids = [row[0] for row in cur.fetchall()]
+            report[name] = len(ids)
+            report[f"{name}_sample"] = ids[:sample]
+    report["consistent"] = not (report["missing"] or report["extra"] or report["different"])
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Rebuild or check the film_catalog table.")
+    p.add_argument("command", choices=("rebuild", "check"))
+    p.add_argument("--database", default=config.DB_NAME)
+    args = p.parse_args(argv)
+
+    if args.command == "rebuild":
+        print(f"film_catalog rebuilt: {rebuild(args.database)} rows")
+        return 0
+    report = check(args.database)
+    for name in ("missing", "extra", "different"):
+        print(f"{name}: {report[name]}" + (f" (e.g. idF {report[name + '_sample']})" if report[name] else ""))
+    return 0 if report["consistent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import base64
+import datetime
+import decimal
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+# Librerie opzionali: senza di esse il formato corrispondente non è disponibile
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+
+class FormatUnavailable(Exception):
+    pass
+
+# -------- tipi nativi --------------------------------------------------------
+# I valori arrivano dal driver con il loro tipo Python; quelli che JSON e
+# MessagePack non conoscono vengono convertiti qui, una volta per cella.
+
+def _native(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return bytes(value).decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+def to_json(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, default=_native, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def to_msgpack(payload: Dict[str, Any]) -> bytes:
+    if msgpack is None:
+        raise FormatUnavailable("MessagePack output requires the 'msgpack' package")
+    return msgpack.packb(payload, default=_native, use_bin_type=True)
+
+def to_arrow(columns: Sequence[str], rows: Optional[List[Sequence[Any]]],
+             metadata: Dict[str, str]) -> bytes:
+    if pa is None:
+        raise FormatUnavailable("Arrow output requires the 'pyarrow' package")
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = []
+    for col in values:
+        try:
+            arrays.append(pa.array(col))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # colonna con tipi misti: ripiego su stringhe
+            arrays.append(pa.array([None if v is None else str(v) for v in col], type=pa.string()))
+    table = pa.Table.from_arrays(arrays, names=[str(c) for c in columns])
+    table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
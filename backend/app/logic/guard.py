@@ -0,0 +1,308 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .. import config
+
+# -------- tokenizer ----------------------------------------------------------
+# Quanto basta del lessico MariaDB per classificare una query senza eseguirla:
+# stringhe, identificatori quotati e commenti non devono essere scambiati per
+# parole chiave o separatori di statement.
+
+class Token(NamedTuple):
+    kind: str    # word | ident | string | number | param | punct | semicolon
+    value: str   # per le word: in minuscolo
+    start: int
+    end: int
+
+
+class SqlSyntaxError(ValueError):
+    pass
+
+
+_WORD = re.compile(r"[A-Za-z_$][\w$]*")
+_NUMBER = re.compile(r"(?:0x[0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)")
+_OPERATORS = ("<=>", "<<", ">>", "<=", ">=", "<>", "!=", ":=", "||", "&&", "->>", "->")
+
+
+def _scan_quoted(sql: str, i: int, quote: str) -> int:
+    # restituisce l'indice dopo la quote di chiusura
+    j = i + 1
+    while j < len(sql):
+        c = sql[j]
+        if c == "\\" and quote != "`":
+            j += 2
+            continue
+        if c == quote:
+            if j + 1 < len(sql) and sql[j + 1] == quote:
+                j += 2
+                continue
+            return j + 1
+        j += 1
+    raise SqlSyntaxError(f"unterminated {quote} at position {i}")
+
+
+def tokenize(sql: str) -> Tuple[List[Token], bool]:
+    """Token della query e un flag che indica la presenza di commenti
+    eseguibili (/*! ... */, /*M! ... */), che MariaDB interpreta come codice."""
+    tokens: List[Token] = []
+    executable_comment = False
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c.isspace():
+            i += 1
+        elif c == "#" or (sql.startswith("--", i) and (i + 2 == n or sql[i + 2].isspace())):
+            j = sql.find("\n", i)
+            i = n if j < 0 else j + 1
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            if j < 0:
+                raise SqlSyntaxError(f"unterminated comment at position {i}")
+            if sql.startswith("/*!", i) or sql.startswith("/*M!", i):
+                executable_comment = True
+            i = j + 2
+        elif c in ("'", '"'):
+            j = _scan_quoted(sql, i, c)
+            tokens.append(Token("string", sql[i:j], i, j))
+            i = j
+        elif c == "`":
+            j = _scan_quoted(sql, i, c)
+            tokens.append(Token("ident", sql[i + 1:j - 1].replace("``", "`"), i, j))
+            i = j
+        elif c == ";":
+            tokens.append(Token("semicolon", ";", i, i + 1))
+            i += 1
+        elif c.isdigit() or (c == "." and i + 1 < n and sql[i + 1].isdigit()):
+            m = _NUMBER.match(sql, i)
+            tokens.append(Token("number", m.group(0), i, m.end()))
+            i = m.end()
+        elif c == "?" or (c == "@" and i + 1 < n):
+            m = _WORD.match(sql, i + 1) if c == "@" else None
+            j = m.end() if m else i + 1
+            tokens.append(Token("param", sql[i:j], i, j))
+            i = j
+        else:
+            m = _WORD.match(sql, i)
+            if m:
+                tokens.append(Token("word", m.group(0).lower(), i, m.end()))
+                i = m.end()
+                continue
+            op = next((o for o in _OPERATORS if sql.startswith(o, i)), c)
+            tokens.append(Token("punct", op, i, i + len(op)))
+            i += len(op)
+    return tokens, executable_comment
+
+
+def split_statements(sql: str) -> List[str]:
+    """Divide uno script sui ';' di primo livello (non dentro stringhe o
+    commenti). Non gestisce DELIMITER né i blocchi BEGIN ... END."""
+    tokens, _ = tokenize(sql)
+    statements: List[str] = []
+    start = 0
+    for tok in tokens:
+        if tok.kind == "semicolon":
+            stmt = sql[start:tok.start].strip()
+            if stmt:
+                statements.append(stmt)
+            start = tok.end
+    tail = sql[start:].strip()
+    if tail and tokenize(tail)[0]:
+        statements.append(tail)
+    return statements
+
+# -------- classificazione ----------------------------------------------------
+
+# parole dopo FROM/JOIN che non possono essere alias di tabella
+_CLAUSE_WORDS = {
+    "join", "inner", "left", "right", "cross", "natural", "straight_join", "full", "outer",
+    "on", "using", "where", "group", "order", "having", "limit", "union", "except",
+    "intersect", "window", "for", "lock", "into", "partition", "use", "force", "ignore",
+}
+# funzioni che bloccano risorse del server o leggono file
+_FORBIDDEN_FUNCTIONS = {
+    "sleep", "benchmark", "load_file", "get_lock", "release_lock", "release_all_locks",
+    "master_pos_wait", "master_gtid_wait",
+}
+# tabelle di servizio di app.seed: stanno nel database dell'applicazione ma
+# non fanno parte dello schema che si interroga (né di /schema_summary)
+INTERNAL_TABLES = {"seed_state", "seed_rows"}
+
+
+class QueryInfo(NamedTuple):
+    verdict: str                    # ok | unsafe | invalid
+    reason: Optional[str]
+    has_limit: bool                 # LIMIT di primo livello già presente
+    tables: Tuple[Tuple[Optional[str], str], ...]   # (database o None, tabella)
+    statement: str = ""             # la query fino all'ultimo token: senza ';' né commenti finali
+
+
+def _table_refs(tokens: List[Token]) -> List[Tuple[Optional[str], str, Optional[str]]]:
+    # (database o None, tabella, alias o None) dopo FROM/JOIN
+    found: List[Tuple[Optional[str], str, Optional[str]]] = []
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        i += 1
+        if tok.kind != "word" or tok.value not in ("from", "join", "straight_join"):
+            continue
+        while i < len(tokens) and tokens[i].kind in ("word", "ident"):
+            if tokens[i].kind == "word" and tokens[i].value in _CLAUSE_WORDS:
+                break
+            name = tokens[i].value
+            i += 1
+            if (i + 1 < len(tokens) and tokens[i].value == "."
+                    and tokens[i + 1].kind in ("word", "ident")):
+                database, table = name.lower(), tokens[i + 1].value.lower()
+                i += 2
+            else:
+                database, table = None, name.lower()
+            # alias facoltativo
+            alias = None
+            if i < len(tokens) and tokens[i].kind == "word" and tokens[i].value == "as":
+                i += 1
+            if (i < len(tokens) and tokens[i].kind in ("word", "ident")
+                    and tokens[i].value not in _CLAUSE_WORDS):
+                alias = tokens[i].value.lower()
+                i += 1
+            found.append((database, table, alias))
+            if i < len(tokens) and tokens[i].value == ",":
+                i += 1
+                continue
+            break
+    return found
+
+
+def _tables(tokens: List[Token]) -> Tuple[Tuple[Optional[str], str], ...]:
+    return tuple(dict.fromkeys((database, table) for database, table, _ in _table_refs(tokens)))
+
+
+def table_aliases(sql: str) -> Dict[str, Tuple[Optional[str], str]]:
+    """alias (o nome della tabella, se senza alias) -> (database o None, tabella)."""
+    try:
+        tokens, _ = tokenize(sql)
+    except SqlSyntaxError:
+        return {}
+    return {alias or table: (database, table) for database, table, alias in _table_refs(tokens)}
+
+@lru_cache(maxsize=config.SQL_PARSE_CACHE_SIZE)
+def analyze(sql: str) -> QueryInfo:
+    """Classifica una query in sola lettura. Il risultato è in cache (LRU):
+    le stesse query tornano di continuo."""
+    try:
+        tokens, executable_comment = tokenize(sql)
+    except SqlSyntaxError as e:
+        return QueryInfo("invalid", str(e), False, ())
+
+    # un eventuale ';' finale è ammesso, qualsiasi cosa dopo no
+    while tokens and tokens[-1].kind == "semicolon":
+        tokens.pop()
+    if not tokens:
+        return QueryInfo("invalid", "empty query", False, ())
+    if any(t.kind == "semicolon" for t in tokens):
+        return QueryInfo("unsafe", "multiple statements", False, ())
+    if executable_comment:
+        return QueryInfo("unsafe", "executable comment", False, ())
+
+    first = next((t for t in tokens if t.value != "("), tokens[0])
+    if first.kind != "word" or first.value not in ("select", "with"):
+        return QueryInfo("unsafe", "only SELECT statements are allowed", False, ())
+
+    depth = 0
+    has_limit = False
+    for i, tok in enumerate(tokens):
+        nxt = tokens[i + 1].value if i + 1 < len(tokens) else None
+        if tok.kind == "punct" and tok.value == "(":
+            depth += 1
+        elif tok.kind == "punct" and tok.value == ")":
+            depth -= 1
+            if depth < 0:
+                return QueryInfo("invalid", "unbalanced parentheses", False, ())
+        elif tok.kind != "word":
+            continue
+        elif tok.value in ("insert", "update", "delete", "replace") and nxt not in ("(", "."):
+            # WITH ... UPDATE/DELETE; INSERT() e REPLACE() sono anche funzioni stringa
+            return QueryInfo("unsafe", f"{tok.value.upper()} is not allowed", False, ())
+        elif tok.value == "for" and nxt in ("update", "share"):
+            return QueryInfo("unsafe", "locking read", False, ())
+        elif tok.value == "lock" and nxt == "in":
+            return QueryInfo("unsafe", "locking read", False, ())
+        elif tok.value == "into":
+            return QueryInfo("unsafe", "SELECT ... INTO is not allowed", False, ())
+        elif tok.value in _FORBIDDEN_FUNCTIONS and nxt == "(":
+            return QueryInfo("unsafe", f"{tok.value.upper()}() is not allowed", False, ())
+        elif tok.value == "limit" and depth == 0:
+            has_limit = True
+    if depth != 0:
+        return QueryInfo("invalid", "unbalanced parentheses", False, ())
+
+    tables = _tables(tokens)
+    if any(table in INTERNAL_TABLES for _, table in tables):
+        return QueryInfo("unsafe", "internal table", False, ())
+    return QueryInfo("ok", None, has_limit, tables, sql[:tokens[-1].end])
+
+# -------- fingerprint --------------------------------------------------------
+# La forma della query: letterali sostituiti da ?, liste di soli letterali
+# (IN (1, 2, 3)) ridotte a (?+), parole chiave e identificatori in minuscolo,
+# spazi e commenti normalizzati. Query che differiscono solo nei valori
+# hanno lo stesso fingerprint.
+
+_LITERALS = ("string", "number", "param")
+# parole dopo cui "(" apre una sottoquery o una lista, non una chiamata di funzione
+_SPACED = {"in", "from", "join", "where", "on", "and", "or", "not", "exists", "as", "select",
+           "using", "over", "union", "all", "any", "some", "with", "when", "then", "else"}
+
+
+def _is_literal(tokens: List[Token], i: int) -> bool:
+    tok = tokens[i]
+    if tok.kind == "param":
+        return tok.value == "?"
+    if tok.kind in ("string", "number"):
+        return True
+    return tok.kind == "word" and tok.value in ("null", "true", "false")
+
+
+@lru_cache(maxsize=config.SQL_PARSE_CACHE_SIZE)
+def fingerprint(sql: str) -> str:
+    try:
+        tokens, _ = tokenize(sql)
+    except SqlSyntaxError:
+        return " ".join(sql.lower().split())
+    while tokens and tokens[-1].kind == "semicolon":
+        tokens.pop()
+
+    out: List[str] = []
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        prev = out[-1] if out else None
+        if (tok.kind == "punct" and tok.value in ("-", "+") and i + 1 < len(tokens)
+                and tokens[i + 1].kind == "number" and (prev is None or prev in ("(", ",", "=", "<", ">", "<=", ">=", "<>", "!="))):
+            i += 1   # segno di un letterale numerico
+            continue
+        if tok.kind == "punct" and tok.value == "(" and prev == "in":
+            # IN (letterale, letterale, ...) -> IN (?+), qualunque sia la lunghezza
+            j = i + 1
+            while j < len(tokens) and (_is_literal(tokens, j) or tokens[j].value in (",", "-", "+")):
+                j += 1
+            if j > i + 1 and j < len(tokens) and tokens[j].value == ")":
+                out.extend(("(", "?+", ")"))
+                i = j + 1
+                continue
+        if tok.kind in _LITERALS and (tok.kind != "param" or tok.value == "?"):
+            out.append("?")
+        elif tok.kind == "ident":
+            out.append(tok.value.lower() if _WORD.fullmatch(tok.value) else f"`{tok.value.lower()}`")
+        else:
+            out.append(tok.value)
+        i += 1
+
+    text = ""
+    prev = None
+    for part in out:
+        function_call = part == "(" and prev is not None and _WORD.fullmatch(prev) and prev not in _SPACED
+        if text and part not in (",", ")", ".") and not function_call and not text.endswith(("(", ".")):
+            text += " "
+        text += part
+        prev = part
+    return text
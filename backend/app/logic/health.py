@@ -1,11 +1,8 @@
-from ..db import get_connection
+from ..db import connection
 
 def ping_db() -> bool:
-    conn = get_connection()
-    try:
+    with connection() as conn:
         cur = conn.cursor()
         cur.execute("SELECT 1;")
         cur.fetchall()
         return True
-    finally:
-        conn.close()
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .. import config
+from ..db import Connection, Error, engine, get_admin_connection
+from .add import clear_id_cache
+from .cache import table_versions
+from .guard import SqlSyntaxError, split_statements
+from .schema import schema_cache, script_has_ddl
+
+logger = logging.getLogger("app.jobs")
+
+# -------- job degli script di amministrazione --------------------------------
+# Lo script viene diviso in statement (split_statements: niente DELIMITER né
+# blocchi BEGIN ... END) ed eseguito in background su una connessione admin,
+# uno statement alla volta, fermandosi al primo errore. Gli executor sono
+# separati da quelli delle richieste: un job lungo non toglie slot al DB.
+
+FINISHED = ("done", "failed", "cancelled", "timeout")
+
+
+class _Statement:
+    __slots__ = ("sql", "status", "started", "elapsed", "rows", "warnings", "error")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.status = "pending"     # pending | running | ok | error | cancelled | skipped
+        self.started: Optional[float] = None
+        self.elapsed: Optional[float] = None
+        self.rows: Optional[int] = None
+        self.warnings: List[str] = []
+        self.error: Optional[str] = None
+
+    def to_dict(self, index: int) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        if elapsed is None and self.started is not None:
+            elapsed = time.perf_counter() - self.started   # in corso
+        return {
+            "index": index,
+            "sql": self.sql[:config.SLOW_LOG_MAX_QUERY],
+            "status": self.status,
+            "elapsed_ms": round(elapsed * 1000, 3) if elapsed is not None else None,
+            "rows_affected": self.rows,
+            "warnings": self.warnings,
+            "error": self.error,
+        }
+
+
+class ScriptJob:
+    def __init__(self, script: str, timeout: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.script = script
+        self.timeout = timeout
+        self.statements = [_Statement(sql) for sql in split_statements(script)]
+        self.status = "queued"      # queued | running | done | failed | cancelled | timeout
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.timed_out = False
+        self._lock = threading.Lock()
+        self._conn: Optional[Connection] = None
+        self._session_id: Optional[int] = None
+
+    def to_dict(self, statements: bool = True) -> Dict[str, Any]:
+        done = sum(1 for s in self.statements if s.status in ("ok", "error"))
+        data: Dict[str, Any] = {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "statements_total": len(self.statements),
+            "statements_done": done,
+            "progress": round(done / len(self.statements), 3) if self.statements else 1.0,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timeout": self.timeout,
+        }
+        if statements:
+            data["statements"] = [s.to_dict(i) for i, s in enumerate(self.statements)]
+        return data
+
+    def interrupt(self) -> None:
+        """KILL QUERY sulla connessione del job (sqlite: interrupt)."""
+        with self._lock:
+            conn, session_id = self._conn, self._session_id
+        if conn is None:
+            return
+        try:
+            engine.cancel(conn, session_id)
+        except Error as e:
+            logger.warning("job %s: cancel failed: %s", self.id, e)
+
+    def run(self) -> None:
+        if self.cancel_requested:
+            self._finish("cancelled")
+            return
+        self.status = "running"
+        self.started_at = time.time()
+        timer = threading.Timer(self.timeout, self._expire) if self.timeout > 0 else None
+        conn = None
+        try:
+            conn = get_admin_connection()
+            with self._lock:
+                self._conn, self._session_id = conn, engine.session_id(conn)
+            if timer is not None:
+                timer.start()
+            for stmt in self.statements:
+                if self.cancel_requested or self.timed_out:
+                    break
+                stmt.status = "running"
+                stmt.started = time.perf_counter()
+                try:
+                    stmt.rows, stmt.warnings = engine.run_statement(conn, stmt.sql)
+                    stmt.status = "ok"
+                except Exception as e:
+                    stmt.status = "cancelled" if self.cancel_requested or self.timed_out else "error"
+                    stmt.error = str(e)
+                    raise
+                finally:
+                    stmt.elapsed = time.perf_counter() - stmt.started
+        except Error as e:
+            if not (self.cancel_requested or self.timed_out):
+                self.error = str(e)
+                self._finish("failed")
+        except Exception as e:
+            # bug o errore imprevisto: il job non deve restare "running" per sempre
+            logger.exception("job %s: unexpected error", self.id)
+            self.error = f"{type(e).__name__}: {e}"
+            self._finish("failed")
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self._lock:
+                self._conn = None
+            if conn is not None:
+                try:
+                    conn.close()
+                except Error:
+                    pass
+            # lo script può aver scritto su qualsiasi tabella (anche se è fallito a metà)
+            table_versions.bump_all()
+            clear_id_cache()
+            if script_has_ddl(self.script):
+                schema_cache.invalidate()
+        if self.status == "running":
+            if self.timed_out:
+                self.error = f"timed out after {self.timeout:g}s"
+                self._finish("timeout")
+            else:
+                self._finish("cancelled" if self.cancel_requested else "done")
+
+    def _expire(self) -> None:
+        self.timed_out = True
+        self.interrupt()
+
+    def _finish(self, status: str) -> None:
+        for stmt in self.statements:
+            if stmt.status == "pending":
+                stmt.status = "skipped"
+        self.status = status
+        self.finished_at = time.time()
+
+
+class ScriptJobs:
+    def __init__(self, workers: int, history: int):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="admin-job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, ScriptJob]" = OrderedDict()
+
+    def submit(self, script: str, timeout: float) -> ScriptJob:
+        try:
+            job = ScriptJob(script, timeout)
+        except SqlSyntaxError as e:
+            raise ValueError(str(e))
+        if not job.statements:
+            raise ValueError("empty script")
+        with self._lock:
+            self._jobs[job.id] = job
+            # si ricordano gli ultimi `history` job conclusi, più quelli in corso
+            finished = [j for j in self._jobs.values() if j.status in FINISHED]
+            for old in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[old.id]
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id: str) -> Optional[ScriptJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[ScriptJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[ScriptJob]:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.cancel_requested = True
+        job.interrupt()
+        return job
+
+    def shutdown(self) -> None:
+        for job in self.list():
+            if job.status not in FINISHED:
+                job.cancel_requested = True
+                job.interrupt()
+        self._executor.shutdown(wait=False)
+
+
+script_jobs = ScriptJobs(config.ADMIN_JOB_WORKERS, config.ADMIN_JOB_HISTORY)
@@ -1,17 +1,125 @@
-from typing import List, Tuple
-from ..db import get_connection
-
-def get_schema_rows() -> List[Tuple[str, str]]:
-    sql = """
-    SELECT table_name, column_name
-    FROM information_schema.columns
-    WHERE table_schema = DATABASE()
-    ORDER BY table_name, ordinal_position;
-    """
-    conn = get_connection()
-    try:
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import config
+from ..db import engine, read_connection
+from .guard import INTERNAL_TABLES, SqlSyntaxError, split_statements, tokenize
+
+SchemaRows = List[Tuple[str, str]]
+
+def get_schema_rows(database_name: str = config.DB_NAME) -> SchemaRows:
+    with read_connection(database_name) as conn:
+        cur = conn.cursor()
+        cur.execute(engine.SCHEMA_ROWS)
+        return [(r[0], r[1]) for r in cur.fetchall() if r[0].lower() not in INTERNAL_TABLES]
+
+def _probe(database_name: str) -> Tuple[Any, ...]:
+    # query leggera del motore che cambia quando cambia lo schema
+    with read_connection(database_name) as conn:
         cur = conn.cursor()
-        cur.execute(sql)
-        return [(r[0], r[1]) for r in cur.fetchall()]
-    finally:
-        conn.close()
+        cur.execute(engine.SCHEMA_PROBE)
+        return tuple(str(v) for v in cur.fetchone())
+
+def _etag(rows: SchemaRows) -> str:
+    digest = hashlib.sha1(json.dumps(rows).encode("utf-8")).hexdigest()[:16]
+    return f'"{digest}"'
+
+# -------- cache --------------------------------------------------------------
+
+class _Entry:
+    __slots__ = ("rows", "etag", "probe", "loaded_at", "checked_at")
+
+    def __init__(self, rows: SchemaRows, etag: str, probe: Tuple[Any, ...], now: float):
+        self.rows = rows
+        self.etag = etag
+        self.probe = probe
+        self.loaded_at = now
+        self.checked_at = now
+
+
+class SchemaCache:
+    """Schema per database, con il suo ETag. Invalidato esplicitamente dagli
+    script DDL e, per le modifiche fatte da fuori, dalla probe periodica."""
+
+    def __init__(self, probe_interval: float, max_age: float):
+        self.probe_interval = probe_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self.hits = 0
+        self.probes = 0
+        self.loads = 0
+
+    def cached(self, database_name: str) -> Optional[Tuple[SchemaRows, str]]:
+        """Risposta senza toccare il DB, se la voce è abbastanza recente."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(database_name)
+            if entry is None or now - entry.checked_at > self.probe_interval:
+                return None
+            self.hits += 1
+            return entry.rows, entry.etag
+
+    def summary(self, database_name: str) -> Tuple[SchemaRows, str]:
+        if self.max_age <= 0:
+            rows = get_schema_rows(database_name)
+            return rows, _etag(rows)
+        hit = self.cached(database_name)
+        if hit is not None:
+            return hit
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(database_name)
+        probe = _probe(database_name)
+        if entry is not None and entry.probe == probe and now - entry.loaded_at <= self.max_age:
+            with self._lock:
+                self.probes += 1
+                entry.checked_at = now
+            return entry.rows, entry.etag
+
+        rows = get_schema_rows(database_name)
+        entry = _Entry(rows, _etag(rows), probe, now)
+        with self._lock:
+            self.loads += 1
+            self._entries[database_name] = entry
+        return entry.rows, entry.etag
+
+    def invalidate(self, database_name: Optional[str] = None) -> None:
+        with self._lock:
+            if database_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(database_name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "databases": sorted(self._entries),
+                "hits": self.hits,
+                "probes": self.probes,
+                "loads": self.loads,
+            }
+
+
+schema_cache = SchemaCache(config.SCHEMA_PROBE_INTERVAL, config.SCHEMA_CACHE_MAX_AGE)
+
+_DDL = {"create", "alter", "drop", "rename"}
+
+def script_has_ddl(script: str) -> bool:
+    """True se almeno uno statement dello script è DDL (o se non si riesce a
+    capirlo: meglio un'invalidazione in più che uno schema vecchio)."""
+    try:
+        for statement in split_statements(script):
+            tokens, executable_comment = tokenize(statement)
+            if executable_comment:
+                return True
+            first = next((t for t in tokens if t.kind == "word"), None)
+            if first is not None and first.value in _DDL:
+                return True
+    except SqlSyntaxError:
+        return True
+    return False
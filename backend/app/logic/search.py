@@ -1,75 +1,157 @@
-from ..db import get_connection
-import mariadb
-import re
+from ..db import Connection, Cursor, Error, get_read_connection, with_timeout
+import json
+import base64
+import hashlib
+import time
+from .. import config, metrics
+from .guard import analyze, QueryInfo
+from .advisor import query_log
+from .workload import statement_stats
+from .cache import result_cache, table_versions, tables_in, normalize_sql, is_cacheable
 from ..models import SqlRequest, SqlResponse, Property, SqlResponseItem
-from typing import Optional, List
+from typing import Any, Dict, Iterator, Optional, List, Sequence, Tuple
 
-# Codice originario
-# def _infer_item_type(sql: str) -> str:
-#     m = re.search(r"\bfrom\s+([`\"]?)(\w+)\1\b", sql, flags=re.IGNORECASE)
-#     return (m.group(2) if m else "item")
+# -------- paginazione --------------------------------------------------------
+# Il cursor è opaco per il client: contiene l'offset della pagina successiva
+# e un'impronta della query, così non può essere riusato su un'altra query.
 
-def sqlsearch(request: SqlRequest) -> SqlResponse:
+def _query_tag(query: str) -> str:
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+
+def _encode_cursor(query: str, offset: int) -> str:
+    raw = json.dumps({"o": offset, "q": _query_tag(query)}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(query: str, cursor: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("malformed cursor")
+    if data.get("q") != _query_tag(query) or offset < 0:
+        raise ValueError("cursor does not belong to this query")
+    return offset
+
+def _page(request: SqlRequest, query: str, info: QueryInfo,
+          default_limit: bool = True) -> Tuple[Optional[int], int]:
+    limit = request.limit or (config.SQL_PAGE_SIZE if request.cursor else None)
+    if limit is None and default_limit and not info.has_limit and config.SQL_DEFAULT_LIMIT > 0:
+        # query senza LIMIT: diventa la prima pagina di SQL_DEFAULT_LIMIT righe,
+        # così il client sa dal next_cursor che il risultato è stato troncato
+        limit = config.SQL_DEFAULT_LIMIT
+    offset = _decode_cursor(query, request.cursor) if request.cursor else 0
+    return limit, offset
+
+def _statement(info: QueryInfo, limit: Optional[int], offset: int) -> str:
+    # si parte dallo statement senza commenti finali: un "-- ..." in fondo
+    # alla query si mangerebbe il LIMIT aggiunto sulla stessa riga
+    sql = info.statement
+    if limit:
+        # una riga in più per sapere se esiste una pagina successiva
+        if info.has_limit:
+            # la query ha già un suo LIMIT: la si pagina come tabella derivata
+            sql = f"SELECT * FROM ({sql}) AS _page LIMIT {limit + 1} OFFSET {offset}"
+        else:
+            sql = f"{sql} LIMIT {limit + 1} OFFSET {offset}"
+    # nessuna query può occupare il server oltre SQL_MAX_STATEMENT_TIME
+    return with_timeout(sql)
+
+def _execute_page(cur: Cursor, info: QueryInfo, limit: Optional[int], offset: int) -> int:
+    """Esegue la pagina; restituisce quante righe iniziali il chiamante deve
+    ancora scartare (più di 0 solo quando la tabella derivata non si può usare)."""
+    try:
+        cur.execute(_statement(info, limit, offset))
+        return 0
+    except Error as e:
+        if not (limit and info.has_limit and "duplicate column" in str(e).lower()):
+            raise
+    # SELECT m.idR, r.idR ... LIMIT n: una tabella derivata non ammette due
+    # colonne con lo stesso nome. La query ha già il suo LIMIT, quindi il
+    # risultato è limitato: la pagina si ritaglia leggendolo
+    cur.execute(with_timeout(info.statement))
+    return offset
+
+# -------- righe -> item ------------------------------------------------------
+
+def _to_item(column_names: Sequence[str], row: Sequence[Any]) -> SqlResponseItem:
+    properties_list: List[Property] = []
+    for col_name, value in zip(column_names, row):
+        sval = "" if value is None else str(value)
+        if col_name == "titolo":
+            # Aggiungiamo sia 'titolo' che l'alias 'name'
+            properties_list.append(Property(property_name="name", property_value=sval))
+        properties_list.append(Property(property_name=str(col_name), property_value=sval))
+    return SqlResponseItem(
+        item_type="film",  # lasciamo fisso come richiede il test
+        properties=properties_list
+    )
+
+def _run(request: SqlRequest) -> Tuple[str, Optional[List[str]], Optional[List[Sequence[Any]]], Optional[str]]:
+    """Esegue la query: (validation, colonne, righe, next_cursor).
+    Colonne e righe sono None quando la query non è valida/sicura."""
     validation = "invalid"
-    results: Optional[List[SqlResponseItem]] = None
-    query = request.sql_query.strip()
+    column_names: Optional[List[str]] = None
+    rows: Optional[List[Sequence[Any]]] = None
+    next_cursor: Optional[str] = None
+    query = request.sql_query.strip().rstrip(";").strip()
+    metrics.note(op="sql_search", query=query)
+
+    conn: Optional[Connection] = None
+    cur: Optional[Cursor] = None
+
+    info = analyze(query)
+    if info.verdict != "ok":
+        return info.verdict, None, None, None
+    try:
+        limit, offset = _page(request, query, info)
+    except ValueError:
+        return validation, None, None, None
 
-    conn: Optional[mariadb.Connection] = None
-    cur: Optional[mariadb.Cursor] = None
+    # cache: le versioni delle tabelle lette si fotografano prima di eseguire
+    cache_key = (request.database_name, normalize_sql(query), limit, offset)
+    use_cache = result_cache.enabled and is_cacheable(query)
+    if use_cache:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            metrics.note(cache="hit")
+            return cached
+        snapshot = table_versions.snapshot(tables_in(query, request.database_name))
 
     try:
-        conn = get_connection(request.database_name)
+        conn = get_read_connection(request.database_name)
+        # una replica può essere indietro rispetto alle versioni fotografate:
+        # il risultato non deve sopravvivere più del ritardo ammesso
+        ttl = config.DB_REPLICA_MAX_LAG if conn.from_replica else None
         cur = conn.cursor()
 
-        if query.lower().startswith("select"):
-            try:
-                cur.execute(query)
-
-                desc = cur.description  
-                if not desc:
-                    validation = "valid"
-                    return SqlResponse(sql_validation=validation, results=[])
-
-                column_names = [d[0] for d in desc]
-                rows = cur.fetchall()
-                """ Codice Originario
-#                item_type = _infer_item_type(query)
-#                for row in rows:
-#                    properties_list: List[Property] = []
-#                    for col_name, value in zip(column_names, row):
-#                        properties_list.append(Property(
-#                            property_name=str(col_name),
-#                            property_value="" if value is None else str(value)
-#                        ))
-#
-#                    results.append(SearchResponseItem(
-#                        item_type=item_type,
-#                        properties_list
-#                    ))
-                """
-                results = []
-                for row in rows:
-                    properties_list: List[Property] = []
-                    for col_name, value in zip(column_names, row):
-                        sval = "" if value is None else str(value)
-                        if col_name == "titolo":
-                # Aggiungiamo sia 'titolo' che l'alias 'name'
-                            properties_list.append(Property(property_name="name", property_value=sval))
-                        properties_list.append(Property(property_name=str(col_name), property_value=sval))
-    
-                    results.append(SqlResponseItem(
-                        item_type="film",  # lasciamo fisso come richiede il test
-                        properties=properties_list
-                    ))
-                validation = "valid"
-
-            except mariadb.Error:
-                validation = "invalid"
-        else:
-            validation = "unsafe"
+        started = time.perf_counter()
+        try:
+            with metrics.phase("execute"):
+                skip = _execute_page(cur, info, limit, offset)
+
+            desc = cur.description
+            if not desc:
+                statement_stats.record(request.database_name, query, time.perf_counter() - started)
+                return "valid", [], [], None
 
-    except mariadb.Error:
-        return SqlResponse(sql_validation=validation, results=results)
+            column_names = [d[0] for d in desc]
+            with metrics.phase("fetch"):
+                rows = cur.fetchall()[skip:]
+            if limit and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = _encode_cursor(query, offset + limit)
+            validation = "valid"
+            elapsed = time.perf_counter() - started
+            query_log.record(request.database_name, query, elapsed)
+            statement_stats.record(request.database_name, query, elapsed, len(rows))
+
+        except Error:
+            statement_stats.record(request.database_name, query, time.perf_counter() - started, error=True)
+            validation = "invalid"
+            column_names, rows = None, None
+
+    except Error:
+        return validation, None, None, None
 
     finally:
         if cur is not None:
@@ -83,10 +165,105 @@ def sqlsearch(request: SqlRequest) -> SqlResponse:
             except Exception:
                 pass
 
-    return SqlResponse(sql_validation=validation, results=results)
+    metrics.rows(len(rows) if rows is not None else 0)
+    if use_cache and validation == "valid":
+        result_cache.put(cache_key, (validation, column_names, rows, next_cursor), snapshot, len(rows), ttl)
+    return validation, column_names, rows, next_cursor
+
+def sqlsearch(request: SqlRequest) -> SqlResponse:
+    validation, column_names, rows, next_cursor = _run(request)
+    results: Optional[List[SqlResponseItem]] = None
+    if rows is not None:
+        with metrics.phase("build"):
+            results = [_to_item(column_names, row) for row in rows]
+    return SqlResponse(sql_validation=validation, results=results, next_cursor=next_cursor)
+
+def sqlsearch_columnar(request: SqlRequest) -> Dict[str, Any]:
+    """Formato compatto: nomi di colonna una sola volta, righe come array di
+    valori con il loro tipo nativo (nessun Property, nessun alias 'name')."""
+    validation, column_names, rows, next_cursor = _run(request)
+    return {
+        "sql_validation": validation,
+        "columns": column_names,
+        "rows": rows,
+        "next_cursor": next_cursor,
+    }
 
+# -------- streaming ----------------------------------------------------------
 
+def _ndjson(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+def sqlsearch_stream(request: SqlRequest) -> Iterator[str]:
+    """Versione in streaming di sqlsearch: una riga NDJSON di intestazione
+    ({"sql_validation", "columns"}), un SqlResponseItem per riga del risultato
+    e una riga finale {"done", "rows", "next_cursor"}. Le righe vengono lette
+    con un cursore non bufferizzato, quindi la memoria resta limitata."""
+    query = request.sql_query.strip().rstrip(";").strip()
+    metrics.note(op="sql_search", query=query)
+    info = analyze(query)
+    if info.verdict != "ok":
+        yield _ndjson({"sql_validation": info.verdict, "results": None})
+        return
+    try:
+        # nessun LIMIT di default: lo streaming esiste proprio per i risultati
+        # grandi, la memoria è già limitata e vale comunque max_statement_time
+        limit, offset = _page(request, query, info, default_limit=False)
+    except ValueError:
+        yield _ndjson({"sql_validation": "invalid", "results": None})
+        return
 
+    try:
+        conn = get_read_connection(request.database_name)
+    except Error:
+        yield _ndjson({"sql_validation": "invalid", "results": None})
+        return
 
+    try:
+        cur = conn.cursor(buffered=False)
+        started = time.perf_counter()
+        try:
+            with metrics.phase("execute"):
+                skip = _execute_page(cur, info, limit, offset)
+        except Error:
+            statement_stats.record(request.database_name, query, time.perf_counter() - started, error=True)
+            yield _ndjson({"sql_validation": "invalid", "results": None})
+            return
 
+        column_names = [d[0] for d in (cur.description or [])]
+        yield _ndjson({"sql_validation": "valid", "columns": column_names})
+        if not column_names:
+            statement_stats.record(request.database_name, query, time.perf_counter() - started)
+            yield _ndjson({"done": True, "rows": 0, "next_cursor": None})
+            return
 
+        sent = 0
+        next_cursor: Optional[str] = None
+        try:
+            while True:
+                with metrics.phase("fetch"):
+                    rows = cur.fetchmany(config.SQL_STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if skip:
+                        skip -= 1
+                        continue
+                    if limit and sent == limit:
+                        # riga in più: esiste una pagina successiva
+                        next_cursor = _encode_cursor(query, offset + limit)
+                        break
+                    sent += 1
+                    yield _ndjson(_to_item(column_names, row).model_dump())
+                if next_cursor:
+                    break
+        except Error as e:
+            statement_stats.record(request.database_name, query, time.perf_counter() - started, sent, error=True)
+            yield _ndjson({"error": str(e)})
+            return
+        # il tempo comprende l'invio al client: con lo streaming le righe si leggono man mano
+        statement_stats.record(request.database_name, query, time.perf_counter() - started, sent)
+        metrics.rows(sent)
+        yield _ndjson({"done": True, "rows": sent, "next_cursor": next_cursor})
+    finally:
+        conn.close()
@@ -0,0 +1,378 @@
+import bisect
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .. import config
+from ..db import Error, connection
+
+logger = logging.getLogger("app.textsearch")
+
+# -------- normalizzazione e trigrammi ----------------------------------------
+# Come pg_trgm: minuscole, accenti tolti, parole separate da ciò che non è
+# lettera o cifra; ogni parola è completata con due spazi davanti e uno
+# dietro prima di estrarne i trigrammi.
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+_WORD_SIMILARITY = 0.3      # soglia per considerare simili due parole (default di pg_trgm)
+_WORD_VARIANTS = 20         # parole simili tenute per ogni parola della query
+_KINDS = ("film", "regista")
+
+
+def normalize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [w for w in _NON_WORD.split(text) if w]
+
+
+def trigrams(words: Iterable[str]) -> Set[str]:
+    grams: Set[str] = set()
+    for w in words:
+        padded = f"  {w} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# -------- indice -------------------------------------------------------------
+# Due livelli: parola -> documenti (per tipo) e, sul vocabolario, trigramma ->
+# parole. La ricerca fuzzy trova prima le parole simili a quelle della query
+# (poche, anche con milioni di titoli), poi i documenti che le contengono; i
+# prefissi sono un intervallo della lista ordinata delle parole. Le liste
+# troppo lunghe (trigrammi comunissimi, parole in metà dei titoli) sono
+# limitate a max_candidates: oltre, la query non è abbastanza selettiva e si
+# restituiscono i migliori fra i primi candidati.
+
+class _Doc:
+    __slots__ = ("kind", "key", "text", "words", "anno", "idR")
+
+    def __init__(self, kind: str, key: int, text: str, anno: Optional[int] = None, idR: Optional[int] = None):
+        self.kind = kind            # "film" | "regista"
+        self.key = key              # idF | idR
+        self.text = text
+        self.words = normalize(text)
+        self.anno = anno
+        self.idR = idR
+
+
+class TrigramIndex:
+    """Titoli dei film e nomi dei registi di un database, con le posting list
+    parola -> documenti e trigramma -> parole. Le ricerche non toccano il DB."""
+
+    def __init__(self, database_name: str, max_candidates: int):
+        self.database_name = database_name
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        self._docs: List[Optional[_Doc]] = []
+        self._ids: Dict[Tuple[str, int], int] = {}      # (kind, key) -> posizione in _docs
+        self._postings: Dict[str, Dict[str, List[int]]] = {kind: {} for kind in _KINDS}
+        self._terms: List[str] = []                     # vocabolario ordinato, per i prefissi
+        self._grams: Dict[str, List[str]] = {}          # trigramma -> parole del vocabolario
+        self._loading = False                           # build: _terms si ordina alla fine
+        self.built_at = 0.0
+        self.build_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def put(self, doc: _Doc) -> None:
+        with self._lock:
+            self._put(doc)
+
+    def _put(self, doc: _Doc) -> None:
+        postings = self._postings[doc.kind]
+        pos = self._ids.get((doc.kind, doc.key))
+        if pos is not None:
+            old = self._docs[pos]
+            if old.words == doc.words:
+                self._docs[pos] = doc   # stesso testo: cambiano solo anno/regista
+                return
+            for w in set(old.words):
+                postings[w].remove(pos)
+        else:
+            pos = len(self._docs)
+            self._docs.append(None)
+            self._ids[(doc.kind, doc.key)] = pos
+        self._docs[pos] = doc
+        for w in set(doc.words):
+            docs = postings.get(w)
+            if docs is None:
+                docs = postings[w] = []
+                if not any(w in p for p in self._postings.values() if p is not postings):
+                    self._add_term(w)
+            docs.append(pos)
+
+    def _add_term(self, word: str) -> None:
+        if self._loading:
+            self._terms.append(word)
+        else:
+            bisect.insort(self._terms, word)
+        if not word.isdigit():      # i numeri si cercano solo esatti o per prefisso
+            for g in trigrams((word,)):
+                self._grams.setdefault(g, []).append(word)
+
+    def _doc_count(self, word: str, kinds: Tuple[str, ...]) -> int:
+        return sum(len(self._postings[k].get(word, ())) for k in kinds)
+
+    def _similar(self, word: str, kinds: Tuple[str, ...]) -> Dict[str, float]:
+        """Parole del vocabolario simili a `word` (Jaccard sui trigrammi), con
+        la quota dei trigrammi di `word` che contengono."""
+        found = {word: 1.0} if self._doc_count(word, kinds) else {}
+        if word.isdigit():
+            return found
+        wanted = trigrams((word,))
+        counts: Dict[str, int] = {}
+        for g in wanted:
+            words = self._grams.get(g, ())
+            if len(words) > self.max_candidates:
+                continue    # trigramma troppo comune: conta come non condiviso
+            for w in words:
+                counts[w] = counts.get(w, 0) + 1
+        scored = []
+        for w, shared in counts.items():
+            # le parole senza ripetizioni hanno len + 1 trigrammi
+            if shared / (len(wanted) + len(w) + 1 - shared) >= _WORD_SIMILARITY and w != word \
+                    and self._doc_count(w, kinds):
+                scored.append((shared, -len(w), w))
+        scored.sort(reverse=True)
+        found.update((w, shared / len(wanted)) for shared, _, w in scored[:_WORD_VARIANTS])
+        return found
+
+    def _regista(self, idR: Optional[int]) -> Optional[str]:
+        pos = self._ids.get(("regista", idR)) if idR is not None else None
+        return self._docs[pos].text if pos is not None else None
+
+    def _hit(self, doc: _Doc, score: float) -> Dict[str, Any]:
+        hit: Dict[str, Any] = {"type": doc.kind, "id": doc.key, "text": doc.text, "score": round(score, 4)}
+        if doc.kind == "film":
+            hit["anno"] = doc.anno
+            hit["regista"] = self._regista(doc.idR)
+        return hit
+
+    def fuzzy(self, query: str, kind: Optional[str], limit: int, min_similarity: float) -> List[Dict[str, Any]]:
+        """Documenti che contengono almeno `min_similarity` dei trigrammi della
+        query, cercati parola per parola, dal più simile. Tollera errori di
+        battitura e parole mancanti."""
+        words = list(dict.fromkeys(normalize(query)))
+        if not words:
+            return []
+        kinds = (kind,) if kind else _KINDS
+        weights = [len(trigrams((w,))) for w in words]
+        needed = min_similarity * sum(weights)
+        with self._lock:
+            variants = [self._similar(w, kinds) for w in words]
+            # un documento che arriva a `needed` contiene per forza una delle
+            # parole più rare, finché le altre da sole non ci arrivano
+            order = sorted(range(len(words)), key=lambda i: sum(self._doc_count(w, kinds) for w in variants[i]))
+            rest = sum(weights)
+            candidates: Set[int] = set()
+            for i in order:
+                if rest < needed:
+                    break
+                rest -= weights[i]
+                similar = variants[i]
+                for w in sorted(similar, key=similar.get, reverse=True):
+                    for k in kinds:
+                        room = self.max_candidates - len(candidates)
+                        if room > 0:
+                            candidates.update(self._postings[k].get(w, ())[:room])
+            scored = []
+            for pos in candidates:
+                doc = self._docs[pos]
+                shared = 0.0
+                for similar, weight in zip(variants, weights):
+                    shared += weight * max([similar.get(dw, 0.0) for dw in doc.words])
+                if shared >= needed:
+                    scored.append((-shared, len(doc.words), doc.text, doc))
+            scored.sort(key=lambda s: s[:3])
+            return [self._hit(doc, -shared / sum(weights)) for shared, _, _, doc in scored[:limit]]
+
+    def _term_range(self, prefix: str) -> Tuple[int, int]:
+        # le parole sono fatte di [0-9a-z]: "{" viene dopo ogni loro continuazione
+        return bisect.bisect_left(self._terms, prefix), bisect.bisect_left(self._terms, prefix + "{")
+
+    def prefix(self, query: str, kind: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Autocompletamento: ogni parola della query è l'inizio di una parola
+        del documento. Prima i documenti che iniziano con la query, poi i più corti."""
+        words = normalize(query)
+        if not words:
+            return []
+        kinds = (kind,) if kind else _KINDS
+        with self._lock:
+            # i candidati vengono dalla parola con meno documenti; il conteggio
+            # si ferma a max_candidates, che sono comunque il massimo letto
+            best: Optional[Tuple[int, int, int, str]] = None
+            for w in set(words):
+                lo, hi = self._term_range(w)
+                count = 0
+                for i in range(lo, hi):
+                    count += self._doc_count(self._terms[i], kinds)
+                    if count >= self.max_candidates:
+                        break
+                if best is None or count < best[0]:
+                    best = (count, lo, hi, w)
+            _, lo, hi, first = best
+            others = [w for w in words if w != first]
+            candidates: List[int] = []
+            for i in range(lo, hi):
+                for k in kinds:
+                    candidates.extend(self._postings[k].get(self._terms[i], ()))
+                if len(candidates) >= self.max_candidates:
+                    break
+            scored = []
+            for pos in set(candidates[:self.max_candidates]):
+                doc = self._docs[pos]
+                if others and not all(any(dw.startswith(w) for dw in doc.words) for w in others):
+                    continue
+                leading = doc.words[:len(words) - 1] == words[:-1] and \
+                    len(doc.words) >= len(words) and doc.words[len(words) - 1].startswith(words[-1])
+                scored.append((not leading, len(doc.text), doc.text, doc))
+            scored.sort(key=lambda s: s[:3])
+            return [self._hit(doc, 1.0 if not rest else 0.5) for rest, _, _, doc in scored[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            films = sum(1 for kind, _ in self._ids if kind == "film")
+            return {
+                "database_name": self.database_name,
+                "films": films,
+                "registi": len(self._ids) - films,
+                "words": len(self._terms),
+                "trigrams": len(self._grams),
+                "built_at": self.built_at,
+                "build_seconds": round(self.build_seconds, 3),
+            }
+
+
+def build(database_name: str) -> TrigramIndex:
+    index = TrigramIndex(database_name, config.TEXT_SEARCH_MAX_CANDIDATES)
+    started = time.perf_counter()
+    index._loading = True
+    with connection(database_name) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT idR, nome FROM regista")
+        for rows in iter(lambda: cur.fetchmany(config.SQL_STREAM_FETCH_SIZE), []):
+            for idR, nome in rows:
+                index._put(_Doc("regista", idR, nome))
+        cur.execute("SELECT idF, titolo, anno, idR FROM movies")
+        for rows in iter(lambda: cur.fetchmany(config.SQL_STREAM_FETCH_SIZE), []):
+            for idF, titolo, anno, idR in rows:
+                index._put(_Doc("film", idF, titolo, anno, idR))
+    index._terms.sort()
+    index._loading = False
+    index.build_seconds = time.perf_counter() - started
+    index.built_at = time.time()
+    return index
+
+# -------- indici per database ------------------------------------------------
+# Costruiti alla prima ricerca e aggiornati da add_line dopo il commit. Le
+# scritture che non passano da add (seed, script di amministrazione, altri
+# processi) si vedono alla ricostruzione, fatta in background quando l'indice
+# supera TEXT_INDEX_MAX_AGE secondi: nel frattempo si usa quello vecchio, e le
+# righe aggiunte durante la ricostruzione vengono riapplicate al nuovo. Le
+# ricostruzioni leggono dal DB: le avvia il chiamante, dentro db_limiter.
+
+class RebuildInProgress(Exception):
+    """L'indice del database è già in ricostruzione."""
+
+
+class TextIndexes:
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, TrigramIndex] = {}
+        self._building: Dict[str, List[_Doc]] = {}   # database -> righe arrivate durante la build
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, database_name: str) -> Optional[TrigramIndex]:
+        """L'indice pronto, o None se va ancora costruito (con load)."""
+        with self._lock:
+            return self._indexes.get(database_name)
+
+    def stale(self, database_name: str) -> bool:
+        """L'indice c'è, ha più di max_age secondi e nessuno lo sta ricostruendo."""
+        with self._lock:
+            index = self._indexes.get(database_name)
+            return (index is not None and self.max_age > 0 and database_name not in self._building
+                    and time.time() - index.built_at > self.max_age)
+
+    def load(self, database_name: str) -> TrigramIndex:
+        """Costruisce l'indice se manca (una sola build per database alla volta)."""
+        with self._lock:
+            lock = self._build_locks.setdefault(database_name, threading.Lock())
+        with lock:
+            index = self._indexes.get(database_name)
+            if index is not None:
+                return index
+            with self._lock:
+                self._building.setdefault(database_name, [])
+            return self._build(database_name)
+
+    def rebuild(self, database_name: str) -> TrigramIndex:
+        """Ricostruisce l'indice; RebuildInProgress se una ricostruzione è già in corso."""
+        with self._lock:
+            if database_name in self._building:
+                raise RebuildInProgress(database_name)
+            self._building[database_name] = []
+        return self._build(database_name)
+
+    def _build(self, database_name: str) -> TrigramIndex:
+        try:
+            index = build(database_name)
+        except Error:
+            with self._lock:
+                self._building.pop(database_name, None)
+            raise
+        with self._lock:
+            # le righe arrivate nel frattempo potrebbero mancare nella lettura
+            for doc in self._building.pop(database_name, []):
+                index.put(doc)
+            self._indexes[database_name] = index
+        logger.info("text index for %s: %d documents in %.2fs", database_name, len(index), index.build_seconds)
+        return index
+
+    def refresh(self, database_name: str) -> None:
+        """rebuild per l'indice scaduto: gli errori finiscono nel log."""
+        try:
+            self.rebuild(database_name)
+        except RebuildInProgress:
+            pass
+        except Error as e:
+            with self._lock:
+                index = self._indexes.get(database_name)
+                if index is not None:
+                    index.built_at = time.time()   # si riprova fra max_age secondi
+            logger.warning("text index for %s: rebuild failed: %s", database_name, e)
+
+    def note_films(self, database_name: str, films: Iterable[Tuple[int, str, int, int, str]]) -> None:
+        """Film scritti da add (idF, titolo, anno, idR, regista), dopo il commit."""
+        docs: List[_Doc] = []
+        for idF, titolo, anno, idR, regista in films:
+            docs.append(_Doc("regista", idR, regista))
+            docs.append(_Doc("film", idF, titolo, anno, idR))
+        with self._lock:
+            index = self._indexes.get(database_name)
+            pending = self._building.get(database_name)
+            if pending is not None:
+                pending.extend(docs)
+            if index is not None:
+                for doc in docs:
+                    index.put(doc)
+
+    def drop(self, database_name: Optional[str] = None) -> None:
+        with self._lock:
+            if database_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(database_name, None)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return [index.stats() for index in indexes]
+
+
+text_indexes = TextIndexes(config.TEXT_INDEX_MAX_AGE)
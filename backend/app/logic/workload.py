@@ -0,0 +1,147 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import config
+from .guard import fingerprint
+
+# -------- statistiche per fingerprint ----------------------------------------
+# Come pg_stat_statements: per ogni (database, fingerprint) chiamate, errori,
+# righe e tempi. Le latenze vanno in bucket logaritmici (5% di ampiezza), da
+# cui si stimano i percentili con memoria costante per fingerprint.
+
+_BUCKET_BASE = 1.05
+_BUCKET_MIN = 1e-6   # 1 µs
+
+
+def _bucket(seconds: float) -> int:
+    return max(0, int(math.log(max(seconds, _BUCKET_MIN) / _BUCKET_MIN, _BUCKET_BASE)))
+
+
+def _bucket_upper(index: int) -> float:
+    return _BUCKET_MIN * _BUCKET_BASE ** (index + 1)
+
+
+class _Entry:
+    __slots__ = ("query", "calls", "errors", "rows", "total", "min", "max", "buckets", "first_seen", "last_seen")
+
+    def __init__(self, query: str):
+        self.query = query          # primo esempio, per leggere il fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets: Dict[int, int] = {}
+        self.first_seen = self.last_seen = time.time()
+
+    def percentile(self, p: float) -> float:
+        rank = math.ceil(p / 100 * self.calls)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+
+class StatementStats:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self.evicted = 0
+        self.reset_at = time.time()
+
+    def record(self, database_name: str, query: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (database_name, fingerprint(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    self._evict()
+                entry = self._entries[key] = _Entry(query[:config.SLOW_LOG_MAX_QUERY])
+            entry.calls += 1
+            entry.last_seen = time.time()
+            if error:
+                entry.errors += 1
+            entry.rows += rows
+            entry.total += seconds
+            entry.min = min(entry.min, seconds)
+            entry.max = max(entry.max, seconds)
+            b = _bucket(seconds)
+            entry.buckets[b] = entry.buckets.get(b, 0) + 1
+
+    def _evict(self) -> None:
+        # pieno: via il 5% dei fingerprint meno chiamati, in un colpo solo
+        victims = sorted(self._entries.items(), key=lambda kv: (kv[1].calls, kv[1].last_seen))
+        for key, _ in victims[:max(1, len(victims) // 20)]:
+            del self._entries[key]
+            self.evicted += 1
+
+    @staticmethod
+    def _row(key: Tuple[str, str], e: _Entry) -> Dict[str, Any]:
+        ms = lambda v: round(v * 1000, 3)
+        return {
+            "database_name": key[0],
+            "fingerprint_id": hashlib.sha1(key[1].encode("utf-8")).hexdigest()[:16],
+            "fingerprint": key[1],
+            "example": e.query,
+            "calls": e.calls,
+            "errors": e.errors,
+            "rows": e.rows,
+            "total_ms": ms(e.total),
+            "mean_ms": ms(e.total / e.calls),
+            "min_ms": ms(e.min),
+            "max_ms": ms(e.max),
+            "p50_ms": ms(e.percentile(50)),
+            "p99_ms": ms(e.percentile(99)),
+            "first_seen": e.first_seen,
+            "last_seen": e.last_seen,
+        }
+
+    def top(self, n: int, order_by: str = "total_ms", database_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [self._row(k, e) for k, e in self._entries.items()
+                    if database_name is None or k[0] == database_name]
+        rows.sort(key=lambda r: r[order_by], reverse=True)
+        return rows[:n]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "fingerprints": len(self._entries),
+                "max_fingerprints": self.max_entries,
+                "evicted": self.evicted,
+                "calls": sum(e.calls for e in self._entries.values()),
+                "reset_at": self.reset_at,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.evicted = 0
+            self.reset_at = time.time()
+
+    def snapshot(self, directory: str) -> str:
+        """Scrive tutte le statistiche in un file JSON nuovo; ne restituisce il percorso."""
+        now = time.time()
+        data = dict(self.summary(), taken_at=now, statements=self.top(self.max_entries))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("workload-%Y%m%d-%H%M%S", time.localtime(now))
+                            + f"-{int(now * 1000) % 1000:03d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        return path
+
+
+statement_stats = StatementStats(config.WORKLOAD_MAX_FINGERPRINTS)
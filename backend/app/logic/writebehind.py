@@ -0,0 +1,277 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .. import config
+from ..db import Error
+from ..limiter import Overloaded, db_limiter
+from .add import _parse_data_line, add_lines
+
+logger = logging.getLogger("app.writebehind")
+
+# -------- log append-only ----------------------------------------------------
+# Una data_line per riga (stringa JSON). Accanto al log, nel file .offset, c'è
+# l'offset fino a cui le righe sono state applicate al DB: all'avvio si
+# riparte da lì. Una riga applicata e non ancora registrata nell'offset viene
+# riapplicata dopo un crash, senza effetti: add_line è un upsert.
+
+class AddLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file: Optional[Any] = None
+        self.end = 0        # byte scritti
+        self.synced = 0     # byte con fsync
+        self.flushed = 0    # byte applicati al DB
+        self.generation = 0  # cresce a ogni svuotamento: gli offset ripartono da 0
+
+    def open(self) -> List[Tuple[int, str]]:
+        """Apre il log e restituisce le righe non ancora applicate: (offset di fine, data_line)."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        flushed = self._read_offset()
+        pending: List[Tuple[int, str]] = []
+        with open(self.path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if flushed > size:
+                flushed = 0   # crash durante la compattazione
+            f.seek(flushed)
+            end = flushed
+            for record in f:
+                if not record.endswith(b"\n"):
+                    break     # scrittura interrotta a metà: la risposta non era partita
+                end += len(record)
+                try:
+                    pending.append((end, json.loads(record)))
+                except ValueError:
+                    logger.warning("add log: skipping corrupt record ending at offset %d", end)
+            if end < size:
+                logger.warning("add log: dropping %d bytes of truncated data at offset %d", size - end, end)
+                f.truncate(end)
+        self._file = open(self.path, "ab")
+        self.end = self.synced = end
+        self.flushed = flushed
+        return pending
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_path, "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+
+    def append(self, data_line: str) -> int:
+        record = (json.dumps(data_line) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(record)
+            self._file.flush()
+            self.end += len(record)
+            return self.end
+
+    def sync(self, offset: int) -> None:
+        """fsync fino ad almeno `offset`. Chi aspetta il lock trova spesso il
+        proprio record già coperto dall'fsync di un altro (fsync di gruppo)."""
+        with self._sync_lock:
+            with self._lock:
+                if self.synced >= offset:
+                    return
+                target, generation = self.end, self.generation
+            os.fsync(self._file.fileno())
+            with self._lock:
+                # svuotato nel frattempo: target è un offset del log vecchio
+                if self.generation == generation:
+                    self.synced = max(self.synced, target)
+
+    def checkpoint(self, offset: int) -> None:
+        with self._lock:
+            if offset == self.end:
+                # tutto applicato: il log si svuota invece di crescere all'infinito
+                self._file.truncate(0)
+                offset = self.end = self.synced = 0
+                self.generation += 1
+            self._write_offset(offset)
+            self.flushed = offset
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# -------- righe scartate -----------------------------------------------------
+# Una riga già confermata al client che il DB rifiuta (vincoli, dati fuori
+# range...) non può tornare indietro: finisce qui, un oggetto JSON per riga,
+# con fsync prima che il checkpoint la tolga dal log.
+
+class RejectedLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.lines = 0
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        try:
+            with open(self.path, "rb") as f:
+                self.lines = sum(1 for _ in f)
+        except FileNotFoundError:
+            self.lines = 0
+
+    def write(self, rejected: List[Dict[str, Any]]) -> None:
+        with open(self.path, "ab") as f:
+            for entry in rejected:
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines += len(rejected)
+
+# -------- coda e worker ------------------------------------------------------
+
+class WriteBehindQueue:
+    """/add in write-behind: la riga viene validata, scritta nel log e messa in
+    coda; il worker la applica con add_lines in transazioni di al massimo
+    flush_size righe, al più tardi dopo flush_interval secondi."""
+
+    def __init__(self, path: str, rejected_path: str, flush_size: int, flush_interval: float, max_queue: int):
+        self.log = AddLog(path)
+        self.rejected = RejectedLog(rejected_path)
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Deque[Tuple[int, str]] = collections.deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._stopping = False
+        self.running = False
+        self.replayed = 0
+        self.applied = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        pending = await loop.run_in_executor(None, self.log.open)
+        await loop.run_in_executor(None, self.rejected.open)
+        self._queue.extend(pending)
+        self.replayed = len(pending)
+        if pending:
+            logger.warning("add log: replaying %d unflushed lines", len(pending))
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.ensure_future(self._run())
+        self.running = True
+
+    async def stop(self, timeout: float) -> None:
+        """Prova a svuotare la coda entro `timeout`; il resto riparte dal log."""
+        if self._task is None:
+            return
+        self.running = False
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("add log: %d lines left for replay at shutdown", len(self._queue))
+        self._task = None
+        self.log.close()
+
+    async def submit(self, data_line: str) -> None:
+        _parse_data_line(data_line)   # ValueError -> 422, prima di scrivere nel log
+        if len(self._queue) >= self.max_queue:
+            raise Overloaded("write-behind queue is full", config.DB_RETRY_AFTER)
+        # write + enqueue nel thread dell'event loop: l'ordine della coda è
+        # quello del log, così l'offset registrato cresce sempre
+        end = self.log.append(data_line)
+        self._queue.append((end, data_line))
+        if len(self._queue) >= self.flush_size:
+            self._wakeup.set()
+        if config.ADD_LOG_FSYNC:
+            await asyncio.get_running_loop().run_in_executor(None, self.log.sync, end)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if len(self._queue) < self.flush_size and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            while self._queue:
+                batch = [self._queue[i] for i in range(min(len(self._queue), self.flush_size))]
+                try:
+                    results = await db_limiter.run(add_lines, [line for _, line in batch], 1, True)
+                except Overloaded as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Error as e:
+                    # DB non raggiungibile o transazione fallita: le righe restano in coda
+                    self.last_error = str(e)
+                    logger.warning("add log: flush of %d lines failed: %s", len(batch), e)
+                    if self._stopping:
+                        return
+                    await asyncio.sleep(config.DB_RETRY_AFTER)
+                    continue
+                rejected = []
+                for (end, line), result in zip(batch, results):
+                    if result["status"] != "ok":
+                        # errore della riga (vincoli...): riprovare non servirebbe
+                        logger.warning("add log: line at offset %d rejected: %s (%r)", end, result["error"], line)
+                        rejected.append({"data_line": line, "error": result["error"], "rejected_at": time.time()})
+                if rejected:
+                    try:
+                        await loop.run_in_executor(None, self.rejected.write, rejected)
+                    except OSError as e:
+                        # senza il file le righe restano nel log (e vengono riapplicate)
+                        self.last_error = f"rejected log: {e}"
+                        logger.error("add log: cannot write %s: %s", self.rejected.path, e)
+                        if self._stopping:
+                            return
+                        await asyncio.sleep(config.DB_RETRY_AFTER)
+                        continue
+                    self.failed += len(rejected)
+                for _ in batch:
+                    self._queue.popleft()
+                self.applied += sum(1 for r in results if r["status"] == "ok")
+                self.batches += 1
+                self.last_flush = time.time()
+                await loop.run_in_executor(None, self.log.checkpoint, batch[-1][0])
+            if self._stopping:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "depth": len(self._queue),
+            "log_offset": self.log.end,
+            "synced_offset": self.log.synced,
+            "flushed_offset": self.log.flushed,
+            "replayed": self.replayed,
+            "applied": self.applied,
+            "failed": self.failed,
+            "rejected_path": self.rejected.path,
+            "rejected_lines": self.rejected.lines,
+            "batches": self.batches,
+            "last_flush": self.last_flush,
+            "last_error": self.last_error,
+        }
+
+
+write_behind = WriteBehindQueue(
+    config.ADD_LOG_PATH, config.ADD_REJECTED_PATH,
+    config.ADD_FLUSH_SIZE, config.ADD_FLUSH_INTERVAL, config.ADD_QUEUE_MAX,
+)
@@ -1,12 +1,48 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from . import config
+from .limiter import Overloaded
+from .logic.jobs import script_jobs
+from .logic.writebehind import write_behind
+from .metrics import MetricsMiddleware
 from .api.health_endpoint import router as health_router
 from .api.schema_endpoint import router as schema_router
 from .api.add_endpoints import router as add_router
 from .api.search_endpoints import router as search_router
+from .api.admin_endpoint import router as admin_router
+from .api.metrics_endpoint import router as metrics_router
 
-app = FastAPI(title="Esonero Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if config.ADD_WRITE_BEHIND:
+        # riapplica le righe del log rimaste in sospeso prima di servire richieste
+        await write_behind.start()
+    try:
+        yield
+    finally:
+        await write_behind.stop(config.DB_POOL_TIMEOUT)
+        # gli script ancora in corso vengono interrotti (KILL QUERY)
+        script_jobs.shutdown()
+
+app = FastAPI(title="Esonero Backend", lifespan=lifespan)
 
 app.include_router(health_router)
 app.include_router(schema_router)
 app.include_router(add_router)
 app.include_router(search_router)
+if config.ADMIN_API_ENABLED:
+    app.include_router(admin_router)
+app.include_router(metrics_router)
+
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    # meglio un rifiuto immediato che una coda invisibile: il client riprova
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": f"{max(1, round(exc.retry_after))}"},
+    )
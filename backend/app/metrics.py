@@ -0,0 +1,217 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import config
+
+logger = logging.getLogger("app.slow")
+
+# -------- metriche -----------------------------------------------------------
+# Formato di esposizione testuale di Prometheus, senza dipendenze esterne.
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (256, 1024, 4096, 16_384, 65_536, 262_144, 1_048_576, 4_194_304, 16_777_216)
+
+
+def _labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = labels + ((extra,) if extra else ())
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _num(value: float) -> str:
+    return "+Inf" if value == float("inf") else f"{value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # etichette -> (conteggi per bucket, somma, numero di osservazioni)
+        self._series: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                yield f"{self.name}_bucket{_labels(labels, ('le', _num(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(labels, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_labels(labels)} {total:g}"
+            yield f"{self.name}_count{_labels(labels)} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(labels)} {value:g}"
+
+
+PHASE_SECONDS = Histogram(
+    "sqlbench_phase_seconds", "Time spent per phase (acquire, connect, execute, fetch, build, serialize, commit).",
+    LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "sqlbench_request_seconds", "HTTP request latency.", LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    "sqlbench_response_bytes", "HTTP response body size.", BYTES_BUCKETS)
+ROWS = Histogram(
+    "sqlbench_rows", "Rows returned (sql_search) or written (add).", SIZE_BUCKETS)
+SLOW_REQUESTS = Counter(
+    "sqlbench_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.")
+
+_METRICS = [PHASE_SECONDS, REQUEST_SECONDS, RESPONSE_BYTES, ROWS, SLOW_REQUESTS]
+# metriche lette al momento dello scrape: (nome, help, funzione -> [(etichette, valore)])
+_GAUGES: List[Tuple[str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+
+def register_gauge(name: str, help: str, collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+    _GAUGES.append((name, help, collect))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.expose())
+    for name, help, collect in _GAUGES:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in collect():
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+# -------- fasi della richiesta -----------------------------------------------
+# La richiesta corrente ha un dict in una contextvar: le fasi vi sommano i
+# propri tempi. Il dict è condiviso anche con i thread dell'executor (vi
+# arriva una copia del contesto, ma l'oggetto è lo stesso).
+
+_current: "contextvars.ContextVar[Optional[Dict[str, Any]]]" = contextvars.ContextVar("metrics_request", default=None)
+
+
+def note(**info: Any) -> None:
+    """Informazioni per lo slow log della richiesta corrente (op=..., query=...).
+    'op' diventa anche l'etichetta delle fasi registrate dopo."""
+    current = _current.get()
+    if current is not None:
+        current["info"].update(info)
+
+
+def _op() -> str:
+    current = _current.get()
+    return current["info"].get("op", "other") if current is not None else "other"
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=name, op=_op())
+        current = _current.get()
+        if current is not None:
+            phases = current["phases"]
+            phases[name] = phases.get(name, 0.0) + elapsed
+
+
+def rows(count: int) -> None:
+    ROWS.observe(count, op=_op())
+    note(rows=count)
+
+# -------- middleware ASGI ----------------------------------------------------
+
+class MetricsMiddleware:
+    """Durata e byte di ogni risposta (anche in streaming) per route, e slow log."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state: Dict[str, Any] = {"phases": {}, "info": {}}
+        token = _current.set(state)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            if path != "/metrics":
+                labels = {"method": scope["method"], "path": path, "status": str(status)}
+                REQUEST_SECONDS.observe(elapsed, **labels)
+                RESPONSE_BYTES.observe(size, method=scope["method"], path=path)
+            if 0 < config.SLOW_REQUEST_SECONDS <= elapsed:
+                SLOW_REQUESTS.inc(method=scope["method"], path=path)
+                _log_slow(scope["method"], path, status, elapsed, size, state)
+
+
+def _log_slow(method: str, path: str, status: int, elapsed: float, size: int, state: Dict[str, Any]) -> None:
+    phases = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in sorted(state["phases"].items()))
+    info = dict(state["info"])
+    query = info.pop("query", None)
+    if query is not None and len(query) > config.SLOW_LOG_MAX_QUERY:
+        query = query[:config.SLOW_LOG_MAX_QUERY] + "..."
+    extra = " ".join(f"{k}={v}" for k, v in sorted(info.items()))
+    logger.warning(
+        "slow request %s %s status=%s %.1fms bytes=%d %s %s%s",
+        method, path, status, elapsed * 1000, size, phases, extra,
+        f" query={query!r}" if query is not None else "",
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 class SchemaRow(BaseModel):
     table_name: str
@@ -8,6 +8,21 @@ class SchemaRow(BaseModel):
 class Health(BaseModel):
     status: str
 
+class PoolStats(BaseModel):
+    database_name: str
+    server: str = Field("primary", description="primary | host:port of a read replica")
+    max_size: int
+    size: int
+    in_use: int
+    idle: int
+    waiters: int
+    acquired: int
+    created: int
+    discarded: int
+    timeouts: int
+    acquire_avg_ms: float
+    acquire_max_ms: float
+
 class AddRequest(BaseModel):
     data_line: str = Field(
         ...,
@@ -17,6 +32,23 @@ class AddRequest(BaseModel):
 class StatusOk(BaseModel):
     status: str = "ok"
 
+class AddBatchRequest(BaseModel):
+    data_lines: List[str] = Field(
+        ...,
+        description="List of data_line: Titolo,Regista,Età,Anno,Genere,Piattaforma_1,Piattaforma_2"
+    )
+
+class AddBatchItem(BaseModel):
+    line: int
+    status: str = Field(..., description="ok | error")
+    error: Optional[str] = None
+
+class AddBatchResponse(BaseModel):
+    status: str = Field(..., description="ok | partial | error")
+    applied: int
+    failed: int
+    results: List[AddBatchItem]
+
 class Property(BaseModel):
     property_name: str
     property_value: str
@@ -30,12 +62,63 @@ class SqlRequest(BaseModel):
         ..., 
         description="Sql query to execute")
     database_name: str = Field(..., description="Database to run query against")
+    limit: Optional[int] = Field(
+        None, ge=1, description="Page size; when set the response carries next_cursor")
+    cursor: Optional[str] = Field(
+        None, description="Opaque cursor from a previous response's next_cursor")
+    response_format: Literal["items", "columnar"] = Field(
+        "items", description="items (SqlResponse) | columnar (SqlColumnarResponse)")
 
 class SqlResponse(BaseModel):
     sql_validation: str = Field(..., description="valid | invalid | unsafe")
     results: Optional[List[SqlResponseItem]] = Field(
         None, description="SQL search result: list of items or null when invalid/unsafe"
     )
+    next_cursor: Optional[str] = Field(
+        None, description="Cursor for the next page, null when there are no more rows"
+    )
 
+class SqlColumnarResponse(BaseModel):
+    sql_validation: str = Field(..., description="valid | invalid | unsafe")
+    columns: Optional[List[str]] = Field(None, description="Column names, once")
+    rows: Optional[List[List[Any]]] = Field(None, description="Rows as arrays of native values")
+    next_cursor: Optional[str] = None
+
+class TextSearchHit(BaseModel):
+    type: str = Field(..., description="film | regista")
+    id: int = Field(..., description="idF | idR")
+    text: str = Field(..., description="Title or director name")
+    score: float
+    anno: Optional[int] = None
+    regista: Optional[str] = None
+
+class TextSearchResponse(BaseModel):
+    query: str
+    mode: str = Field(..., description="fuzzy | prefix")
+    results: List[TextSearchHit]
 
-    
\ No newline at end of file
+class SqlBenchmarkRequest(BaseModel):
+    sql_query: str = Field(..., description="Sql query to benchmark (SELECT only)")
+    databases: List[str] = Field(..., min_length=1, description="Databases to run the query against")
+    iterations: int = Field(20, ge=1, description="Measured executions per database")
+    concurrency: int = Field(1, ge=1, description="Parallel connections per database")
+    warmup: int = Field(2, ge=0, description="Unmeasured executions per connection before measuring")
+
+class SqlBenchmarkResult(BaseModel):
+    database_name: str
+    status: str = Field(..., description="ok | error")
+    error: Optional[str] = None
+    iterations: int = 0
+    rows: Optional[int] = Field(None, description="Rows returned by the query")
+    min_ms: Optional[float] = None
+    median_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    max_ms: Optional[float] = None
+    mean_ms: Optional[float] = None
+    throughput_qps: Optional[float] = None
+    server_status: Dict[str, float] = Field(
+        default_factory=dict, description="Per-execution deltas of session Handler_*/Rows_*/Sort_* counters")
+
+class SqlBenchmarkResponse(BaseModel):
+    sql_validation: str = Field(..., description="valid | invalid | unsafe")
+    results: List[SqlBenchmarkResult] = []
@@ -1,6 +1,7 @@
-import os, sys, time, csv
-import mariadb
-from .logic.add import add_line  
+import os, sys, time, csv, hashlib
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from .logic.add import add_line, _parse_data_line
+from .logic.catalog import refresh_directors, refresh_films
 from . import config
 
 DB_HOST = config.DB_HOST
@@ -10,66 +11,322 @@ DB_PASSWORD = config.DB_PASSWORD
 DB_NAME = config.DB_NAME
 
 TSV_PATH = os.getenv("SEED_TSV", "/seed/data.tsv")
+# "bulk": caricamento a blocchi (executemany, solo MariaDB); "rows": una add_line per riga
+SEED_MODE = os.getenv("SEED_MODE", "bulk")
+SEED_CHUNK_SIZE = int(os.getenv("SEED_CHUNK_SIZE", "1000"))
+# attesa massima del DB all'avvio (s)
+SEED_DB_WAIT = float(os.getenv("SEED_DB_WAIT", "120"))
 
-from .db import get_connection
+Parsed = Tuple[str, str, int, int, str, List[str]]
 
-def wait_for_db(retries: int = 60, delay: float = 2.0) -> None:
-    for i in range(retries):
+from .db import Cursor, Error, connection, engine, get_connection
+
+def wait_for_db(timeout: float = SEED_DB_WAIT) -> None:
+    # backoff esponenziale: al riavvio il DB è quasi sempre già pronto e il
+    # primo tentativo va a segno, al primo avvio non lo si tempesta
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
         try:
-            conn = get_connection("moviesdb")
+            conn = get_connection(DB_NAME)
             conn.close()
             return
-        except mariadb.Error:
+        except Error:
+            if time.monotonic() + delay > deadline:
+                break
             time.sleep(delay)
+            delay = min(delay * 2, 2.0)
     print("DB not responding after several tries", file=sys.stderr)
     sys.exit(1)
 
-# controllo se in movies c'è qualcosa; se sì, è già popolato
-def db_has_data() -> bool:
-    conn = get_connection("moviesdb")
-    try:
+# -------- stato del seed -----------------------------------------------------
+# seed_state: hash del contenuto del file applicato per ultimo; seed_rows:
+# hash di ogni riga applicata, per titolo. A un nuovo avvio con lo stesso file
+# non si legge altro; se il file è cambiato si applicano solo le righe nuove
+# o modificate. Le righe tolte dal file restano nel DB. Sono nel database
+# dell'applicazione (l'utente del DB non può crearne altri), nascoste da
+# /schema_summary e /sql_search (guard.INTERNAL_TABLES).
+
+SEED_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS seed_state (
+      source VARCHAR(255) PRIMARY KEY,
+      content_hash CHAR(64) NOT NULL,
+      row_count INT NOT NULL,
+      applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS seed_rows (
+      source VARCHAR(255) NOT NULL,
+      row_key CHAR(40) NOT NULL,
+      row_hash CHAR(40) NOT NULL,
+      PRIMARY KEY (source, row_key)
+    )
+    """,
+]
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _row_key(parsed: Parsed) -> str:
+    # titolo è la chiave di movies; il confronto del DB ignora le maiuscole
+    return hashlib.sha1(parsed[0].casefold().encode("utf-8")).hexdigest()
+
+def _row_hash(parsed: Parsed) -> str:
+    return hashlib.sha1(_data_line(parsed).encode("utf-8")).hexdigest()
+
+def _data_line(parsed: Parsed) -> str:
+    titolo, regista, eta, anno, genere, ps = parsed
+    return ",".join([titolo, regista, str(eta), str(anno), genere] + (ps + ["", ""])[:2])
+
+def _load_state(source: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """(hash del file applicato per ultimo, row_key -> row_hash); crea le tabelle se mancano."""
+    with connection(DB_NAME) as conn:
+        cur = conn.cursor()
+        for statement in SEED_DDL:
+            cur.execute(statement)
+        conn.commit()
+        cur.execute("SELECT content_hash FROM seed_state WHERE source = ?", (source,))
+        row = cur.fetchone()
+        if row is None:
+            return None, {}
+        cur.execute("SELECT row_key, row_hash FROM seed_rows WHERE source = ?", (source,))
+        return row[0], dict(cur.fetchall())
+
+def _record_rows(source: str, rows: List[Tuple[str, str]]) -> None:
+    # dopo il commit delle righe: se si interrompe prima, al prossimo avvio
+    # vengono riapplicate (sono upsert, non cambia nulla)
+    with connection(DB_NAME) as conn:
+        cur = conn.cursor()
+        for i in range(0, len(rows), 1000):
+            cur.executemany("REPLACE INTO seed_rows (source, row_key, row_hash) VALUES (?, ?, ?)",
+                            [(source, key, h) for key, h in rows[i:i + 1000]])
+        conn.commit()
+
+def _record_state(source: str, content_hash: str, row_count: int) -> None:
+    with connection(DB_NAME) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM movies")
-        (n,) = cur.fetchone()
-        return n > 0
-    finally:
-        conn.close()
-
-# apre tsv, check header (tenta la conversione col 3,4 in numeri), crea data_line csv e chiama add
-def seed_from_tsv(tsv_path: str) -> None:
-    inserted, skipped, errors = 0, 0, 0
+        cur.execute("REPLACE INTO seed_state (source, content_hash, row_count) VALUES (?, ?, ?)",
+                    (source, content_hash, row_count))
+        conn.commit()
+
+# apre tsv, check header (tenta la conversione col 3,4 in numeri) e restituisce
+# in streaming (indice, data_line csv); data_line è None se la riga è malformata
+def _iter_data_lines(tsv_path: str) -> Iterator[Tuple[int, Optional[str], List[str]]]:
     with open(tsv_path, "r", encoding="utf-8") as f:
         reader = csv.reader(f, delimiter="\t")
-        header_peek = next(reader)
+        header_peek = next(reader, None)
+        if header_peek is None:
+            return
         maybe_header = False
         try:
             int(header_peek[2]); int(header_peek[3])
         except Exception:
             maybe_header = True
+
+        idx = 0
         if not maybe_header:
-            row = header_peek
-            rows_iter = [row] + list(reader)
-        else:
-            rows_iter = list(reader)
-
-        for idx, row in enumerate(rows_iter, start=1):
-            # atteso: 7 colonne [titolo, regista, eta, anno, genere, p1, p2]
-            if len(row) < 5:
-                errors += 1
-                print(f"[row {idx}] columns given: {row}", file=sys.stderr)
-                continue
-            # normalizza a 7 campi
-            row = (row + ["", ""])[:7]
-            titolo, regista, eta, anno, genere, p1, p2 = [c.strip() for c in row]
-
-            data_line = ",".join([titolo, regista, eta, anno, genere, p1, p2])
-            try:
-                add_line(data_line)
-                inserted += 1
-            except Exception as e:
-                errors += 1
-                print(f"[riga {idx}] ERROR: {e}", file=sys.stderr)
-    print(f"Seed completed. Inserted: {inserted}, errors: {errors}, skipped: {skipped}")
+            idx += 1
+            yield idx, _row_to_data_line(header_peek), header_peek
+        for row in reader:
+            idx += 1
+            yield idx, _row_to_data_line(row), row
+
+def _row_to_data_line(row: List[str]) -> Optional[str]:
+    # atteso: 7 colonne [titolo, regista, eta, anno, genere, p1, p2]
+    if len(row) < 5:
+        return None
+    # normalizza a 7 campi
+    row = (row + ["", ""])[:7]
+    return ",".join(c.strip() for c in row)
+
+def apply_rows(rows: Sequence[Tuple[int, Parsed]], on_applied: Callable[[List[int]], None]) -> Tuple[int, int]:
+    """Una add_line per riga; restituisce (applicate, errori)."""
+    inserted, errors = 0, 0
+    applied: List[int] = []
+    for idx, parsed in rows:
+        try:
+            add_line(_data_line(parsed))
+            inserted += 1
+            applied.append(idx)
+        except Exception as e:
+            errors += 1
+            print(f"[riga {idx}] ERROR: {e}", file=sys.stderr)
+        if len(applied) >= SEED_CHUNK_SIZE:
+            on_applied(applied)
+            applied = []
+    if applied:
+        on_applied(applied)
+    return inserted, errors
+
+# -------- bulk loader --------------------------------------------------------
+
+def _placeholders(n: int) -> str:
+    return ", ".join(["?"] * n)
+
+def _resolve_ids(cur: Cursor, table: str, id_col: str, key_col: str,
+                 names: List[str], known: Dict[str, int]) -> None:
+    # risolve nome -> id a blocchi; il confronto lato DB segue la collation
+    # (case/accent insensitive), quindi le chiavi non trovate col casefold
+    # vengono cercate una per una
+    missing = [n for n in dict.fromkeys(names) if n not in known]
+    for i in range(0, len(missing), 500):
+        part = missing[i:i + 500]
+        cur.execute(
+            f"SELECT {id_col}, {key_col} FROM {table} WHERE {key_col} IN ({_placeholders(len(part))})",
+            tuple(part),
+        )
+        by_key = {str(name).casefold(): id_ for id_, name in cur.fetchall()}
+        for name in part:
+            id_ = by_key.get(name.casefold())
+            if id_ is None:
+                cur.execute(f"SELECT {id_col} FROM {table} WHERE {key_col} = ?", (name,))
+                row = cur.fetchone()
+                id_ = row[0] if row else None
+            if id_ is not None:
+                known[name] = id_
+
+def _load_chunk(conn, chunk: List[Tuple[int, Parsed]],
+                registi: Dict[str, int], piattaforme: Dict[str, int]) -> List[int]:
+    """Carica un blocco di righe già validate in una sola transazione.
+    Le righe sono applicate nell'ordine del file: a parità di chiave vince
+    l'ultima, esattamente come chiamando add_line riga per riga."""
+    cur = conn.cursor()
+
+    nomi_p = [p for _, parsed in chunk for p in parsed[5]]
+    nuove_p = [p for p in dict.fromkeys(nomi_p) if p not in piattaforme]
+    if nuove_p:
+        cur.executemany(
+            "INSERT INTO piattaforma (nome) VALUES (?) ON DUPLICATE KEY UPDATE nome = nome",
+            [(p,) for p in nuove_p],
+        )
+    _resolve_ids(cur, "piattaforma", "idP", "nome", nomi_p, piattaforme)
+
+    rows: List[Tuple[int, Parsed, Optional[int], Optional[int]]] = []
+    for idx, parsed in chunk:
+        ids = [piattaforme[p] for p in parsed[5]] + [None, None]
+        if ids[0] is not None and ids[0] == ids[1]:
+            # violerebbe chk_two_distinct: add_line fallirebbe sulla riga
+            print(f"[riga {idx}] ERROR: platforms resolve to the same row", file=sys.stderr)
+            continue
+        rows.append((idx, parsed, ids[0], ids[1]))
+    if not rows:
+        return []
+
+    cur.executemany(
+        "INSERT INTO regista (nome, eta) VALUES (?, ?) ON DUPLICATE KEY UPDATE eta = VALUES(eta)",
+        [(parsed[1], parsed[2]) for _, parsed, _, _ in rows],
+    )
+    _resolve_ids(cur, "regista", "idR", "nome", [parsed[1] for _, parsed, _, _ in rows], registi)
+
+    cur.executemany(
+        "INSERT INTO movies (titolo, idR, anno, genere) VALUES (?, ?, ?, ?) "
+        "ON DUPLICATE KEY UPDATE idR = VALUES(idR), anno = VALUES(anno), genere = VALUES(genere)",
+        [(parsed[0], registi[parsed[1]], parsed[3], parsed[4]) for _, parsed, _, _ in rows],
+    )
+    film_ids: Dict[str, int] = {}
+    _resolve_ids(cur, "movies", "idF", "titolo", [parsed[0] for _, parsed, _, _ in rows], film_ids)
+
+    cur.executemany(
+        "INSERT INTO dove_vederlo (idF, idP1, idP2) VALUES (?, ?, ?) "
+        "ON DUPLICATE KEY UPDATE idP1 = VALUES(idP1), idP2 = VALUES(idP2)",
+        [(film_ids[parsed[0]], p1, p2) for _, parsed, p1, p2 in rows],
+    )
+    if config.FILM_CATALOG:
+        refresh_directors(cur, [registi[parsed[1]] for _, parsed, _, _ in rows])
+        refresh_films(cur, [film_ids[parsed[0]] for _, parsed, _, _ in rows])
+    conn.commit()
+    return [idx for idx, _, _, _ in rows]
+
+def bulk_apply_rows(rows: Sequence[Tuple[int, Parsed]], on_applied: Callable[[List[int]], None],
+                    chunk_size: int = SEED_CHUNK_SIZE) -> Tuple[int, int]:
+    """Carica le righe a blocchi; restituisce (applicate, errori)."""
+    loaded, errors = 0, 0
+    # mappe dimensionali nome -> id, valide per tutta la durata del caricamento
+    registi: Dict[str, int] = {}
+    piattaforme: Dict[str, int] = {}
+
+    def flush(conn, chunk: Sequence[Tuple[int, Parsed]]) -> None:
+        nonlocal loaded, errors
+        try:
+            applied = _load_chunk(conn, list(chunk), registi, piattaforme)
+        except (Error, KeyError) as e:
+            # il blocco viene annullato: le mappe potrebbero contenere id
+            # appena inseriti e non più esistenti, e le righe vengono
+            # ripetute una per una per isolare quella difettosa
+            conn.rollback()
+            registi.clear()
+            piattaforme.clear()
+            print(f"[righe {chunk[0][0]}-{chunk[-1][0]}] bulk load failed ({e}), retrying row by row",
+                  file=sys.stderr)
+            applied = []
+            for idx, parsed in chunk:
+                try:
+                    add_line(_data_line(parsed))
+                    applied.append(idx)
+                except Exception as row_error:
+                    print(f"[riga {idx}] ERROR: {row_error}", file=sys.stderr)
+        loaded += len(applied)
+        errors += len(chunk) - len(applied)
+        on_applied(applied)
+
+    with connection(DB_NAME) as conn:
+        for i in range(0, len(rows), chunk_size):
+            flush(conn, rows[i:i + chunk_size])
+    return loaded, errors
+
+# -------- seed incrementale --------------------------------------------------
+
+def seed(tsv_path: str) -> None:
+    start = time.monotonic()
+    source = os.path.basename(tsv_path)
+    content_hash = _file_hash(tsv_path)
+    applied_hash, known = _load_state(source)
+    if applied_hash == content_hash:
+        print(f"Dataset unchanged: seed skipped ({time.monotonic() - start:.2f}s).")
+        return
+
+    # a parità di titolo vale l'ultima riga del file, come applicandole tutte
+    latest: Dict[str, Tuple[int, Parsed, str]] = {}
+    errors = 0
+    for idx, data_line, row in _iter_data_lines(tsv_path):
+        if data_line is None:
+            errors += 1
+            print(f"[row {idx}] columns given: {row}", file=sys.stderr)
+            continue
+        try:
+            parsed = _parse_data_line(data_line)
+        except ValueError as e:
+            errors += 1
+            print(f"[riga {idx}] ERROR: {e}", file=sys.stderr)
+            continue
+        key = _row_key(parsed)
+        latest.pop(key, None)   # l'ordine di applicazione è quello dell'ultima occorrenza
+        latest[key] = (idx, parsed, _row_hash(parsed))
+
+    changed = [(key, idx, parsed, h) for key, (idx, parsed, h) in latest.items() if known.get(key) != h]
+    hashes = {idx: (key, h) for key, idx, parsed, h in changed}
+    rows = [(idx, parsed) for _, idx, parsed, _ in changed]
+    on_applied = lambda applied: _record_rows(source, [hashes[idx] for idx in applied])
+
+    if SEED_MODE == "bulk" and engine.name == "mariadb":
+        loaded, failed = bulk_apply_rows(rows, on_applied)
+    else:
+        loaded, failed = apply_rows(rows, on_applied)
+    # con righe rifiutate dal DB il file non risulta applicato: al prossimo
+    # avvio si rilegge e si riprovano solo quelle (le altre hanno già l'hash)
+    if not failed:
+        _record_state(source, content_hash, len(latest))
+
+    elapsed = time.monotonic() - start
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    print(f"Seed completed. Applied: {loaded}, unchanged: {len(latest) - len(changed)}, "
+          f"errors: {errors + failed}, elapsed: {elapsed:.1f}s ({rate:.0f} rows/s)")
 
 if __name__ == "__main__":
     if not os.path.exists(TSV_PATH):
@@ -77,9 +334,4 @@ if __name__ == "__main__":
         sys.exit(0)
 
     wait_for_db()
-
-    if db_has_data():
-        print("DB is already populated: seed skipped.")
-        sys.exit(0)
-
-    seed_from_tsv(TSV_PATH)
+    seed(TSV_PATH)
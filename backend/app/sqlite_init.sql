@@ -0,0 +1,63 @@
+-- Equivalente SQLite di init.sql, applicato dal motore "sqlite" al database
+-- DB_NAME. COLLATE NOCASE sulle chiavi testuali riproduce il confronto
+-- case-insensitive della collation di MariaDB.
+
+-- Registi
+CREATE TABLE IF NOT EXISTS regista (
+  idR INTEGER PRIMARY KEY AUTOINCREMENT,
+  nome VARCHAR(255) NOT NULL UNIQUE COLLATE NOCASE,
+  eta INT NOT NULL
+);
+
+-- Piattaforme
+CREATE TABLE IF NOT EXISTS piattaforma (
+  idP INTEGER PRIMARY KEY AUTOINCREMENT,
+  nome VARCHAR(100) NOT NULL UNIQUE COLLATE NOCASE
+);
+
+-- Film
+CREATE TABLE IF NOT EXISTS movies (
+  idF INTEGER PRIMARY KEY AUTOINCREMENT,
+  titolo VARCHAR(255) NOT NULL UNIQUE COLLATE NOCASE,
+  idR INT NOT NULL,
+  anno INT NOT NULL,
+  genere VARCHAR(100) NOT NULL COLLATE NOCASE,
+  CONSTRAINT fk_movies_regista FOREIGN KEY (idR) REFERENCES regista(idR)
+  ON DELETE CASCADE
+);
+
+-- Disponibilità su piattaforme
+CREATE TABLE IF NOT EXISTS dove_vederlo (
+  idF INTEGER PRIMARY KEY,
+  idP1 INT NULL,
+  idP2 INT NULL,
+  CONSTRAINT fk_dv_film FOREIGN KEY (idF) REFERENCES movies(idF) ON DELETE CASCADE,
+  CONSTRAINT fk_dv_p1 FOREIGN KEY (idP1) REFERENCES piattaforma(idP),
+  CONSTRAINT fk_dv_p2 FOREIGN KEY (idP2) REFERENCES piattaforma(idP),
+  CONSTRAINT chk_two_distinct CHECK (idP1 IS NULL OR idP2 IS NULL OR idP1 <> idP2)
+);
+
+-- Indici utili
+CREATE INDEX IF NOT EXISTS idx_movies_anno ON movies(anno);
+CREATE INDEX IF NOT EXISTS idx_regista_eta ON regista(eta);
+CREATE INDEX IF NOT EXISTS idx_dv_p1 ON dove_vederlo(idP1);
+CREATE INDEX IF NOT EXISTS idx_dv_p2 ON dove_vederlo(idP2);
+
+-- Catalogo denormalizzato (un film per riga, regista e piattaforme risolti):
+-- aggiornato da add_line con FILM_CATALOG=1, vedi app/logic/catalog.py
+CREATE TABLE IF NOT EXISTS film_catalog (
+  idF INT PRIMARY KEY,
+  titolo VARCHAR(255) NOT NULL COLLATE NOCASE,
+  anno INT NOT NULL,
+  genere VARCHAR(100) NOT NULL COLLATE NOCASE,
+  idR INT NOT NULL,
+  regista VARCHAR(255) NOT NULL COLLATE NOCASE,
+  eta INT NOT NULL,
+  piattaforma1 VARCHAR(100) NULL,
+  piattaforma2 VARCHAR(100) NULL,
+  CONSTRAINT fk_fc_film FOREIGN KEY (idF) REFERENCES movies(idF) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_fc_anno ON film_catalog(anno);
+CREATE INDEX IF NOT EXISTS idx_fc_genere ON film_catalog(genere);
+CREATE INDEX IF NOT EXISTS idx_fc_idR ON film_catalog(idR);
@@ -0,0 +1,133 @@
+import itertools
+
+import pytest
+
+from .data import data_lines
+
+# -------- CPU: nessun database -----------------------------------------------
+
+QUERIES = [
+    "SELECT titolo, anno FROM movies WHERE anno > 2000 ORDER BY anno",
+    "SELECT m.titolo, r.nome FROM movies m JOIN regista r ON r.idR = m.idR WHERE r.eta > 50",
+    "SELECT p.nome, COUNT(*) FROM dove_vederlo d JOIN piattaforma p ON p.idP = d.idP1 GROUP BY p.nome",
+]
+
+
+def bench_guard_analyze(benchmark):
+    from app.logic.guard import analyze
+
+    def run():
+        analyze.cache_clear()
+        for q in QUERIES:
+            analyze(q)
+
+    benchmark(run)
+
+
+def bench_parse_data_line(benchmark):
+    from app.logic.add import _parse_data_line
+    lines = list(data_lines(1000))
+    benchmark(lambda: [_parse_data_line(line) for line in lines])
+
+
+def bench_to_item(benchmark):
+    from app.logic.search import _to_item
+    columns = ["titolo", "anno", "genere", "nome", "eta"]
+    rows = [(f"Film {i}", 2000 + i % 20, "Dramma", f"Regista {i % 50}", 40) for i in range(1000)]
+    benchmark(lambda: [_to_item(columns, r) for r in rows])
+
+
+TEXT_QUERIES = [
+    ("fuzzy", "nigth"),             # errore di battitura, parola in un titolo su venti
+    ("fuzzy", "the drak night"),    # parola comunissima + errore
+    ("fuzzy", "jonas felini"),      # regista
+    ("prefix", "night"),
+    ("prefix", "the n"),
+    ("prefix", "12345"),            # selettivo: poche parole nell'intervallo
+]
+
+
+@pytest.mark.parametrize("mode,query", TEXT_QUERIES, ids=[f"{m}-{q}" for m, q in TEXT_QUERIES])
+def bench_search_text(benchmark, text_index, mode, query):
+    if mode == "prefix":
+        benchmark(text_index.prefix, query, None, 10)
+    else:
+        benchmark(text_index.fuzzy, query, None, 10, 0.5)
+
+# -------- database (quello di DB_ENGINE) -------------------------------------
+
+def bench_add_line(benchmark, db, run_id):
+    from app.logic.add import add_line
+    lines = data_lines(10 ** 9, seed=1, prefix=f"{run_id}-add")
+    benchmark(lambda: add_line(next(lines)))
+
+
+def bench_add_line_upsert(benchmark, db, run_id):
+    # stesso titolo: percorso di aggiornamento (ON DUPLICATE KEY)
+    from app.logic.add import add_line
+    line = next(data_lines(1, seed=2, prefix=f"{run_id}-upsert"))
+    benchmark(add_line, line)
+
+
+def bench_add_lines_batch(benchmark, db, run_id):
+    from app.logic.add import add_lines
+    counter = itertools.count()
+
+    def run():
+        start = next(counter) * 100
+        add_lines(list(data_lines(100, seed=3, prefix=f"{run_id}-batch", start=start)))
+
+    benchmark(run)
+
+
+@pytest.mark.parametrize("query", QUERIES, ids=["anno", "join_regista", "group_piattaforma"])
+@pytest.mark.parametrize("cached", [False, True], ids=["nocache", "cache"])
+def bench_sqlsearch(benchmark, db, query, cached):
+    from app import config
+    from app.logic.cache import result_cache
+    from app.logic.search import sqlsearch
+    from app.models import SqlRequest
+
+    request = SqlRequest(sql_query=query, database_name=config.DB_NAME)
+
+    def run():
+        if not cached:
+            result_cache.clear()
+        return sqlsearch(request)
+
+    assert run().sql_validation == "valid"
+    benchmark(run)
+
+
+def bench_schema_rows(benchmark, db):
+    from app.logic.schema import get_schema_rows
+    benchmark(get_schema_rows)
+
+
+def bench_schema_summary_cached(benchmark, db):
+    from app import config
+    from app.logic.schema import schema_cache
+    benchmark(schema_cache.summary, config.DB_NAME)
+
+
+@pytest.mark.parametrize("mode", ["rows", "bulk"])
+def bench_seed_from_tsv(benchmark, db, tsv_file, mode):
+    from app import seed
+    from app.logic.add import _parse_data_line
+    if mode == "bulk" and db.name != "mariadb":
+        pytest.skip("bulk load uses executemany ... ON DUPLICATE KEY UPDATE (MariaDB only)")
+    path, rows = tsv_file
+    parsed = [(idx, _parse_data_line(line)) for idx, line, _ in seed._iter_data_lines(path) if line]
+    load = seed.apply_rows if mode == "rows" else seed.bulk_apply_rows
+    # il primo giro inserisce, i successivi aggiornano: un solo round misurato
+    benchmark.extra_info["rows"] = rows
+    benchmark.pedantic(load, args=(parsed, lambda applied: None), rounds=1, iterations=1)
+
+
+def bench_seed_unchanged(benchmark, db, tsv_file):
+    # riavvio con lo stesso file: hash del contenuto e una lettura di seed_state
+    from app import seed
+    path, rows = tsv_file
+    seed.seed(path)
+    benchmark.extra_info["rows"] = rows
+    benchmark(seed.seed, path)
@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+from .data import write_tsv
+
+APP_DB_NAME = os.getenv("DB_NAME", "moviesdb")
+
+
+def pytest_configure(config):
+    # i benchmark scrivono (add, seed): mai nel database dell'applicazione.
+    # Prima di importare app, che legge DB_NAME una volta; solo con
+    # bench/pytest.ini, non quando pytest carica questo conftest per i test
+    if config.inipath is not None and str(config.inipath.parent) == os.path.dirname(os.path.abspath(__file__)):
+        os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "moviesdb_bench")
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench")
+    group.addoption("--bench-rows", type=int, default=int(os.getenv("BENCH_ROWS", "1000")),
+                    help="righe del TSV usato dai benchmark di seed")
+    group.addoption("--bench-text-rows", type=int, default=int(os.getenv("BENCH_TEXT_ROWS", "1000000")),
+                    help="titoli nell'indice dei benchmark di /search_text")
+
+
+def _create_bench_db() -> None:
+    # su MariaDB il database dei benchmark si crea da root, con le tabelle di
+    # quello dell'applicazione (con sqlite lo crea il motore, da sqlite_init.sql)
+    from app import config
+    from app.db import get_admin_connection
+    conn = get_admin_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"CREATE DATABASE IF NOT EXISTS `{config.DB_NAME}`")
+        cur.execute("SELECT table_name FROM information_schema.tables "
+                    "WHERE table_schema = ? AND table_type = 'BASE TABLE'", (APP_DB_NAME,))
+        for (table,) in cur.fetchall():
+            cur.execute(f"CREATE TABLE IF NOT EXISTS `{config.DB_NAME}`.`{table}` LIKE `{APP_DB_NAME}`.`{table}`")
+        user = config.DB_USER.replace("'", "''")
+        cur.execute(f"GRANT ALL PRIVILEGES ON `{config.DB_NAME}`.* TO '{user}'@'%'")
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def db():
+    """Il motore configurato come per il backend (DB_ENGINE, DB_HOST/DB_PORT/...
+    o SQLITE_DIR), sul database BENCH_DB_NAME; se non risponde i benchmark che
+    ne hanno bisogno vengono saltati."""
+    try:
+        from app.db import engine
+        from app.logic.health import ping_db
+        if engine.name == "mariadb":
+            _create_bench_db()
+        ping_db()
+    except Exception as e:  # driver assente, motore sconosciuto o server spento
+        pytest.skip(f"database not available: {e}")
+    yield engine
+    from app.db import close_pools
+    close_pools()
+
+
+@pytest.fixture(scope="session")
+def run_id() -> str:
+    # prefisso dei titoli inseriti: run diversi non si sovrascrivono
+    return f"Bench{int(time.time())}"
+
+
+@pytest.fixture(scope="session")
+def text_index(request):
+    """Indice di /search_text con i titoli e i registi di gen_dataset, senza DB."""
+    from app.logic.textsearch import TrigramIndex, _Doc
+    from .gen_dataset import director, title
+    rows = request.config.getoption("--bench-text-rows")
+    directors = max(10, rows // 20)
+    index = TrigramIndex("bench", int(os.getenv("TEXT_SEARCH_MAX_CANDIDATES", "1000")))
+    index._loading = True
+    for k in range(directors):
+        index._put(_Doc("regista", k, director(k)[0]))
+    for j in range(rows):
+        index._put(_Doc("film", j, title(j), 2000 + j % 25, j % directors))
+    index._terms.sort()
+    index._loading = False
+    return index
+
+
+@pytest.fixture
+def tsv_file(request, tmp_path, run_id):
+    rows = request.config.getoption("--bench-rows")
+    path = tmp_path / "bench.tsv"
+    write_tsv(str(path), rows, seed=rows, prefix=f"{run_id}-{request.node.name}")
+    return str(path), rows
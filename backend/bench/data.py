@@ -0,0 +1,38 @@
+import csv
+import random
+from typing import Iterator, List
+
+# Dati sintetici minimi per i benchmark: stesso formato di data.tsv / data_line.
+
+HEADER = ["Titolo", "Regista", "Età_Autore", "Anno", "Genere", "Piattaforma_1", "Piattaforma_2"]
+GENERI = ["Azione", "Commedia", "Dramma", "Fantascienza", "Horror", "Thriller", "Animazione"]
+PIATTAFORME = ["Netflix", "Amazon Prime Video", "Disney+", "NOW", "Paramount+", "Apple TV+"]
+
+
+def row(i: int, rng: random.Random, prefix: str = "Bench") -> List[str]:
+    director = rng.randrange(max(1, i // 20 + 1))
+    p1, p2 = rng.sample(PIATTAFORME, 2)
+    return [
+        f"{prefix} {i}",
+        f"Regista {director}",
+        str(30 + director % 50),
+        str(rng.randint(1950, 2024)),
+        rng.choice(GENERI),
+        p1,
+        p2 if rng.random() < 0.5 else "",
+    ]
+
+
+def data_lines(n: int, seed: int = 0, prefix: str = "Bench", start: int = 0) -> Iterator[str]:
+    rng = random.Random(seed)
+    for i in range(start, start + n):
+        yield ",".join(row(i, rng, prefix))
+
+
+def write_tsv(path: str, n: int, seed: int = 0, prefix: str = "Bench") -> None:
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        w.writerow(HEADER)
+        for i in range(n):
+            w.writerow(row(i, rng, prefix))
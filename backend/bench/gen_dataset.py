@@ -0,0 +1,227 @@
+"""Generatore di dataset sintetici nel formato di data.tsv (letto da app.seed).
+
+Deterministico: a parità di --seed e --shard-rows il file è identico byte per
+byte, qualunque sia il numero di processi. Scala 1 = 1.000.000 di righe.
+
+    python -m bench.gen_dataset --scale 10 --out /tmp/movies_sf10.tsv -j 8
+    python -m bench.gen_dataset --rows 5000 --out - | head
+"""
+import argparse
+import bisect
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Tuple
+
+from .data import HEADER
+
+ROWS_PER_SCALE = 1_000_000
+
+# -------- vocabolario --------------------------------------------------------
+# Niente virgole, tab o virgolette: la riga diventa una data_line separata da virgole.
+
+FIRST_NAMES = [
+    "Alice", "Bruno", "Carla", "Dario", "Elena", "Fabio", "Giulia", "Hiro", "Ingrid", "Jonas",
+    "Kenji", "Laura", "Marco", "Nadia", "Omar", "Paola", "Quentin", "Rosa", "Sergio", "Tomas",
+    "Ugo", "Valeria", "Wes", "Ximena", "Yuki", "Zoe", "Agnes", "Bong", "Chloe", "Denis",
+]
+LAST_NAMES = [
+    "Rossi", "Bianchi", "Nolan", "Kurosawa", "Varda", "Fellini", "Bergman", "Lynch", "Campion",
+    "Almodovar", "Kiarostami", "Tarkovsky", "Sciamma", "Villeneuve", "Wong", "Herzog", "Ozu",
+    "Leone", "Gerwig", "Park", "Kaurismaki", "Haneke", "Rohrwacher", "Sorrentino", "Moretti",
+    "Garrone", "Chazelle", "Zhao", "Aster", "Peele", "Bigelow", "Coppola", "Scorsese", "Lee",
+]
+TITLE_ADJ = [
+    "Silent", "Last", "Broken", "Golden", "Hidden", "Red", "Long", "Lost", "Cold", "Wild",
+    "Dark", "Bright", "Empty", "Burning", "Frozen", "Secret", "Distant", "Little", "Final", "Endless",
+]
+TITLE_NOUN = [
+    "River", "Summer", "City", "Road", "Garden", "Night", "Mirror", "Storm", "Harbor", "Dream",
+    "Station", "Forest", "Island", "Letter", "Shadow", "Horizon", "Winter", "Machine", "Window", "Song",
+]
+# piattaforme in ordine di popolarità (il rango conta per la Zipf)
+PLATFORMS = [
+    "Netflix", "Amazon Prime Video", "Disney+", "NOW", "Apple TV+", "Paramount+", "RaiPlay",
+    "Mediaset Infinity", "MUBI", "Timvision", "Chili", "Rakuten TV",
+]
+# generi con il loro peso
+GENRES = [
+    ("Dramma", 24), ("Commedia", 18), ("Azione", 12), ("Thriller", 10), ("Fantascienza", 7),
+    ("Horror", 7), ("Animazione", 6), ("Documentario", 5), ("Romantico", 5), ("Fantasy", 3),
+    ("Western", 1), ("Musical", 1), ("Guerra", 1),
+]
+
+# -------- distribuzioni ------------------------------------------------------
+
+class Zipf:
+    """Campionamento Zipf su 1..n in O(1) di memoria (rejection-inversion,
+    Hörmann & Derflinger 1996): serve per milioni di registi."""
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        self.n = n
+        self.exponent = exponent
+        self.rng = rng
+        self.h_integral_x1 = self._h_integral(1.5) - 1.0
+        self.h_integral_n = self._h_integral(n + 0.5)
+        self.s = 2.0 - self._h_integral_inverse(self._h_integral(2.5) - self._h(2.0))
+
+    @staticmethod
+    def _helper1(x: float) -> float:
+        return math.log1p(x) / x if abs(x) > 1e-8 else 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+
+    @staticmethod
+    def _helper2(x: float) -> float:
+        return math.expm1(x) / x if abs(x) > 1e-8 else 1.0 + x * 0.5 * (1.0 + x / 3.0 * (1.0 + 0.25 * x))
+
+    def _h(self, x: float) -> float:
+        return math.exp(-self.exponent * math.log(x))
+
+    def _h_integral(self, x: float) -> float:
+        log_x = math.log(x)
+        return self._helper2((1.0 - self.exponent) * log_x) * log_x
+
+    def _h_integral_inverse(self, x: float) -> float:
+        t = max(-1.0, x * (1.0 - self.exponent))
+        return math.exp(self._helper1(t) * x)
+
+    def sample(self) -> int:
+        while True:
+            u = self.h_integral_n + self.rng.random() * (self.h_integral_x1 - self.h_integral_n)
+            x = self._h_integral_inverse(u)
+            k = min(max(int(x + 0.5), 1), self.n)
+            if k - x <= self.s or u >= self._h_integral(k + 0.5) - self._h(k):
+                return k
+
+
+def _cumulative(weights: Sequence[float]) -> List[float]:
+    total, cum = 0.0, []
+    for w in weights:
+        total += w
+        cum.append(total)
+    return cum
+
+
+def _zipf_weights(n: int, exponent: float) -> List[float]:
+    return _cumulative([1.0 / k ** exponent for k in range(1, n + 1)])
+
+# -------- righe --------------------------------------------------------------
+
+def title(j: int) -> str:
+    # unico per costruzione grazie al numero finale
+    h = (j * 2654435761) & 0xFFFFFFFF
+    return f"The {TITLE_ADJ[h % len(TITLE_ADJ)]} {TITLE_NOUN[(h >> 8) % len(TITLE_NOUN)]} {j}"
+
+
+def director(k: int) -> Tuple[str, int]:
+    # nome unico per k (anche ignorando maiuscole); l'età è fissa per regista
+    f, rest = k % len(FIRST_NAMES), k // len(FIRST_NAMES)
+    l, generation = rest % len(LAST_NAMES), rest // len(LAST_NAMES)
+    name = f"{FIRST_NAMES[f]} {LAST_NAMES[l]}" + (f" {generation + 1}" if generation else "")
+    age = 25 + (k * 40503) % 61
+    return name, age
+
+
+class Params:
+    def __init__(self, args: argparse.Namespace, rows: int):
+        self.seed = args.seed
+        self.rows = rows
+        self.shard_rows = args.shard_rows
+        self.directors = args.directors or max(10, rows // 20)
+        self.director_skew = args.director_skew
+        self.platform_skew = args.platform_skew
+        self.dup_rate = args.dup_rate
+        self.second_platform = args.second_platform
+
+
+def _generate_shard(task: Tuple[Params, int, str]) -> Tuple[int, str]:
+    params, shard, tmp_dir = task
+    start = shard * params.shard_rows
+    end = min(start + params.shard_rows, params.rows)
+    # un rng per shard: il risultato non dipende da quale processo lo genera
+    rng = random.Random(f"{params.seed}:{shard}")
+    directors = Zipf(params.directors, params.director_skew, rng)
+    platform_cum = _zipf_weights(len(PLATFORMS), params.platform_skew)
+    genre_cum = _cumulative([w for _, w in GENRES])
+    genre_names = [g for g, _ in GENRES]
+    # bisect sulle cumulate: molto più veloce di rng.choices riga per riga
+    pick = lambda values, cum: values[bisect.bisect(cum, rng.random() * cum[-1])]
+    random_ = rng.random
+
+    path = os.path.join(tmp_dir, f"shard-{shard:06d}.tsv")
+    with open(path, "w", encoding="utf-8", newline="\n", buffering=1 << 20) as f:
+        buf: List[str] = []
+        for i in range(start, end):
+            # una parte delle righe riusa un titolo già uscito: upsert in fase di seed
+            j = int(random_() * i) if i and random_() < params.dup_rate else i
+            name, age = director(directors.sample() - 1)
+            # anni: coda lunga verso il passato, con più film recenti
+            year = max(1920, 2024 - int(-14 * math.log(1.0 - random_())))
+            genre = pick(genre_names, genre_cum)
+            p1 = pick(PLATFORMS, platform_cum)
+            p2 = ""
+            if random_() < params.second_platform:
+                p2 = pick(PLATFORMS, platform_cum)
+                if p2 == p1:
+                    p2 = ""
+            buf.append(f"{title(j)}\t{name}\t{age}\t{year}\t{genre}\t{p1}\t{p2}\n")
+            if len(buf) >= 10_000:
+                f.writelines(buf)
+                buf.clear()
+        f.writelines(buf)
+    return shard, path
+
+
+def generate(params: Params, out: str, jobs: int) -> None:
+    shards = math.ceil(params.rows / params.shard_rows) if params.rows else 0
+    tmp_dir = tempfile.mkdtemp(prefix="gen_dataset-", dir=None if out == "-" else os.path.dirname(os.path.abspath(out)))
+    dst = sys.stdout.buffer if out == "-" else open(out, "wb")
+    try:
+        dst.write(("\t".join(HEADER) + "\n").encode("utf-8"))
+        tasks = [(params, shard, tmp_dir) for shard in range(shards)]
+        with Pool(processes=jobs) as pool:
+            # imap conserva l'ordine: gli shard si accodano man mano che sono pronti
+            for _, path in pool.imap(_generate_shard, tasks):
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                os.remove(path)
+    finally:
+        if dst is not sys.stdout.buffer:
+            dst.close()
+        else:
+            dst.flush()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    size = p.add_mutually_exclusive_group(required=True)
+    size.add_argument("--scale", type=float, help=f"fattore di scala (1 = {ROWS_PER_SCALE:,} righe)")
+    size.add_argument("--rows", type=int, help="numero esatto di righe")
+    p.add_argument("--out", required=True, help="file TSV di destinazione ('-' = stdout)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--shard-rows", type=int, default=250_000, help="righe per shard (parte del seed)")
+    p.add_argument("--directors", type=int, default=0, help="registi distinti (default righe/20)")
+    p.add_argument("--director-skew", type=float, default=1.1, help="esponente Zipf dei registi")
+    p.add_argument("--platform-skew", type=float, default=1.0, help="esponente Zipf delle piattaforme")
+    p.add_argument("--dup-rate", type=float, default=0.02, help="quota di righe con un titolo già visto")
+    p.add_argument("--second-platform", type=float, default=0.4, help="probabilità di una seconda piattaforma")
+    args = p.parse_args(argv)
+
+    rows = args.rows if args.rows is not None else int(args.scale * ROWS_PER_SCALE)
+    params = Params(args, rows)
+    started = time.perf_counter()
+    generate(params, args.out, max(1, args.jobs))
+    elapsed = time.perf_counter() - started
+    print(f"{rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)" if elapsed else "",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
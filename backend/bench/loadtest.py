@@ -0,0 +1,173 @@
+"""Load test del backend via HTTP, con concorrenza configurabile.
+
+Da backend/, con il backend avviato su un MariaDB inizializzato da init.sql:
+
+    python -m bench.loadtest --url http://localhost:8003 --scenario mixed \\
+        --concurrency 32 --duration 30 --rows 10000 --out bench/results/run.json
+
+    # confronto con una baseline salvata: exit code 1 in caso di regressione
+    python -m bench.loadtest ... --baseline bench/results/baseline.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from . import results
+from .data import data_lines
+
+# -------- scenari ------------------------------------------------------------
+# Ogni operazione restituisce (nome, metodo, path, kwargs per httpx).
+
+Op = Tuple[str, str, str, Dict[str, Any]]
+
+SEARCHES = [
+    "SELECT titolo, anno, genere FROM movies WHERE anno = {year}",
+    "SELECT m.titolo, r.nome FROM movies m JOIN regista r ON r.idR = m.idR WHERE r.eta > {age}",
+    "SELECT p.nome, COUNT(*) FROM dove_vederlo d JOIN piattaforma p ON p.idP = d.idP1 GROUP BY p.nome",
+    "SELECT genere, COUNT(*), MIN(anno), MAX(anno) FROM movies GROUP BY genere",
+]
+
+
+class Scenario:
+    def __init__(self, args: argparse.Namespace):
+        self.database_name = args.database
+        self.rng = random.Random(args.seed)
+        self.lines = data_lines(10 ** 12, seed=args.seed, prefix=f"Load{int(time.time())}")
+
+    def add(self) -> Op:
+        return "add", "POST", "/add", {"json": {"data_line": next(self.lines)}}
+
+    def sql_search(self) -> Op:
+        sql = self.rng.choice(SEARCHES).format(year=self.rng.randint(1950, 2024), age=self.rng.randint(30, 80))
+        return "sql_search", "POST", "/sql_search", {
+            "json": {"sql_query": sql, "database_name": self.database_name}}
+
+    def schema_summary(self) -> Op:
+        return "schema_summary", "GET", "/schema_summary", {}
+
+    def mixed(self) -> Op:
+        # profilo tipico: soprattutto letture
+        op = self.rng.choices([self.sql_search, self.add, self.schema_summary], weights=[70, 20, 10])[0]
+        return op()
+
+
+async def prepare(client: httpx.AsyncClient, rows: int, seed: int, chunk: int = 5000) -> None:
+    """Porta il database ad almeno `rows` film (titoli fissi: rieseguire non duplica)."""
+    started = time.perf_counter()
+    for start in range(0, rows, chunk):
+        body = "\n".join(data_lines(min(chunk, rows - start), seed=seed, prefix="Dataset", start=start))
+        resp = await client.post("/add_batch", content=body.encode("utf-8"),
+                                 headers={"Content-Type": "text/plain"}, timeout=None)
+        resp.raise_for_status()
+    print(f"prepared {rows} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+# -------- driver -------------------------------------------------------------
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenario = Scenario(args)
+    next_op: Callable[[], Op] = getattr(scenario, args.scenario)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        if args.rows:
+            await prepare(client, args.rows, args.seed)
+
+        budget = itertools.count() if args.requests else None
+        deadline = time.perf_counter() + args.duration
+
+        async def worker() -> None:
+            while True:
+                if budget is not None:
+                    if next(budget) >= args.requests:
+                        return
+                elif time.perf_counter() >= deadline:
+                    return
+                name, method, path, kwargs = next_op()
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.request(method, path, **kwargs)
+                except httpx.HTTPError:
+                    errors[name] += 1
+                    statuses[name][0] += 1
+                    continue
+                elapsed = time.perf_counter() - t0
+                statuses[name][resp.status_code] += 1
+                if resp.status_code < 400:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    names = sorted(set(latencies) | set(errors))
+    return {
+        "meta": {
+            "url": args.url,
+            "scenario": args.scenario,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "rows": args.rows,
+            "seed": args.seed,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "endpoints": {
+            n: results.summarize(latencies[n], errors[n], statuses[n], elapsed) for n in names
+        },
+        "total": results.summarize(
+            [v for n in names for v in latencies[n]], sum(errors.values()),
+            sum(statuses.values(), Counter()), elapsed),
+    }
+
+
+def _print(result: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<16} {'req':>8} {'err':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in sorted(result["endpoints"].items()) + [("TOTAL", result["total"])]:
+        print(f"{name:<16} {s['requests']:>8} {s['errors']:>6} {s['throughput_rps']:>9} "
+              f"{s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--url", default="http://localhost:8003")
+    p.add_argument("--scenario", choices=["add", "sql_search", "schema_summary", "mixed"], default="mixed")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--duration", type=float, default=30.0, help="secondi (ignorato se c'è --requests)")
+    p.add_argument("--requests", type=int, default=0, help="numero totale di richieste")
+    p.add_argument("--rows", type=int, default=0, help="film da caricare via /add_batch prima del test")
+    p.add_argument("--database", default="moviesdb")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument("--out", help="salva il risultato in JSON")
+    p.add_argument("--baseline", help="JSON di un run precedente da confrontare")
+    p.add_argument("--tolerance", type=float, default=0.15, help="scostamento ammesso (0.15 = 15%%)")
+    args = p.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    _print(result)
+    if args.out:
+        results.save(args.out, result)
+
+    if args.baseline:
+        lines, regressions = results.compare(results.load(args.baseline), result, args.tolerance)
+        print("\n".join(["", f"vs baseline {args.baseline}:"] + lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
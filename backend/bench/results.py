@@ -0,0 +1,67 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+# -------- statistiche --------------------------------------------------------
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    # nearest-rank, come la maggior parte degli strumenti di load test
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies: List[float], errors: int, statuses: Dict[int, int], elapsed: float) -> Dict[str, Any]:
+    """latencies in secondi (solo richieste completate con successo)."""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": len(values) + errors,
+        "ok": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+# -------- salvataggio e confronto --------------------------------------------
+
+def save(path: str, result: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> Tuple[List[str], List[str]]:
+    """(righe del confronto, regressioni). Regressione: throughput sotto
+    baseline*(1-tolerance) oppure p95/p99 sopra baseline*(1+tolerance)."""
+    lines: List[str] = []
+    regressions: List[str] = []
+    for name, cur in sorted(current["endpoints"].items()):
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            lines.append(f"{name:<16} (not in baseline)")
+            continue
+        for metric, higher_is_better in (("throughput_rps", True), ("p50_ms", False),
+                                         ("p95_ms", False), ("p99_ms", False)):
+            b, c = base[metric], cur[metric]
+            delta = (c - b) / b if b else 0.0
+            worse = delta < -tolerance if higher_is_better else delta > tolerance
+            # il p50 è riportato ma non fa fallire: troppo rumoroso sotto carico
+            flag = ""
+            if worse and metric != "p50_ms":
+                flag = "  REGRESSION"
+                regressions.append(f"{name} {metric}: {b} -> {c} ({delta:+.1%})")
+            lines.append(f"{name:<16} {metric:<15} {b:>10} -> {c:>10} ({delta:+.1%}){flag}")
+    return lines, regressions
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import pytest
+
+
+def pytest_configure(config):
+    # prima di importare app: config legge l'ambiente all'import. Lanciato da
+    # backend/, pytest carica questo conftest (tests/ è una cartella test*)
+    # anche per i benchmark: lì l'ambiente non si tocca
+    if config.inipath is None or str(config.inipath.parent) != os.path.dirname(os.path.abspath(__file__)):
+        return
+    os.environ["DB_ENGINE"] = "sqlite"
+    os.environ["SQLITE_DIR"] = tempfile.mkdtemp(prefix="sqlbench-tests-")
+    os.environ["SQL_CACHE_MAX_ENTRIES"] = "0"
+
+
+@pytest.fixture(scope="session")
+def movies():
+    """moviesdb da sqlite_init.sql con i film T0 ... T9."""
+    from app.logic.add import add_lines
+    results = add_lines([f"T{i},Regista {i % 3},40,{2000 + i},Dramma,Netflix," for i in range(10)], 0)
+    assert all(r["status"] == "ok" for r in results)
+    return [f"T{i}" for i in range(10)]
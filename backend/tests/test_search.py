@@ -0,0 +1,88 @@
+from app.logic.search import sqlsearch, sqlsearch_stream
+from app.models import SqlRequest
+
+
+def _titles(response):
+    return [next(p.property_value for p in item.properties if p.property_name == "titolo")
+            for item in response.results]
+
+
+def _pages(sql, limit):
+    titles, cursor = [], None
+    for _ in range(20):
+        response = sqlsearch(SqlRequest(sql_query=sql, database_name="moviesdb", limit=limit, cursor=cursor))
+        assert response.sql_validation == "valid"
+        titles.extend(_titles(response))
+        cursor = response.next_cursor
+        if cursor is None:
+            return titles
+    raise AssertionError(f"pagination never ends: {titles}")
+
+
+def test_pages_query_ending_in_comment(movies):
+    # il commento finale non deve mangiarsi LIMIT/OFFSET della paginazione
+    for sql in ("SELECT titolo FROM movies ORDER BY idF -- x",
+                "SELECT titolo FROM movies ORDER BY idF # x",
+                "SELECT titolo FROM movies ORDER BY idF; -- x",
+                "SELECT titolo FROM movies ORDER BY idF LIMIT 7 -- x"):
+        expected = movies[:7] if "LIMIT 7" in sql else movies
+        assert _pages(sql, 3) == expected, sql
+
+
+def test_stream_pages_query_ending_in_comment(movies):
+    import json
+    titles, cursor = [], None
+    for _ in range(20):
+        request = SqlRequest(sql_query="SELECT titolo FROM movies ORDER BY idF -- x",
+                             database_name="moviesdb", limit=4, cursor=cursor)
+        lines = [json.loads(line) for line in sqlsearch_stream(request)]
+        titles.extend(p["property_value"] for item in lines[1:-1]
+                      for p in item["properties"] if p["property_name"] == "titolo")
+        cursor = lines[-1]["next_cursor"]
+        if cursor is None:
+            break
+    assert titles == movies
+
+
+def test_default_limit_survives_trailing_comment(movies, monkeypatch):
+    from app import config
+    from app.logic.guard import analyze
+    from app.logic.search import _statement
+    monkeypatch.setattr(config, "SQL_DEFAULT_LIMIT", 3)
+    sql = "SELECT titolo FROM movies ORDER BY idF -- x"
+    assert _statement(analyze(sql), 3, 0).endswith("ORDER BY idF LIMIT 4 OFFSET 0")
+    response = sqlsearch(SqlRequest(sql_query=sql, database_name="moviesdb"))
+    assert _titles(response) == movies[:3] and response.next_cursor
+
+
+def test_pages_query_with_duplicate_column_names(movies, monkeypatch):
+    # MariaDB rifiuta la tabella derivata con due colonne idR: si pagina senza
+    from app.db import Error, get_connection
+    from app.logic import search
+
+    class DuplicateColumns:
+        def __init__(self, cur):
+            self._cur = cur
+
+        def execute(self, sql, *args):
+            if sql.startswith("SELECT * FROM ("):
+                raise Error("Duplicate column name 'idR'")
+            return self._cur.execute(sql, *args)
+
+        def __getattr__(self, name):
+            return getattr(self._cur, name)
+
+    class Connection:
+        def __init__(self, conn):
+            self._conn = conn
+            self.from_replica = False
+
+        def cursor(self, *args, **kwargs):
+            return DuplicateColumns(self._conn.cursor(*args, **kwargs))
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+    monkeypatch.setattr(search, "get_read_connection", lambda name: Connection(get_connection(name)))
+    sql = "SELECT m.titolo, m.idR, r.idR FROM movies m JOIN regista r ON r.idR = m.idR ORDER BY m.idF LIMIT 5"
+    assert _pages(sql, 2) == movies[:5]
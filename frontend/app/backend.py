@@ -0,0 +1,71 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+import httpx
+from fastapi import FastAPI, Request
+
+# -------- client condiviso verso il backend ----------------------------------
+# Un solo AsyncClient per tutta l'applicazione: le connessioni restano aperte
+# (keep-alive) e vengono riusate dalle richieste successive.
+
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "50"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_POOL_TIMEOUT = float(os.getenv("BACKEND_POOL_TIMEOUT", "10"))   # attesa di una connessione libera
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+            keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+        ),
+        # read/write di default; ogni chiamata può passare il proprio timeout
+        timeout=httpx.Timeout(20.0, connect=BACKEND_CONNECT_TIMEOUT, pool=BACKEND_POOL_TIMEOUT),
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.backend = _new_client()
+    app.state.single_flight = SingleFlight()
+    try:
+        yield
+    finally:
+        await app.state.backend.aclose()
+
+
+def get_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.backend
+
+# -------- coalescing ---------------------------------------------------------
+
+class SingleFlight:
+    """Le chiamate con la stessa chiave fatte mentre una è già in corso non
+    partono: attendono e condividono il risultato (o l'errore) della prima."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda f: self._done(key, f))
+        # shield: se un client si disconnette, la chiamata continua per gli altri
+        return await asyncio.shield(fut)
+
+    def _done(self, key: str, fut: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is fut:
+            del self._calls[key]
+        if not fut.cancelled():
+            fut.exception()   # evita "exception was never retrieved" se nessuno attende più
+
+
+def coalesce(request: Request, key: str, fn: Callable[[], Awaitable[Any]]) -> Awaitable[Any]:
+    return request.app.state.single_flight.do(key, fn)
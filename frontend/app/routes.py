@@ -1,15 +1,18 @@
 from fastapi import APIRouter, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 import httpx
 import os
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
+from .backend import get_client, coalesce
 
 
 router = APIRouter()
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# righe per pagina dei risultati SQL: le successive si caricano allo scroll
+UI_PAGE_SIZE = int(os.getenv("UI_PAGE_SIZE", "200"))
 templates = Jinja2Templates(directory=str((__file__[: __file__.rfind("/")] + "/templates")))
 
 def _normalize_results(res: Any) -> Tuple[List[str], List[Dict[str, Any]]]:
@@ -47,18 +50,44 @@ async def home(request: Request) -> HTMLResponse:
 
 @router.get("/health", response_class=HTMLResponse)
 async def health(request: Request) -> HTMLResponse:
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(f"{BACKEND_URL}/db_health")
-        data = resp.json()
+    client = get_client(request)
+
+    async def fetch() -> Any:
+        resp = await client.get(f"{BACKEND_URL}/db_health", timeout=10.0)
+        return resp.json()
+
+    # più caricamenti simultanei della pagina → una sola chiamata al backend
+    data = await coalesce(request, "db_health", fetch)
     return templates.TemplateResponse("health.html", {"request": request, "data": data})
 
 # === SCHEMA ===
+# ultimo frammento reso e il suo ETag: su 304 dal backend non si ri-renderizza
+_schema_page: Dict[str, Optional[str]] = {"etag": None, "html": None}
+
 @router.get("/schema", response_class=HTMLResponse)
 async def schema(request: Request) -> HTMLResponse:
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.get(f"{BACKEND_URL}/schema_summary")
-        rows = resp.json()
-    return templates.TemplateResponse("schema.html", {"request": request, "rows": rows})
+    client = get_client(request)
+
+    async def fetch() -> Tuple[Optional[str], Any]:
+        # con l'ETag dell'ultima versione il backend risponde 304 se non è cambiata
+        etag = _schema_page["etag"]
+        headers = {"If-None-Match": etag} if etag and _schema_page["html"] is not None else {}
+        resp = await client.get(f"{BACKEND_URL}/schema_summary", headers=headers, timeout=20.0)
+        if resp.status_code == 304:
+            return etag, None
+        return resp.headers.get("etag"), resp.json()
+
+    etag, rows = await coalesce(request, "schema_summary", fetch)
+    if rows is not None or etag != _schema_page["etag"]:
+        html = templates.get_template("schema.html").render({"request": request, "rows": rows})
+        _schema_page.update(etag=etag, html=html)
+    else:
+        html = _schema_page["html"]
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag else {}
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
 
 # === ADD/UPDATE ===
 @router.post("/add")
@@ -67,14 +96,14 @@ async def add_line(request: Request):
     data_line = form.get("data_line", "")
     if not data_line:
         return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.post(f"{BACKEND_URL}/add", json={"data_line": data_line})
-        if resp.status_code == 200:
-            return RedirectResponse(url="/schema", status_code=status.HTTP_302_FOUND)
-        else:
-            # show error on home
-            error = resp.json().get("detail", "Unknown error")
-            return templates.TemplateResponse("index.html", {"request": request, "error": error, "data_line": data_line})
+    client = get_client(request)
+    resp = await client.post(f"{BACKEND_URL}/add", json={"data_line": data_line}, timeout=20.0)
+    if resp.status_code == 200:
+        return RedirectResponse(url="/schema", status_code=status.HTTP_302_FOUND)
+    else:
+        # show error on home
+        error = resp.json().get("detail", "Unknown error")
+        return templates.TemplateResponse("index.html", {"request": request, "error": error, "data_line": data_line})
 
 # === ADD/UPDATE : ritorna JSON con esito ===
 @router.post("/ui/add", response_class=JSONResponse)
@@ -89,12 +118,12 @@ async def add_line_modal(request: Request) -> JSONResponse:
         return JSONResponse({"ok": False, "error": "data_line is missing"}, status_code=400)
 
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/add",
-                json={"data_line": data_line},
-                headers={"Accept": "application/json"},
-            )
+        resp = await get_client(request).post(
+            f"{BACKEND_URL}/add",
+            json={"data_line": data_line},
+            headers={"Accept": "application/json"},
+            timeout=20.0,
+        )
     except httpx.RequestError as e:
         return JSONResponse({"ok": False, "error": f"Backend error: {e}"}, status_code=502)
 
@@ -109,35 +138,48 @@ async def add_line_modal(request: Request) -> JSONResponse:
     return JSONResponse({"ok": False, "error": detail or f"Backend {resp.status_code}"}, status_code=422)
 
 # === SQL diretto: ritorna un frammento HTML da appendere al feed ===
+# Si chiede al backend una pagina alla volta (formato colonnare): la prima
+# arriva dentro la bubble, le successive (con il cursor) come sole righe da
+# appendere alla tabella. In memoria c'è sempre al più una pagina.
 @router.post("/ui/sql", response_class=HTMLResponse)
 async def ui_sql(request: Request) -> HTMLResponse:
     form = await request.form()
     sql_query = form.get("sql_query", "").strip()
+    database_name = form.get("database_name", "").strip()
+    cursor = form.get("cursor", "").strip() or None
     if not sql_query:
         return HTMLResponse("<div class='bubble'><span class='badge invalid'>Errore</span> SQL mancante.</div>", status_code=400)
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(f"{BACKEND_URL}/sql_search", json={"sql_query": sql_query})
-        data = resp.json()
+    payload: Dict[str, Any] = {"sql_query": sql_query, "limit": UI_PAGE_SIZE, "response_format": "columnar"}
+    if database_name:
+        payload["database_name"] = database_name
+    if cursor:
+        payload["cursor"] = cursor
+    resp = await get_client(request).post(f"{BACKEND_URL}/sql_search", json=payload, timeout=60.0)
+    data = resp.json()
 
     sql_validation = data.get("sql_validation")
-    results = data.get("results")
+    results = data.get("rows")
 
     columns, rows = ([], [])
     if sql_validation == "valid" and results is not None:
-        columns, rows = _normalize_results(results)
-
-    return templates.TemplateResponse(
-        "_result_row.html",
-        {
-            "request": request,
-            "mode": "SQL",
-            "when": datetime.now().strftime("%H:%M"),
-            "sql": sql_query,
-            "sql_validation": sql_validation,
-            "columns": columns,
-            "rows": rows,
-            # "kv_blocks": kv_blocks,   
-        },
-)
+        columns, rows = _normalize_results({"columns": data.get("columns"), "rows": results})
+
+    context = {
+        "request": request,
+        "mode": "SQL",
+        "when": datetime.now().strftime("%H:%M"),
+        "sql": sql_query,
+        "database_name": database_name,
+        "sql_validation": sql_validation,
+        "columns": columns,
+        "rows": rows,
+        "next_cursor": data.get("next_cursor"),
+    }
+    if cursor:
+        # pagina successiva: solo le righe (e la riga "more" se ce ne sono altre)
+        if sql_validation != "valid":
+            return HTMLResponse("", status_code=422)
+        return templates.TemplateResponse("_rows.html", context)
+    return templates.TemplateResponse("_result_row.html", context)
 
@@ -41,3 +41,22 @@ CREATE INDEX idx_movies_anno ON movies(anno);
 CREATE INDEX idx_regista_eta ON regista(eta);
 CREATE INDEX idx_dv_p1 ON dove_vederlo(idP1);
 CREATE INDEX idx_dv_p2 ON dove_vederlo(idP2);
+
+-- Catalogo denormalizzato (un film per riga, regista e piattaforme risolti):
+-- aggiornato da add_line con FILM_CATALOG=1, vedi app/logic/catalog.py
+CREATE TABLE IF NOT EXISTS film_catalog (
+  idF INT PRIMARY KEY,
+  titolo VARCHAR(255) NOT NULL,
+  anno INT NOT NULL,
+  genere VARCHAR(100) NOT NULL,
+  idR INT NOT NULL,
+  regista VARCHAR(255) NOT NULL,
+  eta INT NOT NULL,
+  piattaforma1 VARCHAR(100) NULL,
+  piattaforma2 VARCHAR(100) NULL,
+  CONSTRAINT fk_fc_film FOREIGN KEY (idF) REFERENCES movies(idF) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_fc_anno ON film_catalog(anno);
+CREATE INDEX idx_fc_genere ON film_catalog(genere);
+CREATE INDEX idx_fc_idR ON film_catalog(idR);